@@ -29,6 +29,7 @@ import errno
 from . import util
 from . import kimunits
 from . import kimobjects
+from . import sidecar
 from . import config as cf
 
 
@@ -412,10 +413,15 @@ class Computation:
                         "to property definition\n{}".format(msg)
                     )
 
-        with self.runner_temp.in_dir(), open(
-            _result_file_path, "w", encoding="utf-8"
-        ) as result_file:
-            util.dumpedn(result, result_file)
+        with self.runner_temp.in_dir():
+            # Values taken from the shell environment are strings
+            result = sidecar.store_arrays(
+                result,
+                cf.OUTPUT_DIR,  # pylint: disable=E1101
+                int(cf.RESULT_ARRAY_SIDECAR_THRESHOLD),  # pylint: disable=E1101
+            )
+            with open(_result_file_path, "w", encoding="utf-8") as result_file:
+                util.dumpedn(result, result_file)
 
         # Everything succeeded, clean up the kim-tools token
         # since it's only useful for non-pipeline operation
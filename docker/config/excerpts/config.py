@@ -335,6 +335,10 @@ class PipelineQueryError(Exception):
     """there was an error while attempting a remote query"""
 
 
+class PipelineHTTPError(Exception):
+    """If an HTTP request to a remote server fails, even after being retried"""
+
+
 class PipelineRecursionDepthExceeded(Exception):
     """attempted to take more than MAX_DEPENDENCY_RECURSION_DEPTH steps during upward dependency resolution"""
 
@@ -0,0 +1,302 @@
+"""
+Shared HTTP(S) client used to send queries to the remote query API and to
+download KIM Items from openkim.org.
+
+Rendering the pipeline.stdin.tpl file of a Test or running `kimitems search`
+can make hundreds of small requests to the same server, so rather than opening
+a new connection (and creating a new SSL context) for each of them, the client
+keeps connections alive and reuses them.  Responses are requested with gzip
+compression and decoded transparently.  Requests that fail because of a
+network error or a transient server error are retried a bounded number of
+times with exponential backoff, and every request is subject to a timeout.
+The latency of each request is recorded so that it can be reported.
+
+Copyright (c) 2014-2022, Regents of the University of Minnesota. All rights
+reserved.
+
+This software may be distributed as-is, without modification.
+"""
+
+import gzip
+import http.client
+import os
+import ssl
+import threading
+import time
+import urllib.parse
+from collections import deque
+
+from . import config as cf
+
+# Responses to retry, as they indicate that the server is temporarily unable to
+# handle the request
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+REDIRECT_STATUSES = {301, 302, 303, 307, 308}
+MAX_REDIRECTS = 5
+
+# Number of idle connections kept open per server
+MAX_IDLE_CONNECTIONS = 4
+
+DOWNLOAD_CHUNK_SIZE = 1 << 16
+
+
+class RequestMetrics:
+    """Counts and latencies of the requests made by an HTTPClient"""
+
+    def __init__(self, maxlen=1000):
+        self.requests = 0
+        self.retries = 0
+        self.failures = 0
+        self.bytes_received = 0
+        self.total_time = 0.0
+        self.latencies = deque(maxlen=maxlen)
+
+    def record(self, elapsed, nbytes):
+        self.requests += 1
+        self.bytes_received += nbytes
+        self.total_time += elapsed
+        self.latencies.append(elapsed)
+
+    def summary(self):
+        """
+        Return the number of requests, retries and failures, the number of bytes
+        received, and the mean, median, 95th percentile and maximum latency (in
+        seconds) of the most recent requests
+        """
+        latencies = sorted(self.latencies)
+        n = len(latencies)
+        return {
+            "requests": self.requests,
+            "retries": self.retries,
+            "failures": self.failures,
+            "bytes_received": self.bytes_received,
+            "mean": self.total_time / self.requests if self.requests else 0.0,
+            "median": latencies[n // 2] if n else 0.0,
+            "p95": latencies[min(int(0.95 * n), n - 1)] if n else 0.0,
+            "max": latencies[-1] if n else 0.0,
+        }
+
+
+class HTTPClient:
+    def __init__(self, timeout=60, retries=3, backoff=0.5, max_backoff=30.0):
+        """
+        Parameters
+        ----------
+        timeout : float
+            Number of seconds to wait for a server to respond before giving up
+            on an attempt
+        retries : int
+            Number of times a request is retried after a network error or a
+            transient server error
+        backoff : float
+            Number of seconds waited before the first retry, which is doubled
+            for each subsequent one
+        max_backoff : float
+            Maximum number of seconds waited between attempts
+        """
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.metrics = RequestMetrics()
+
+        self._lock = threading.Lock()
+        self._idle = {}
+        self._ssl_contexts = {}
+
+    def _ssl_context(self, verify):
+        with self._lock:
+            if verify not in self._ssl_contexts:
+                if verify:
+                    self._ssl_contexts[verify] = ssl.create_default_context()
+                else:
+                    self._ssl_contexts[verify] = ssl._create_unverified_context()
+            return self._ssl_contexts[verify]
+
+    def _connect(self, key, timeout):
+        """Return an idle connection to the server `key`, or a new one"""
+        with self._lock:
+            idle = self._idle.get(key)
+            if idle:
+                return idle.pop(), True
+
+        scheme, host, port, verify = key
+        if scheme == "https":
+            conn = http.client.HTTPSConnection(
+                host, port, timeout=timeout, context=self._ssl_context(verify)
+            )
+        else:
+            conn = http.client.HTTPConnection(host, port, timeout=timeout)
+        return conn, False
+
+    def _release(self, key, conn):
+        """Keep a connection whose response has been read for reuse"""
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < MAX_IDLE_CONNECTIONS:
+                idle.append(conn)
+                return
+        conn.close()
+
+    def close(self):
+        """Close all idle connections"""
+        with self._lock:
+            for idle in self._idle.values():
+                for conn in idle:
+                    conn.close()
+            self._idle.clear()
+
+    def _wait(self, attempt):
+        time.sleep(min(self.backoff * 2**attempt, self.max_backoff))
+
+    def request(
+        self,
+        method,
+        url,
+        body=None,
+        headers=None,
+        timeout=None,
+        verify=True,
+        retries=None,
+        on_retry=None,
+        output=None,
+    ):
+        """
+        Perform an HTTP request, following redirects, and return the body of
+        the response, or write it to the file object `output` if one is given.
+        If `verify` is False, the certificate of the server is not verified.
+        `timeout` and `retries` default to those of the client.  `on_retry` is
+        called with the exception that caused an attempt to fail before the
+        request is retried.  Raises cf.PipelineHTTPError if the request fails.
+        """
+        headers = dict(headers or {})
+        if output is None:
+            headers.setdefault("Accept-Encoding", "gzip")
+        timeout = self.timeout if timeout is None else timeout
+        retries = self.retries if retries is None else retries
+
+        attempt = 0
+        redirects = 0
+        while True:
+            parts = urllib.parse.urlsplit(url)
+            key = (parts.scheme, parts.hostname, parts.port, verify)
+            path = parts.path or "/"
+            if parts.query:
+                path += "?" + parts.query
+
+            conn, reused = self._connect(key, timeout)
+            start = time.time()
+            try:
+                conn.request(method, path, body, headers)
+                response = conn.getresponse()
+                status = response.status
+
+                if status == 200 and output is not None:
+                    nbytes = 0
+                    while True:
+                        chunk = response.read(DOWNLOAD_CHUNK_SIZE)
+                        if not chunk:
+                            break
+                        output.write(chunk)
+                        nbytes += len(chunk)
+                    data = None
+                else:
+                    data = response.read()
+                    nbytes = len(data)
+
+            except (OSError, http.client.HTTPException) as e:
+                conn.close()
+                if output is not None and output.tell():
+                    # Start over rather than appending to a partial download
+                    output.seek(0)
+                    output.truncate()
+
+                # The server may have closed an idle connection in the meantime,
+                # which does not count as a failed attempt
+                if reused:
+                    continue
+
+                error = e
+
+            else:
+                if response.will_close:
+                    conn.close()
+                else:
+                    self._release(key, conn)
+
+                self.metrics.record(time.time() - start, nbytes)
+
+                if status in REDIRECT_STATUSES and redirects < MAX_REDIRECTS:
+                    redirects += 1
+                    url = urllib.parse.urljoin(url, response.getheader("Location"))
+                    if status == 303:
+                        method, body = "GET", None
+                    continue
+
+                if status == 200:
+                    if data is not None and (
+                        response.getheader("Content-Encoding") == "gzip"
+                    ):
+                        data = gzip.decompress(data)
+                    return data
+
+                error = cf.PipelineHTTPError(
+                    "{} {} returned HTTP status {} {}".format(
+                        method, url, status, response.reason
+                    )
+                )
+                if status not in RETRY_STATUSES:
+                    self.metrics.failures += 1
+                    raise error
+
+            if attempt >= retries:
+                self.metrics.failures += 1
+                if isinstance(error, cf.PipelineHTTPError):
+                    raise error
+                raise cf.PipelineHTTPError(
+                    "{} {} failed after {} attempts: {!r}".format(
+                        method, url, attempt + 1, error
+                    )
+                ) from error
+
+            if on_retry is not None:
+                on_retry(error)
+            self.metrics.retries += 1
+            self._wait(attempt)
+            attempt += 1
+
+    def post(self, url, data, headers=None, **kwargs):
+        """POST `data` (str or bytes) to `url` and return the body of the response"""
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        return self.request("POST", url, data, headers, **kwargs)
+
+    def download(self, url, path, **kwargs):
+        """
+        Download `url` to the file `path`, which is only created once the
+        download has succeeded
+        """
+        tmppath = path + ".part"
+        try:
+            with open(tmppath, "wb") as f:
+                self.request("GET", url, output=f, **kwargs)
+            os.replace(tmppath, path)
+        finally:
+            if os.path.exists(tmppath):
+                os.remove(tmppath)
+        return path
+
+
+_client = None
+
+
+def get_client():
+    """Return the HTTP client shared by everything in this process"""
+    global _client
+    if _client is None:
+        # Values taken from the shell environment are strings
+        _client = HTTPClient(
+            timeout=float(cf.PIPELINE_HTTP_TIMEOUT),
+            retries=int(cf.PIPELINE_HTTP_RETRIES),
+        )
+    return _client
@@ -5,66 +5,89 @@ reserved.
 This software may be distributed as-is, without modification.
 """
 
-import urllib.request, urllib.error, urllib.parse
+import time
+import urllib.parse
 from . import config as cf
 import json
-import ssl
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from copy import deepcopy
 
+from .httpclient import get_client
 from .query_local import queryapi
 
 
-def stringify_dict(query):
-    output = {}
-    for k, v in list(query.items()):
-        output[k] = json.dumps(v)
-    return output
+def open_url(url, data, header, use_SSL=False, timeout=None):
+    """
+    POST `data` to `url` over a kept-alive connection of the shared HTTP client,
+    which retries failed requests (see httpclient.py), and return the response
+    """
+    return get_client().post(url, data, header, timeout=timeout, verify=use_SSL)
 
 
-def open_url(url, data, header, use_SSL=False, timeout=None):
-    request = urllib.request.Request(url, data.encode("utf-8"), header)
+def use_mirror():
+    """
+    Whether queries of the remote database are answered from its offline mirror
+    (see mirror.py) rather than sent to the remote query API
+    """
+    return cf.PIPELINE_QUERY_MODE == "mirror"
 
-    if use_SSL:
-        response = urllib.request.urlopen(request, timeout=timeout)
-    else:
-        context = ssl._create_unverified_context()
-        response = urllib.request.urlopen(request, context=context, timeout=timeout)
 
-    answer = response.read()
-    response.close()
+def remote_query(query):
+    """Send `query` to the remote query API and return the JSON it answers with"""
+    url = cf.PIPELINE_REMOTE_QUERY_ADDRESS
+    use_SSL = True
+
+    header = {"Content-type": "application/x-www-form-urlencoded"}
+
+    data = urllib.parse.urlencode(
+        dict((key, json.dumps(val)) for (key, val) in list(query.items()))
+    )
+
+    answer = open_url(url, data, header, use_SSL)
+
+    if not answer:
+        raise cf.PipelineQueryError("No response")
+    elif isinstance(answer, bytes):
+        answer = answer.decode("utf-8")
+
+    # We got back JSON, let's check if we got errors back
+    check = json.loads(answer)
+    if isinstance(check, dict) and check.get("error"):
+        raise cf.PipelineQueryError("{}".format(check["error"]))
+
     return answer
 
 
 def query_mongo(query, local=False, decode=False):
+    from bson.json_util import dumps
 
     if local:
-        from .mongodb import db
-        from bson.json_util import dumps
+        from .mongodb import db, data_generation
 
-        # Cast each val in query dict to str
-        query = stringify_dict(query)
-        answer = dumps(queryapi.api_v0(db, query))
+        # Pick up changes made to the local database by other processes
+        data_generation()
 
-    else:
-        url = cf.PIPELINE_REMOTE_QUERY_ADDRESS
-        use_SSL = True
+        # Query the local database in-process without encoding the query to JSON
+        answer = queryapi.api_v0_native(db, query)
+        if decode:
+            return answer
 
-        header = {"Content-type": "application/x-www-form-urlencoded"}
+        answer = dumps(answer)
 
-        data = urllib.parse.urlencode(
-            dict((key, json.dumps(val)) for (key, val) in list(query.items()))
-        )
+    elif use_mirror():
+        from . import mirror
 
-        answer = open_url(url, data, header, use_SSL)
+        # Answer from the mirror exactly as the remote query API would, i.e. with
+        # the same JSON encoding of the documents and errors
+        answer = queryapi.api_v0_native(mirror.get_db(), query)
+        if isinstance(answer, dict) and answer.get("error"):
+            raise cf.PipelineQueryError("{}".format(answer["error"]))
 
-        if not answer:
-            raise cf.PipelineQueryError("No response")
-        elif isinstance(answer, bytes):
-            answer = answer.decode("utf-8")
+        answer = dumps(answer)
 
-        # We got back JSON, let's check if we got errors back
-        check = json.loads(answer)
-        if isinstance(check, dict) and check.get("error"):
-            raise cf.PipelineQueryError("{}".format(check["error"]))
+    else:
+        answer = remote_query(query)
 
     if decode:
         return json.loads(answer)
@@ -72,22 +95,55 @@ def query_mongo(query, local=False, decode=False):
     return answer
 
 
-def get_test_result(test, model, prop, keys, units, local=False, decode=False):
+def _as_list(arg):
+    """
+    Simplified query arguments may be given either as lists or as strings
+    containing JSON-encoded lists (as they are sent to the remote query API)
+    """
+    if isinstance(arg, str):
+        try:
+            decoded = json.loads(arg)
+        except ValueError:
+            return [arg]
+        return decoded if isinstance(decoded, list) else [decoded]
+    return arg
+
+
+def _local_simplified_query(name, args, decode, batch=False, mirror=False):
+    """
+    Perform a simplified query in-process, against the local database or, if
+    `mirror` is set, the mirror of the remote database
+    """
+    if mirror:
+        from .mirror import get_db
+
+        db = get_db()
+    else:
+        from .mongodb import db, data_generation
+
+        # Pick up changes made to the local database by other processes
+        data_generation()
 
-    url = cf.PIPELINE_REMOTE_QUERY_ADDRESS + "/get_test_result"
+    try:
+        if batch:
+            answer = queryapi.batch_simplified_query(db, name, **args)
+        else:
+            answer = getattr(queryapi, name)(db, **args)
+    except Exception as e:
+        raise cf.PipelineQueryError("Error received: {}".format(e))
+
+    if decode:
+        return answer
+    return json.dumps(answer)
+
+
+def _remote_simplified_query(name, data, decode):
+    url = cf.PIPELINE_REMOTE_QUERY_ADDRESS + "/" + name
     use_SSL = True
 
     header = {"Content-type": "application/x-www-form-urlencoded"}
 
-    d = {}
-    d["test"] = test
-    d["model"] = model
-    d["prop"] = prop
-    d["keys"] = json.dumps(keys)
-    d["units"] = json.dumps(units)
-    data = urllib.parse.urlencode(d)
-
-    answer = open_url(url, data, header, use_SSL)
+    answer = open_url(url, urllib.parse.urlencode(data), header, use_SSL)
 
     if not answer:
         raise cf.PipelineQueryError("No response")
@@ -102,4 +158,254 @@ def get_test_result(test, model, prop, keys, units, local=False, decode=False):
     return answer
 
 
+def get_test_result(test, model, prop, keys, units, local=None, decode=False):
+    """
+    Retrieve the values of `keys` (converted to `units`) from the Test Result of
+    `test` and `model` reporting property `prop`.  If `local` is None, the local
+    database is queried if it is selected (PIPELINE_LOCAL_DEV) and the remote
+    OpenKIM database (or its mirror, if PIPELINE_QUERY_MODE=mirror) otherwise.
+    """
+    if local is None:
+        local = cf.PIPELINE_LOCAL_DEV
+
+    if local or use_mirror():
+        args = {
+            "test": _as_list(test),
+            "model": _as_list(model),
+            "prop": _as_list(prop),
+            "keys": keys,
+            "units": units,
+        }
+        answer = _local_simplified_query(
+            "get_test_result", args, decode=True, mirror=not local
+        )
+
+        # Like the remote query API, return the values themselves if only a
+        # single Test Result matched
+        if len(answer) == 1:
+            answer = answer[0]
+
+        if decode:
+            return answer
+        return json.dumps(answer)
+
+    d = {}
+    d["test"] = test
+    d["model"] = model
+    d["prop"] = prop
+    d["keys"] = json.dumps(keys)
+    d["units"] = json.dumps(units)
+
+    return _remote_simplified_query("get_test_result", d, decode)
+
+
+def get_reference_data(ref_data, species, prop, keys, units, local=None, decode=False):
+    """
+    Retrieve the values of `keys` (converted to `units`) from the Reference Data
+    reporting property `prop` for `species`.  `local` behaves as it does for
+    get_test_result().
+    """
+    if local is None:
+        local = cf.PIPELINE_LOCAL_DEV
+
+    if local or use_mirror():
+        args = {
+            "ref_data": ref_data,
+            "species": species,
+            "prop": prop,
+            "keys": keys,
+            "units": units,
+        }
+        return _local_simplified_query(
+            "get_reference_data", args, decode, mirror=not local
+        )
+
+    d = {}
+    d["ref_data"] = json.dumps(ref_data)
+    d["species"] = json.dumps(species)
+    d["prop"] = json.dumps(prop)
+    d["keys"] = json.dumps(keys)
+    d["units"] = json.dumps(units)
+
+    return _remote_simplified_query("get_reference_data", d, decode)
+
+
+def simplified_query(name, local=None, decode=False, **kwargs):
+    """
+    Perform one of the simplified queries, e.g.
+
+        simplified_query("get_lattice_constant_cubic", model=["MO_123629422045_005"],
+                         crystal=["fcc"], species=["Al"], units=["angstrom"])
+
+    where each keyword argument is a list, as described in the documentation of
+    the corresponding function of query_local/queryapi.py.  `local` behaves as
+    it does for get_test_result().
+    """
+    if not name.startswith("get_") or not hasattr(queryapi, name):
+        raise cf.PipelineQueryError("Unknown simplified query {}".format(name))
+
+    if local is None:
+        local = cf.PIPELINE_LOCAL_DEV
+
+    if local or use_mirror():
+        args = {key: _as_list(val) for key, val in kwargs.items()}
+        return _local_simplified_query(name, args, decode, mirror=not local)
+
+    d = {key: json.dumps(_as_list(val)) for key, val in kwargs.items()}
+
+    return _remote_simplified_query(name, d, decode)
+
+
+def simplified_query_batch(name, model, local=None, decode=False, **kwargs):
+    """
+    Perform one of the simplified queries for each of the models in the list
+    `model`, returning a dict mapping each model to the result for it, e.g.
+
+        simplified_query_batch("get_lattice_constant_cubic",
+                               ["MO_123629422045_005", "MO_958932894036"],
+                               crystal=["fcc"], species=["Al"], units=["angstrom"])
+
+    The local database is queried once for all of the models, whereas the remote
+    query API, which has no batched queries, is queried once per model.
+    """
+    if not name.startswith("get_") or not hasattr(queryapi, name):
+        raise cf.PipelineQueryError("Unknown simplified query {}".format(name))
+
+    if local is None:
+        local = cf.PIPELINE_LOCAL_DEV
+
+    if local or use_mirror():
+        args = {key: _as_list(val) for key, val in kwargs.items()}
+        args["model"] = _as_list(model)
+        return _local_simplified_query(name, args, decode, batch=True, mirror=not local)
+
+    answer = {
+        m: simplified_query(name, local=False, decode=True, model=[m], **kwargs)
+        for m in _as_list(model)
+    }
+    if decode:
+        return answer
+    return json.dumps(answer)
+
+
 query = query_mongo
+
+
+class QueryCache:
+    """
+    Cache of the results of queries performed from pipeline.stdin.tpl files, so
+    that the many identical queries issued when running a set of Tests (e.g. for
+    the lattice constant of the same Model) are only carried out once.  Results
+    are keyed on the query function, the database queried (local or remote),
+    and the canonicalized arguments of the query.  Results from the local
+    database are discarded once its contents change, whether by this process
+    or another one (see mongodb.data_generation), and results from the remote
+    database once they are older than `ttl` seconds.  At most `maxsize`
+    results are kept, with the least recently used ones evicted first.
+    """
+
+    def __init__(self, maxsize=1024, ttl=3600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.results = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def _key(self, func, args, kwargs, local):
+        key = (
+            func.__name__,
+            bool(local),
+            json.dumps([args, kwargs], sort_keys=True, default=str),
+        )
+
+        if local:
+            from . import mongodb
+
+            generation = mongodb.data_generation()
+        else:
+            generation = None
+
+        return key, generation
+
+    def _get(self, key, generation):
+        entry = self.results.get(key)
+        if entry is None:
+            return None
+        if entry[0] != generation or (
+            generation is None and time.time() - entry[2] > self.ttl
+        ):
+            del self.results[key]
+            return None
+        self.results.move_to_end(key)
+        return entry
+
+    def _store(self, key, generation, answer):
+        self.results[key] = (generation, deepcopy(answer), time.time())
+        self.results.move_to_end(key)
+        if len(self.results) > self.maxsize:
+            self.results.popitem(last=False)
+
+    def call(self, func, *args, local=False, **kwargs):
+        """Return func(*args, local=local, **kwargs), using a cached result if possible"""
+        if local is None:
+            local = cf.PIPELINE_LOCAL_DEV
+
+        key, generation = self._key(func, args, kwargs, local)
+        entry = self._get(key, generation)
+        if entry is not None:
+            self.hits += 1
+            # Callers are free to modify what they get back
+            return deepcopy(entry[1])
+
+        self.misses += 1
+        answer = func(*args, local=local, **kwargs)
+        self._store(key, generation, answer)
+
+        return answer
+
+    def prefetch(self, calls, local=False, max_workers=8):
+        """
+        Perform the calls, given as (func, args, kwargs) tuples, whose results
+        are not already cached with up to `max_workers` of them at a time, and
+        cache their results so that subsequent identical calls are answered
+        from the cache.  Calls that fail are not cached, so that their errors
+        are raised when they are made again.  Returns the number of calls
+        performed.
+        """
+        if local is None:
+            local = cf.PIPELINE_LOCAL_DEV
+
+        pending = OrderedDict()
+        for func, args, kwargs in calls:
+            key, generation = self._key(func, args, kwargs, local)
+            if key not in pending and self._get(key, generation) is None:
+                pending[key] = (generation, func, args, kwargs)
+        if not pending:
+            return 0
+
+        def perform(call):
+            generation, func, args, kwargs = call
+            try:
+                return func(*args, local=local, **kwargs), None
+            except Exception as e:
+                return None, e
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            answers = list(executor.map(perform, pending.values()))
+
+        # The results are only cached from this thread
+        for (key, (generation, _, _, _)), (answer, error) in zip(
+            pending.items(), answers
+        ):
+            if error is None:
+                self.misses += 1
+                self._store(key, generation, answer)
+
+        return len(pending)
+
+    def clear(self):
+        self.results.clear()
+
+
+# Values taken from the shell environment are strings
+query_cache = QueryCache(ttl=float(cf.QUERY_CACHE_TTL))
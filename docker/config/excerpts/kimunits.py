@@ -1,6 +1,13 @@
 """
 Simple wrapper for executable for converting arbitrary units to SI units
 
+Conversions are evaluated in-process from the database of the units program
+(see unitsdb.py) whenever possible, and by running the program otherwise.  The
+first use of each in-process conversion is checked against the program, and
+conversions on which they disagree are left to the program.
+Lists of values are converted at once by applying the affine map of the
+conversion, whose factors are cached on disk (see FactorCache).
+
 Copyright (c) 2014-2022, Regents of the University of Minnesota. All rights
 reserved.
 
@@ -10,12 +17,28 @@ This software may be distributed as-is, without modification.
 VERSION = 0.3
 
 import re
+import os
+import json
 import math
+import select
+import shutil
 import subprocess
+import threading
 import warnings
+from concurrent.futures import ThreadPoolExecutor
+
+from . import config as cf
+from . import unitsdb
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 warnings.simplefilter("ignore")
 
+TEMPERATURE_FUNCTION_UNITS = ["degC", "tempC", "degF", "tempF"]
+
 
 class UnitConversion(Exception):
     """Class for unit conversion errors"""
@@ -57,47 +80,473 @@ def islinear(unit, to_unit=None):
 
 def convert_units(from_value, from_unit, wanted_unit=None, suppress_unit=False):
     """Works with 'units' utility"""
-    from_sign = from_value < 0
-    from_value = str(abs(from_value))
     from_unit = str(from_unit)
 
-    TEMPERATURE_FUNCTION_UNITS = ["degC", "tempC", "degF", "tempF"]
+    try:
+        conversion, unit = in_process_converter(from_unit, wanted_unit)
+        out = (conversion(from_value), unit)
+    except unitsdb.UnsupportedConversion:
+        out = _run_units(from_value, from_unit, wanted_unit)
 
-    if from_unit in TEMPERATURE_FUNCTION_UNITS:
-        args = [
-            "units",
-            "-o",
-            "%1.15e",
-            "-qt1",
-            "".join((from_unit, "(", from_value, ")")),
-        ]
+    if suppress_unit:
+        return out[0]
+    return out
+
+
+# Number of idle 'units' processes kept running
+UNITS_POOL_SIZE = 4
+
+# Number of threads converting quantities that need the 'units' utility
+MAX_CONVERSION_THREADS = UNITS_POOL_SIZE
+
+# Number of conversions written to a 'units' process before reading its answers,
+# small enough for neither of the pipes to fill up
+UNITS_PIPELINE_DEPTH = 64
+
+# Seconds to wait for an answer of the 'units' utility
+UNITS_TIMEOUT = 30
 
+
+class UnitsTimeout(UnitConversion):
+    """The 'units' utility did not answer in time"""
+
+
+def _units_error(from_value, from_unit, wanted_unit, output):
+    tag = wanted_unit if wanted_unit else "SI"
+    return UnitConversion(
+        "Error in unit conversion of {} {} to {}: {}".format(
+            from_value, from_unit, tag, output.strip() or "no output"
+        )
+    )
+
+
+def run_units_once(from_value, from_unit, wanted_unit=None):
+    """
+    Convert a value by running the 'units' utility once, returning a
+    (value, unit) pair
+    """
+    from_unit = str(from_unit)
+    if from_unit in TEMPERATURE_FUNCTION_UNITS:
+        from_sign = False
+        have = "{}({})".format(from_unit, from_value)
     else:
-        args = ["units", "-o", "%1.15e", "-qt1", " ".join((from_value, from_unit))]
+        # A leading minus sign would be taken for an option
+        from_sign = from_value < 0
+        have = "{} {}".format(abs(from_value), from_unit)
 
+    args = ["units", "-o", "%1.15e", "-qt1", have]
     if wanted_unit:
         args.append(wanted_unit)
 
     try:
-        output = subprocess.check_output(args).decode("utf-8")
-    except subprocess.CalledProcessError:
-        tag = wanted_unit if wanted_unit else "SI"
-        raise UnitConversion(
-            "Error in unit conversion of {} {} to {}".format(from_value, from_unit, tag)
-        )
+        output = subprocess.check_output(
+            args, stderr=subprocess.STDOUT, timeout=UNITS_TIMEOUT
+        ).decode("utf-8")
+    except subprocess.CalledProcessError as e:
+        raise _units_error(
+            from_value, from_unit, wanted_unit, e.output.decode("utf-8", "replace")
+        ) from e
+    except subprocess.TimeoutExpired as e:
+        raise UnitsTimeout(
+            "Timed out converting {} {} with the units utility".format(
+                from_value, from_unit
+            )
+        ) from e
 
-    matches = _units_output_expression.match(output).groupdict(None)
-    out = ((-1) ** from_sign * float(matches["value"]), matches["unit"] or wanted_unit)
+    matches = _units_output_expression.match(output.strip())
+    if not matches:
+        raise _units_error(from_value, from_unit, wanted_unit, output)
+    return (
+        (-1) ** from_sign * float(matches["value"]),
+        matches["unit"] or wanted_unit,
+    )
 
-    if suppress_unit:
-        return out[0]
-    return out
+
+class UnitsProcess:
+    """
+    A 'units' utility running in interactive mode, which answers each pair of
+    'You have' and 'You want' lines written to it with a line of output.  This
+    replaces starting a new process for every conversion by a round trip through
+    its pipes.  After an error, the program is left waiting for a different
+    line than the one we would write next, so the process should be closed.
+    The program only writes each answer as soon as it is computed if it is run
+    through 'stdbuf', see UnitsPool.
+    """
+
+    def __init__(self):
+        # Make sure units writes each answer as soon as it is computed rather
+        # than when its output buffer is full
+        self.process = subprocess.Popen(
+            [shutil.which("stdbuf"), "-o0", "units", "-o", "%1.15e", "-qt1"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            bufsize=0,
+        )
+        self.buffer = b""
+
+    def readline(self):
+        """
+        Return the next line of output of the process, raising UnitsTimeout if
+        it is not complete after UNITS_TIMEOUT seconds.  The pipe is read directly
+        rather than through a buffered file, so that select sees all of the
+        output that was not returned yet.
+        """
+        fd = self.process.stdout.fileno()
+        while b"\n" not in self.buffer:
+            ready, _, _ = select.select([fd], [], [], UNITS_TIMEOUT)
+            if not ready:
+                raise UnitsTimeout("The units utility did not answer in time")
+            data = os.read(fd, 65536)
+            if not data:
+                # End of file, return what is left
+                break
+            self.buffer += data
+        line, _, self.buffer = self.buffer.partition(b"\n")
+        return line.decode("utf-8", "replace")
+
+    def convert(self, values, from_unit, wanted_unit=None):
+        """
+        Convert each of `values` in `from_unit` to `wanted_unit` (SI units if it
+        is None) and return a list of (value, unit) pairs
+        """
+        results = []
+        for start in range(0, len(values), UNITS_PIPELINE_DEPTH):
+            chunk = values[start : start + UNITS_PIPELINE_DEPTH]
+            lines = []
+            for value in chunk:
+                if from_unit in TEMPERATURE_FUNCTION_UNITS:
+                    have = "{}({})".format(from_unit, value)
+                else:
+                    have = "{} {}".format(value, from_unit)
+                lines.append("{}\n{}\n".format(have, wanted_unit or ""))
+            self.process.stdin.write("".join(lines).encode("utf-8"))
+
+            for value in chunk:
+                output = self.readline()
+                matches = _units_output_expression.match(output.strip())
+                if not matches:
+                    raise _units_error(value, from_unit, wanted_unit, output)
+                results.append(
+                    (float(matches["value"]), matches["unit"] or wanted_unit)
+                )
+        return results
+
+    def close(self):
+        try:
+            self.process.stdin.close()
+        except OSError:
+            pass
+        self.process.kill()
+        self.process.wait()
+
+
+class UnitsPool:
+    """
+    Pool of UnitsProcess instances shared by the threads of a process.  A
+    process that fails to convert a value is closed, so that it is replaced by
+    a new one the next time a process is needed.
+
+    Without 'stdbuf', the answers of an interactive 'units' may never reach the
+    pipe, so each value is then converted by running the utility once (see
+    run_units_once).  The pool also switches to these one-shot runs for good
+    the first time a process does not answer in time.
+    """
+
+    def __init__(self, size=UNITS_POOL_SIZE):
+        self.size = size
+        self.idle = []
+        self.lock = threading.Lock()
+        self.interactive = None
+
+    def _use_processes(self):
+        if self.interactive is None:
+            self.interactive = shutil.which("stdbuf") is not None
+        return self.interactive
+
+    def convert(self, values, from_unit, wanted_unit=None):
+        """See UnitsProcess.convert"""
+        if not self._use_processes():
+            return [run_units_once(v, from_unit, wanted_unit) for v in values]
+
+        with self.lock:
+            process = self.idle.pop() if self.idle else None
+        if process is None:
+            process = UnitsProcess()
+
+        try:
+            results = process.convert(values, from_unit, wanted_unit)
+        except UnitsTimeout:
+            process.close()
+            self.interactive = False
+            self.close()
+            return [run_units_once(v, from_unit, wanted_unit) for v in values]
+        except BaseException:
+            process.close()
+            raise
+
+        with self.lock:
+            if len(self.idle) < self.size:
+                self.idle.append(process)
+                return results
+        process.close()
+        return results
+
+    def close(self):
+        """Close all idle processes"""
+        with self.lock:
+            for process in self.idle:
+                process.close()
+            self.idle = []
+
+
+units_pool = UnitsPool()
+
+
+def _run_units(from_value, from_unit, wanted_unit=None):
+    """Convert a value with the 'units' utility"""
+    return units_pool.convert([from_value], from_unit, wanted_unit)[0]
+
+
+def convert_many(values, from_unit, wanted_unit=None):
+    """
+    Convert each of `values` in `from_unit` to `wanted_unit` (SI units if it is
+    None) and return the list of converted values.  If the 'units' utility is
+    needed, all of the values are sent to the same process at once.
+    """
+    from_unit = str(from_unit)
+    try:
+        conversion, _ = in_process_converter(from_unit, wanted_unit)
+        return [conversion(value) for value in values]
+    except unitsdb.UnsupportedConversion:
+        pass
+    return [value for value, _ in units_pool.convert(values, from_unit, wanted_unit)]
 
 
 # Set default behavior
 convert = convert_units
 
 
+def units_version():
+    """Return the version of the 'units' utility, or None if it cannot be run"""
+    try:
+        output = subprocess.check_output(
+            ["units", "--version"], stderr=subprocess.DEVNULL
+        ).decode("utf-8")
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    lines = output.strip().splitlines()
+    return lines[0] if lines else None
+
+
+# Value at which the conversions of unitsdb are checked against the 'units'
+# utility, and the relative difference of the results they may have
+VERIFICATION_VALUE = 1.5
+VERIFICATION_TOLERANCE = 1e-12
+
+
+def in_process_converter(from_unit, wanted_unit=None):
+    """
+    Return the (conversion, unit) of unitsdb.converter for converting values in
+    `from_unit` to `wanted_unit` (SI units if it is None).  On the first use of
+    a conversion, its result is compared with that of the 'units' utility (see
+    FactorCache.verify); unitsdb.UnsupportedConversion is raised if they
+    disagree, so that the utility is used for the conversion instead.
+    """
+    conversion, unit = unitsdb.converter(
+        from_unit, wanted_unit or None, from_unit in TEMPERATURE_FUNCTION_UNITS
+    )
+    if not factor_cache.verify(from_unit, wanted_unit or None, conversion, unit):
+        raise unitsdb.UnsupportedConversion(
+            "The conversion of '{}' to '{}' disagrees with the units utility".format(
+                from_unit, wanted_unit or "SI"
+            )
+        )
+    return conversion, unit
+
+
+def derive_factors(from_unit, to_unit=None):
+    """
+    Return (offset, scale, unit) such that a value x in `from_unit` is
+    offset + scale * x in `unit`, which is `to_unit`, or the SI unit if it is
+    None.  Returns None if the conversion is not an affine map.
+    """
+    try:
+        # Only rely on the database if it agrees with the utility
+        in_process_converter(from_unit, to_unit)
+        return unitsdb.affine(
+            from_unit, to_unit, from_unit in TEMPERATURE_FUNCTION_UNITS
+        )
+    except unitsdb.UnsupportedConversion:
+        pass
+
+    if to_unit is None:
+        _, to_unit = convert_units(1.0, from_unit)
+    a, b, linear = islinear(from_unit, to_unit)
+    if not linear:
+        return None
+    return a, b, to_unit
+
+
+class FactorCache:
+    """
+    Cache of the affine factors of unit conversions (see derive_factors), and
+    of whether the in-process conversions of unitsdb agree with the 'units'
+    utility (see verify).  As deriving them may take many runs of the utility,
+    they are also stored in a file of UNITS_CACHE_PATH named after the version
+    of the utility, so that they are derived once per version rather than once
+    per process.  Processes sharing the file merge their additions to it.  The
+    threads of a process (see add_si_units) share the cache through `lock`,
+    which is held while an entry is derived and saved.
+    """
+
+    def __init__(self):
+        self.factors = None
+        self.verified = None
+        self.path = None
+        # Reentrant, as deriving factors verifies the conversion
+        self.lock = threading.RLock()
+
+    def load(self):
+        self.factors = {}
+        self.verified = {}
+        version = units_version()
+        if version is None:
+            return
+
+        self.path = os.path.join(
+            cf.UNITS_CACHE_PATH,
+            "conversions-{}.json".format(re.sub(r"[^\w.-]+", "_", version)),
+        )
+        cached = self._read()
+        self.factors.update(cached["factors"])
+        self.verified.update(cached["verified"])
+
+    def _read(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                cached = json.load(f)
+            return {
+                "factors": dict(cached["factors"]),
+                "verified": dict(cached["verified"]),
+            }
+        except (OSError, ValueError, KeyError, TypeError):
+            return {"factors": {}, "verified": {}}
+
+    def save(self):
+        if self.path is None:
+            return
+
+        cached = self._read()
+        cached["factors"].update(self.factors)
+        cached["verified"].update(self.verified)
+        tmppath = "{}.{}.{}".format(self.path, os.getpid(), threading.get_ident())
+        try:
+            os.makedirs(cf.UNITS_CACHE_PATH, exist_ok=True)
+            with open(tmppath, "w", encoding="utf-8") as f:
+                json.dump(cached, f, indent=2, sort_keys=True)
+            os.replace(tmppath, self.path)
+        except OSError:
+            # The cache is only an optimization
+            pass
+
+    @staticmethod
+    def _key(from_unit, to_unit):
+        # Keys of JSON objects have to be strings
+        return "{}\t{}".format(from_unit, to_unit or "")
+
+    def verify(self, from_unit, to_unit, conversion, unit):
+        """
+        Return whether the in-process `conversion` from `from_unit` to
+        `to_unit`, whose values are in `unit`, agrees with the 'units' utility
+        at VERIFICATION_VALUE.  The utility is run once per conversion; if it
+        cannot be run, the conversion is trusted without being recorded.
+        """
+        with self.lock:
+            return self._verify(from_unit, to_unit, conversion, unit)
+
+    def _verify(self, from_unit, to_unit, conversion, unit):
+        if self.verified is None:
+            self.load()
+
+        key = self._key(from_unit, to_unit)
+        if key not in self.verified:
+            if self.path is None:
+                return True
+            try:
+                expected, expected_unit = run_units_once(
+                    VERIFICATION_VALUE, from_unit, to_unit
+                )
+            except (OSError, UnitsTimeout):
+                return True
+            except UnitConversion:
+                agrees = False
+            else:
+                agrees = unit == expected_unit and math.isclose(
+                    conversion(VERIFICATION_VALUE),
+                    expected,
+                    rel_tol=VERIFICATION_TOLERANCE,
+                )
+            if not agrees:
+                print(
+                    "The units database disagrees with the units utility on the "
+                    "conversion of '{}' to '{}', which is left to the "
+                    "utility".format(from_unit, to_unit or "SI")
+                )
+            self.verified[key] = agrees
+            self.save()
+
+        return self.verified[key]
+
+    def get(self, from_unit, to_unit=None):
+        """Return the factors of the conversion, deriving them if necessary"""
+        with self.lock:
+            if self.factors is None:
+                self.load()
+
+            key = self._key(from_unit, to_unit)
+            if key not in self.factors:
+                self.factors[key] = derive_factors(from_unit, to_unit)
+                self.save()
+
+            factors = self.factors[key]
+        return tuple(factors) if factors is not None else None
+
+
+factor_cache = FactorCache()
+
+
+def conversion_factors(from_unit, to_unit=None):
+    """
+    Return the (offset, scale, unit) of the conversion from `from_unit` to
+    `to_unit` (see derive_factors), or None if it is not affine
+    """
+    return factor_cache.get(str(from_unit), to_unit or None)
+
+
+def apply_affine(x, offset, scale):
+    """
+    Return the numbers of the (nested) list or tuple `x` mapped to
+    offset + scale * number, using a single numpy operation if possible
+    """
+    if np is not None and isinstance(x, list):
+        try:
+            array = np.asarray(x, dtype=float)
+        except (TypeError, ValueError):
+            # Ragged or not numeric
+            array = None
+        # None is turned into NaN, and should be an error
+        if array is not None and not np.isnan(array).any():
+            return (offset + scale * array).tolist()
+
+    def apply_inner(x):
+        if isinstance(x, (list, tuple)):
+            return type(x)(apply_inner(i) for i in x)
+        return offset + scale * x
+
+    return apply_inner(x)
+
+
 def convert_list(x, from_unit, to_unit=None, convert=convert, dofit=True):
     """Thread conversion over a list, or list of lists"""
     # Need a list for scoping reasons
@@ -106,10 +555,43 @@ def convert_list(x, from_unit, to_unit=None, convert=convert, dofit=True):
     if from_unit in (1, 1.0, "1"):
         to_unit = "1"
 
+    if (
+        dofit
+        and convert is convert_units
+        and to_unit != "1"
+        and isinstance(x, (list, tuple))
+    ):
+        factors = conversion_factors(from_unit, to_unit)
+        if factors is not None:
+            offset, scale, to_unit = factors
+            return apply_affine(x, offset, scale), to_unit
+
     # get the SI unit if none provided
     if to_unit is None:
         _, to_unit = convert(1.0, from_unit)
 
+    # Convert all of the values together, so that they are pipelined through the
+    # same 'units' process if it is needed
+    if convert is convert_units and to_unit != "1" and isinstance(x, (list, tuple)):
+        values = []
+
+        def flatten(x):
+            if isinstance(x, (list, tuple)):
+                for i in x:
+                    flatten(i)
+            else:
+                values.append(x)
+
+        flatten(x)
+        converted = iter(convert_many(values, from_unit, to_unit))
+
+        def rebuild(x):
+            if isinstance(x, (list, tuple)):
+                return type(x)(rebuild(i) for i in x)
+            return next(converted)
+
+        return rebuild(x), to_unit
+
     def convert_inner(x, fit=None):
         if isinstance(x, (list, tuple)):
             return type(x)(convert_inner(i, fit=fit) for i in x)
@@ -121,9 +603,15 @@ def convert_list(x, from_unit, to_unit=None, convert=convert, dofit=True):
                     return fit[0] + fit[1] * x
                 return float(convert(x, from_unit, to_unit, suppress_unit=True))
 
-    # setup the linear fit if we are requested to simplify
+    # setup the linear fit if we are requested to simplify (for the default
+    # conversion, affine maps have been applied above)
     fit = None
-    if dofit and isinstance(x, (list, tuple)) and len(x) > 20:
+    if (
+        dofit
+        and convert is not convert_units
+        and isinstance(x, (list, tuple))
+        and len(x) > 20
+    ):
         a, b, linear = islinear(from_unit, to_unit)
         fit = (a, b) if linear else None
 
@@ -131,12 +619,34 @@ def convert_list(x, from_unit, to_unit=None, convert=convert, dofit=True):
     return output, to_unit
 
 
-def add_si_units(doc, convert=convert):
-    """Given a document, add all of the appropriate si-units fields"""
+def _conversion_key(value, unit):
+    """Key under which the conversion of `value` in `unit` is collected"""
+    if isinstance(value, (list, tuple, dict)):
+        return (unit, id(value))
+    return (unit, type(value), value)
+
+
+def _converts_in_process(value, unit):
+    """Whether convert_list converts `value` in `unit` without the 'units' utility"""
+    if unit in (1, 1.0, "1"):
+        return True
+    if isinstance(value, (list, tuple)) and conversion_factors(unit) is not None:
+        return True
+    try:
+        in_process_converter(str(unit))
+    except unitsdb.UnsupportedConversion:
+        return False
+    return True
+
+
+def _collect_conversions(doc, conversions):
+    """
+    Add the source-value and source-unit of each quantity in `doc` to the dict
+    `conversions`, keyed by _conversion_key
+    """
     if isinstance(doc, dict):
         # check for a source-unit to defined a value with units
         if "source-unit" in doc:
-            # we've found a place to add
             assert "source-value" in doc, "Badly formed doc"
             o_value = doc.get("source-value", None)
             o_unit = doc.get("source-unit", None)
@@ -146,19 +656,86 @@ def add_si_units(doc, convert=convert):
             if o_unit is None:
                 raise UnitConversion("No source-unit provided")
 
-            # convert the units and insert
-            value, unit = convert_list(o_value, o_unit, convert=convert)
-            si_dict = {"si-unit": unit, "si-value": value}
+            conversions[_conversion_key(o_value, o_unit)] = (o_value, o_unit)
+        else:
+            for value in doc.values():
+                _collect_conversions(value, conversions)
+
+    elif isinstance(doc, (list, tuple)):
+        for x in doc:
+            _collect_conversions(x, conversions)
+
+
+def _insert_si_units(doc, converted):
+    """
+    Return `doc` with the si-unit and si-value of each quantity taken from
+    `converted`.  Only the dicts and lists containing quantities are copied.
+    """
+    if isinstance(doc, dict):
+        if "source-unit" in doc:
+            value, unit = converted[
+                _conversion_key(doc["source-value"], doc["source-unit"])
+            ]
             doc = doc.copy()
-            doc.update(si_dict)
+            doc.update({"si-unit": unit, "si-value": value})
             return doc
-        else:
-            # recurse
-            return type(doc)(
-                (key, add_si_units(value)) for key, value in list(doc.items())
-            )
+
+        items = [
+            (key, _insert_si_units(value, converted)) for key, value in doc.items()
+        ]
+        if all(new is doc[key] for key, new in items):
+            return doc
+        return type(doc)(items)
 
     elif isinstance(doc, (list, tuple)):
-        return type(doc)(add_si_units(x) for x in doc)
+        items = [_insert_si_units(x, converted) for x in doc]
+        if all(new is old for new, old in zip(items, doc)):
+            return doc
+        return type(doc)(items)
 
     return doc
+
+
+def add_si_units(doc, convert=convert, max_workers=MAX_CONVERSION_THREADS):
+    """
+    Given a document, add all of the appropriate si-units fields.  All of the
+    quantities in the document are collected first, so that the factors of each
+    unit are only looked up once and identical quantities are converted once.
+    Quantities that need the 'units' utility are converted by up to
+    `max_workers` threads, each driving its own units process.
+    """
+    conversions = {}
+    _collect_conversions(doc, conversions)
+    if not conversions:
+        return doc
+
+    # Look the factors of each unit up before any conversion is done, so that
+    # they are not derived by several threads at once
+    if convert is convert_units:
+        lists = {u for v, u in conversions.values() if isinstance(v, (list, tuple))}
+        for unit in lists:
+            if unit not in (1, 1.0, "1"):
+                conversion_factors(unit)
+
+    def convert_quantity(key):
+        value, unit = conversions[key]
+        return convert_list(value, unit, convert=convert)
+
+    # In-process conversions hold the GIL, so they gain nothing from threads
+    external = []
+    if convert is convert_units and max_workers > 1:
+        external = [
+            key
+            for key, (value, unit) in conversions.items()
+            if not _converts_in_process(value, unit)
+        ]
+
+    converted = {}
+    if len(external) > 1:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(external))) as pool:
+            converted.update(zip(external, pool.map(convert_quantity, external)))
+    for key in conversions:
+        if key not in converted:
+            converted[key] = convert_quantity(key)
+
+    return _insert_si_units(doc, converted)
@@ -0,0 +1,137 @@
+"""
+Offline mirror of the remote OpenKIM query database.
+
+Machines without outbound network access cannot send queries to the remote
+query API (PIPELINE_REMOTE_QUERY_ADDRESS), which is used by kimitems, kimgenie,
+and the pipeline.stdin.tpl files of Tests.  Instead, a snapshot of (a filtered
+subset of) the 'obj' and 'data' collections of the remote database can be
+pulled on a machine that does have network access, carried over as a directory
+of gzipped mongodb extended json files, and loaded into a mirror database
+stored at MIRROR_DATABASE_PATH.  When PIPELINE_QUERY_MODE is set to 'mirror',
+all queries that would otherwise go to the remote query API are answered from
+the mirror by the same code that serves the remote API, so that they have the
+same semantics (up to the contents of the snapshot).
+
+Copyright (c) 2014-2022, Regents of the University of Minnesota. All rights
+reserved.
+
+This software may be distributed as-is, without modification.
+"""
+
+import os
+import gzip
+
+from bson import json_util
+from montydb import MontyClient, set_storage
+
+from . import config as cf
+from . import kimquery
+
+MIRRORED_COLLECTIONS = ("obj", "data")
+
+# Number of documents requested from the remote query API at a time
+PULL_PAGE_SIZE = 1000
+
+_db = None
+
+
+def get_db():
+    """Return the mirror database, creating it if it does not exist"""
+    global _db
+    if _db is None:
+        set_storage(
+            repository=cf.MIRROR_DATABASE_PATH, use_bson=True, cache_modified="0"
+        )
+        _db = MontyClient(cf.MIRROR_DATABASE_PATH).db
+    return _db
+
+
+def snapshot_file(path, collection):
+    """Return the file of snapshot directory `path` holding `collection`"""
+    return os.path.join(path, collection + ".json.gz")
+
+
+def pull_snapshot(path, queries=None, history=False, page_size=PULL_PAGE_SIZE):
+    """
+    Download the documents of each mirrored collection of the remote database
+    matching queries[collection] (all of them if no query is given for it) into
+    the snapshot directory `path`.  Unless `history` is set, only the documents
+    marked as 'latest' are downloaded, which suffices to answer all queries that
+    do not turn history on themselves.  Returns a dict mapping each collection
+    to the number of documents downloaded.
+    """
+    queries = queries or {}
+    os.makedirs(path, exist_ok=True)
+
+    counts = {}
+    for collection in MIRRORED_COLLECTIONS:
+        filename = snapshot_file(path, collection)
+        tmpname = filename + ".part"
+        count = 0
+
+        with gzip.open(tmpname, "wt") as f:
+            while True:
+                # Page through the documents in a stable order
+                page = json_util.loads(
+                    kimquery.remote_query(
+                        {
+                            "database": collection,
+                            "query": queries.get(collection) or {},
+                            "history": history,
+                            "sort": [["_id", 1]],
+                            "skip": count,
+                            "limit": page_size,
+                        }
+                    )
+                )
+                if isinstance(page, dict):
+                    # A single document is returned by itself
+                    page = [page]
+
+                f.writelines(json_util.dumps(doc) + "\n" for doc in page)
+                count += len(page)
+                print("  Pulled {} documents from '{}'".format(count, collection))
+
+                if len(page) < page_size:
+                    break
+
+        # Only replace a previous snapshot once the new one is complete
+        os.replace(tmpname, filename)
+        counts[collection] = count
+
+    return counts
+
+
+def load_snapshot(path, chunk_size=None):
+    """
+    Replace the contents of the mirror database with those of the snapshot
+    directory `path`.  Collections for which the snapshot has no file are left
+    untouched.
+    """
+    from . import mongodb
+
+    db = get_db()
+    for collection in MIRRORED_COLLECTIONS:
+        filename = snapshot_file(path, collection)
+        if not os.path.isfile(filename):
+            print("No snapshot of collection '{}' found in {}".format(collection, path))
+            continue
+
+        print("Loading collection '{}' from {}".format(collection, filename))
+        db.drop_collection(collection)
+        mongodb.import_documents(
+            filename,
+            fmt="json",
+            chunk_size=chunk_size or mongodb.TRANSFER_CHUNK_SIZE,
+            collection=collection,
+            database=db,
+        )
+
+
+def collection_counts():
+    """Return the number of documents in each mirrored collection"""
+    db = get_db()
+    return {
+        collection: db[collection].count_documents({})
+        for collection in MIRRORED_COLLECTIONS
+    }
@@ -7,13 +7,23 @@ This software may be distributed as-is, without modification.
 
 import os
 import re
+import sys
+import time
+import gzip
+import fcntl
 import datetime
+import threading
+from contextlib import contextmanager, nullcontext
 
+import bson
+from bson import json_util
 from montydb import MontyClient, set_storage
+from montydb.engine.queries import QueryFilter
 
 from . import config as cf
 from . import util
 from . import kimobjects
+from . import sidecar
 from .kimcodes import parse_kim_code, isextendedkimid, isuuid
 
 PIPELINE_LOCAL_DB_PATH = cf.LOCAL_DATABASE_PATH
@@ -27,6 +37,140 @@ PATH_APPROVED = cf.LOCAL_REPOSITORY_PATH
 
 indent = " " * 2
 
+# Incremented whenever the documents of the 'data' collection change, so that
+# cached query results can be recognized as stale
+generation = 0
+
+
+def bump_generation():
+    global generation
+    generation += 1
+
+
+def _storage_signatures():
+    """
+    Return the names, modification times and sizes of the storage files of each
+    collection of the local database, keyed by the name of the collection
+    """
+    signatures = {}
+    try:
+        with os.scandir(os.path.join(PIPELINE_LOCAL_DB_PATH, "db")) as entries:
+            for entry in entries:
+                stat = entry.stat()
+                signatures.setdefault(entry.name.split(".")[0], []).append(
+                    (entry.name, stat.st_mtime_ns, stat.st_size)
+                )
+    except OSError:
+        pass
+    return {name: tuple(sorted(files)) for name, files in signatures.items()}
+
+
+# Signatures of the storage files as of the last time this process read or
+# wrote them
+_signatures = _storage_signatures()
+
+
+def reload_changed_collections():
+    """
+    Discard the documents montydb holds in memory for each collection whose
+    storage files were changed by another process since this process last saw
+    them, so that the collection is read again.  The flatfile storage keeps the
+    documents of a collection in memory once it has read them, and rewrites
+    the whole file from them on every write, so writing with a stale copy would
+    undo the changes of the other process.  Since it writes every modification
+    out immediately (cache_modified=0), there is nothing to lose by discarding
+    them.  Returns the current signatures of the storage files.
+    """
+    global _signatures
+
+    current = _storage_signatures()
+    cached = getattr(client._storage, "_cache_manager", {}).get(db.name, {})
+    for name in set(current) | set(_signatures):
+        if current.get(name) != _signatures.get(name):
+            cached.pop(name, None)
+    _signatures = current
+    return current
+
+
+def data_generation():
+    """
+    Return a value that changes whenever the documents of the 'data' collection
+    change, whether they are changed by this process (as counted by
+    `generation`) or by another one, e.g. `pipeline-database watch` or
+    `kimitems install`, which is detected from the modification times and
+    sizes of the storage files of the collection (see
+    reload_changed_collections).
+    """
+    return generation, reload_changed_collections().get("data", ())
+
+
+LOCK_FILE = os.path.join(PIPELINE_LOCAL_DB_PATH, "pipeline.lock")
+
+_lock_file = None
+_lock_depth = 0
+_thread_lock = threading.RLock()
+
+
+@contextmanager
+def database_lock():
+    """
+    Hold an exclusive lock on the local database for the duration of a block
+    of reads and writes, so that processes modifying it at the same time (e.g.
+    `pipeline-database watch` and the pipeline-run-* utilities) neither
+    overwrite each other's changes nor insert the same result twice.  Once the
+    lock is acquired, collections changed by other processes are read again
+    (see reload_changed_collections).  The lock may be taken again by a thread
+    that already holds it.
+    """
+    global _lock_file, _lock_depth, _signatures
+
+    with _thread_lock:
+        if _lock_depth == 0:
+            os.makedirs(PIPELINE_LOCAL_DB_PATH, exist_ok=True)
+            _lock_file = open(LOCK_FILE, "a")
+            fcntl.flock(_lock_file, fcntl.LOCK_EX)
+            reload_changed_collections()
+        _lock_depth += 1
+        try:
+            yield
+        finally:
+            _lock_depth -= 1
+            if _lock_depth == 0:
+                # Our own changes need not be read again
+                _signatures = _storage_signatures()
+                fcntl.flock(_lock_file, fcntl.LOCK_UN)
+                _lock_file.close()
+                _lock_file = None
+
+
+@contextmanager
+def buffered_writes(database=None):
+    """
+    Keep the writes made to `database` (the local database by default) during
+    a block in memory and write each modified collection out once at the end of
+    it.  montydb's flatfile storage otherwise rewrites the whole file of a
+    collection on every write, which makes a long series of inserts quadratic
+    in the size of the collection.  Other storage engines are left alone.
+    """
+    if database is None:
+        database = db
+
+    storage = database.client._storage
+    config = getattr(storage, "_config", None)
+    if not hasattr(storage, "_cache_manager") or "cache_modified" not in (config or {}):
+        yield
+        return
+
+    cache_modified = config["cache_modified"]
+    config["cache_modified"] = sys.maxsize
+    try:
+        yield
+    finally:
+        config["cache_modified"] = cache_modified
+        for engine in storage._cache_manager.get(database.name, {}).values():
+            if engine.modified_count:
+                engine.flush()
+
 
 def config_edn(flname):
     with open(flname) as f:
@@ -45,6 +189,9 @@ def drop_tables(ask=True):
 
     if check == "y":
         db["data"].drop()
+        db["stats"].drop()
+        db["items"].drop()
+        bump_generation()
 
 
 BADKEYS = {"kimspec", "profiling", "inserted_on", "latest"}
@@ -54,6 +201,26 @@ def rmbadkeys(dd):
     return {k: v for k, v in list(dd.items()) if k not in BADKEYS}
 
 
+RE_PROPERTY_ID_GROUPED = re.compile(
+    r"^tag:[^,]+,([0-9]{4}-[0-9]{2}-[0-9]{2}):property/([a-z0-9-]+)$"
+)
+
+
+def add_property_fields(doc):
+    """
+    Store the date and short name of the property reported by a property
+    instance in their own 'property-date' and 'property-short-name' fields, so
+    that they can be matched and sorted on exactly rather than by applying a
+    regular expression to the 'property-id' of every document
+    """
+    property_id = doc.get("property-id")
+    if isinstance(property_id, str):
+        m = RE_PROPERTY_ID_GROUPED.match(property_id)
+        if m:
+            doc["property-date"], doc["property-short-name"] = m.groups()
+    return doc
+
+
 def flatten(o):
     if isinstance(o, dict):
         out = {}
@@ -293,7 +460,7 @@ def doc_to_dict(doc, leader, uuid):
     foo["created_on"] = result_obj_doc["created_on"]
     foo["inserted_on"] = result_obj_doc["inserted_on"]
     foo["latest"] = True
-    return foo
+    return add_property_fields(foo)
 
 
 def rebuild_latest_tags():
@@ -403,24 +570,73 @@ def set_latest_version_result_or_error(runner_num, subject_num):
         filter={prefix + "uuid": uuids[0]},
         update={"$set": {"latest": True}},
     )
+    bump_generation()
+
+    # Keep the cached count of 'latest' documents in sync.  Since we already
+    # fetched the previous 'latest' value of every document in the lineage pair,
+    # this does not require another query.
+    latest_before = sum(1 for res in results_and_errors if res.get("latest"))
+    latest_after = sum(
+        1
+        for res in results_and_errors
+        if "meta" in res and res["meta"].get("uuid") == uuids[0]
+    )
+    if latest_after != latest_before:
+        db.stats.update_one(
+            {"_id": STATS_ID},
+            {"$inc": {"latest": latest_after - latest_before}},
+            upsert=True,
+        )
 
 
 # =============================================================================
 # Higher functions for inserting data
 # =============================================================================
-def insert_one_result(leader, uuid, full_result_path):
+def insert_one_result(
+    leader, uuid, full_result_path, update_latest=True, check_existing=True
+):
+    """
+    Insert a Test Result, Verification Result, or Error into the local database
+    and, unless `update_latest` is False, update the 'latest' tags of its
+    runner-subject lineage pair.  Unless `check_existing` is False, nothing is
+    inserted if the database already holds documents of the result or error,
+    e.g. because `pipeline-database watch` picked it up first.  Returns the
+    kimid-numbers of the runner and subject of the pair, or None if the result
+    or error was not inserted.
+    """
+    with database_lock():
+        if check_existing and db.data.find_one({"meta.uuid": uuid}, {"_id": 1}):
+            print(
+                indent + "Result or error {} is already in local database".format(uuid)
+            )
+            return None
+        return _insert_one_result(leader, uuid, full_result_path, update_latest)
+
+
+def _insert_one_result(leader, uuid, full_result_path, update_latest):
     print(indent + "Inserting result or error {} into local database".format(uuid))
     stuff = None
     info = uuid_to_dict(leader, uuid)
 
+    if not full_result_path:
+        full_result_path = os.path.join(PATH_RESULT, cf.item_subdir_names[leader], uuid)
+
     if leader in ["tr", "vr"]:
         try:
             with open(os.path.join(full_result_path, cf.RESULT_FILE)) as f:
                 edn_docs = util.loadedn(f)
                 edn_docs = edn_docs if isinstance(edn_docs, list) else [edn_docs]
-                for doc in edn_docs:
-                    stuff = doc_to_dict(doc, leader, uuid)
-                    db.data.insert_one(stuff)
+                # Arrays stored in sidecar files are only loaded when queried
+                edn_docs = [
+                    sidecar.absolute_references(doc, full_result_path)
+                    for doc in edn_docs
+                ]
+                inserted = [doc_to_dict(doc, leader, uuid) for doc in edn_docs]
+                if inserted:
+                    db.data.insert_many(inserted)
+                    bump_generation()
+                    update_stats(inserted)
+                    index_items(inserted)
 
             # Update 'latest' flag for this lineage-lineage set
             if leader == "tr":
@@ -435,19 +651,22 @@ def insert_one_result(leader, uuid, full_result_path):
 
             _, _, runner_num, _ = parse_kim_code(runner)
             _, _, subject_num, _ = parse_kim_code(subject)
-            set_latest_version_result_or_error(runner_num, subject_num)
+            if update_latest:
+                set_latest_version_result_or_error(runner_num, subject_num)
+            return runner_num, subject_num
 
         except:
             print("Could not read {} in {}/{}".format(cf.RESULT_FILE, leader, uuid))
 
     elif leader == "er":
         try:
-            with open(
-                os.path.join(PATH_RESULT, leader, uuid, "pipeline.exception")
-            ) as f:
+            with open(os.path.join(full_result_path, cf.EXCEPTION_FILE)) as f:
                 doc = {"exception": f.read()}
             stuff = doc_to_dict(doc, leader, uuid)
-            db.data.insert(stuff)
+            db.data.insert_one(stuff)
+            bump_generation()
+            update_stats([stuff])
+            index_items([stuff])
 
             # Update 'latest' flag for this lineage-lineage set
             if "test" in info:
@@ -462,7 +681,9 @@ def insert_one_result(leader, uuid, full_result_path):
 
             _, _, runner_num, _ = parse_kim_code(runner)
             _, _, subject_num, _ = parse_kim_code(subject)
-            set_latest_version_result_or_error(runner_num, subject_num)
+            if update_latest:
+                set_latest_version_result_or_error(runner_num, subject_num)
+            return runner_num, subject_num
 
         except:
             print("Could not insert exception for %s/%s", leader, uuid)
@@ -472,30 +693,625 @@ def insert_results():
     print("Filling with test results")
     leaders = ("tr", "vr", "er")
     for leader in leaders:
-        for folder in sorted(os.listdir(os.path.join(PATH_RESULT, leader))):
-            insert_one_result(leader, folder, [])
+        path = os.path.join(PATH_RESULT, cf.item_subdir_names[leader])
+        for folder in sorted(os.listdir(path)):
+            insert_one_result(leader, folder, os.path.join(path, folder))
 
 
-def delete_object(kimcode):
-    db.data.remove({"meta.test-result-id": kimcode})
-    db.data.remove({"meta.verification-result-id": kimcode})
-    db.data.remove({"meta.error-result-id": kimcode})
-
-    db.data.remove({"meta.runner.kimcode": kimcode})
-    db.data.remove({"meta.subject.kimcode": kimcode})
-
-    # Also delete immediate children and Test Results or Errors which
-    # list this item as a driver
-    # TODO: Still need full recursive propagation down here
-    db.data.remove({"meta.runner.test-driver": kimcode})
-    db.data.remove({"meta.subject.model-driver": kimcode})
-
-    if isuuid(kimcode):
-        runner, subject, _, _ = parse_kim_code(kimcode)
-        _, _, runner_num, _ = parse_kim_code(runner)
-        _, _, subject_num, _ = parse_kim_code(subject)
+def insert_result_batch(results):
+    """
+    Insert a batch of results and errors, given as (leader, uuid,
+    full_result_path) tuples, into the local database, skipping those which it
+    already holds.  The 'latest' tags are only updated once per runner-subject
+    lineage pair after all of them have been inserted.  Returns the number of
+    results and errors inserted.
+    """
+    pairs = set()
+    ninserted = 0
+    with database_lock():
+        uuids = [uuid for _, uuid, _ in results]
+        existing = {
+            doc["meta"]["uuid"]
+            for doc in db.data.find({"meta.uuid": {"$in": uuids}}, {"meta.uuid": 1})
+        }
+        for leader, uuid, full_result_path in results:
+            if uuid in existing:
+                continue
+            pair = insert_one_result(
+                leader,
+                uuid,
+                full_result_path,
+                update_latest=False,
+                check_existing=False,
+            )
+            if pair is not None:
+                pairs.add(pair)
+                ninserted += 1
+
+        for runner_num, subject_num in sorted(pairs):
+            set_latest_version_result_or_error(runner_num, subject_num)
+
+    return ninserted
+
+
+def result_uuids():
+    """Return the set of uuids of all results and errors in the local database"""
+    return {
+        doc["meta"]["uuid"]
+        for doc in db.data.find({}, {"meta.uuid": 1})
+        if "uuid" in doc.get("meta", {})
+    }
+
+
+def remove_documents(query):
+    """Remove the documents matching `query`, keeping the cached statistics in
+    sync.  Returns the removed documents, projected onto the fields needed to
+    update the statistics and 'latest' tags."""
+    removed = list(db.data.find(query, dict(STATS_FIELDS, **LINEAGE_FIELDS)))
+    update_stats(removed, sign=-1)
+    db.data.delete_many(query)
+    bump_generation()
+    return removed
+
+
+def delete_objects(kimcodes):
+    """
+    Delete a set of items and/or results or errors from the local database in a
+    single pass.  The items are first extended by all of their descendants
+    (e.g. the Models of a Model Driver) using the item index.  Then
+    every result or error that was produced by or for any of them, or by or
+    for a direct child of any of them, is removed using one combined filter.
+    Finally, the 'latest' tags are recomputed for those
+    runner-subject lineage pairs which lost their latest result or error and
+    still have others remaining.
+    """
+    with database_lock():
+        _delete_objects(kimcodes)
+
+
+def _delete_objects(kimcodes):
+    kimcodes = set(kimcodes)
+    uuids = [kimcode for kimcode in kimcodes if isuuid(kimcode)]
+    items = kimcodes.difference(uuids)
+
+    if items:
+        items.update(item_descendants(items))
+
+    clauses = []
+    if uuids:
+        for key in ("test-result-id", "verification-result-id", "error-result-id"):
+            clauses.append({"meta." + key: {"$in": uuids}})
+    if items:
+        for key in ("runner", "subject"):
+            clauses.append({"meta." + key + ".kimcode": {"$in": list(items)}})
+        # The direct children of drivers are also matched on the results
+        # themselves, in case they are missing from the item index
+        clauses.append({"meta.runner.test-driver": {"$in": list(items)}})
+        clauses.append({"meta.subject.model-driver": {"$in": list(items)}})
+    if not clauses:
+        return
+
+    removed = remove_documents({"$or": clauses})
+    if items:
+        db.items.delete_many({"_id": {"$in": list(items)}})
+
+    # Only lineage pairs whose latest result or error was removed need updating
+    pairs = set()
+    for doc in removed:
+        if doc.get("latest"):
+            meta = doc.get("meta", {})
+            pairs.add(
+                (
+                    meta.get("runner", {}).get("kimid-number"),
+                    meta.get("subject", {}).get("kimid-number"),
+                )
+            )
+    if not pairs:
+        return
+
+    remaining = db.data.find(
+        {
+            "meta.runner.kimid-number": {"$in": [p[0] for p in pairs]},
+            "meta.subject.kimid-number": {"$in": [p[1] for p in pairs]},
+        },
+        LINEAGE_FIELDS,
+    )
+    remaining = {
+        (doc["meta"]["runner"]["kimid-number"], doc["meta"]["subject"]["kimid-number"])
+        for doc in remaining
+    }
+    for runner_num, subject_num in sorted(pairs & remaining):
         set_latest_version_result_or_error(runner_num, subject_num)
 
 
+def delete_object(kimcode):
+    delete_objects([kimcode])
+
+
+# =============================================================================
+# Cached collection statistics
+# =============================================================================
+STATS_ID = "data"
+STATS_FIELDS = {
+    "meta.type": 1,
+    "meta.runner.kimcode": 1,
+    "meta.subject.kimcode": 1,
+    "latest": 1,
+}
+
+
+def _stats_increments(docs, sign=1):
+    """
+    Tally the contributions of a set of documents of the 'data' collection to
+    the cached statistics.  Runners and subjects are counted individually so
+    that the number of distinct ones can be maintained under deletion.
+    """
+    inc = {}
+
+    def add(key, n=sign):
+        inc[key] = inc.get(key, 0) + n
+
+    for doc in docs:
+        add("count")
+        meta = doc.get("meta", {})
+        if meta.get("type"):
+            add("types." + meta["type"])
+        if doc.get("latest"):
+            add("latest")
+        for item in ("runner", "subject"):
+            if isinstance(meta.get(item), dict) and meta[item].get("kimcode"):
+                add(item + "s." + meta[item]["kimcode"])
+
+    return inc
+
+
+def update_stats(docs, sign=1):
+    """
+    Add (sign=1) or subtract (sign=-1) the contributions of `docs` to the
+    cached statistics of the 'data' collection, which are stored in a single
+    document of the 'stats' collection so that `pipeline-database status` does
+    not need to scan the database
+    """
+    inc = _stats_increments(docs, sign)
+    if inc:
+        db.stats.update_one(
+            {"_id": STATS_ID},
+            {"$inc": inc, "$set": {"updated_on": now()}},
+            upsert=True,
+        )
+
+
+def rebuild_stats():
+    """Recompute the cached statistics of the 'data' collection from scratch"""
+    stats = {"_id": STATS_ID, "count": 0, "latest": 0}
+    for key, val in _stats_increments(db.data.find({}, STATS_FIELDS)).items():
+        group, _, name = key.partition(".")
+        if name:
+            stats.setdefault(group, {})[name] = val
+        else:
+            stats[group] = val
+    stats["rebuilt_on"] = stats["updated_on"] = now()
+
+    db.stats.replace_one({"_id": STATS_ID}, stats, upsert=True)
+    return stats
+
+
+def get_stats():
+    """Return the cached statistics of the 'data' collection, or None if they
+    have never been computed"""
+    return db.stats.find_one({"_id": STATS_ID})
+
+
+def disk_usage_by_collection():
+    """
+    Return a dict mapping the name of each collection in the local database to
+    the number of bytes its storage files occupy on disk
+    """
+    usage = {}
+    dbdir = os.path.join(PIPELINE_LOCAL_DB_PATH, "db")
+    if not os.path.isdir(dbdir):
+        return usage
+
+    for entry in os.scandir(dbdir):
+        if entry.is_file():
+            collection = entry.name.split(".")[0]
+            usage[collection] = usage.get(collection, 0) + entry.stat().st_size
+
+    return usage
+
+
+# =============================================================================
+# Item index
+# =============================================================================
+LINEAGE_FIELDS = {
+    "meta.runner.kimid-number": 1,
+    "meta.subject.kimid-number": 1,
+}
+ITEM_FIELDS = {
+    "meta.runner.kimcode": 1,
+    "meta.runner.test-driver": 1,
+    "meta.subject.kimcode": 1,
+    "meta.subject.model-driver": 1,
+}
+
+
+def _items_of(docs):
+    """
+    Return a dict mapping the kimcode of each runner and subject referenced by
+    a set of documents of the 'data' collection to the kimcode of its driver
+    (or None)
+    """
+    items = {}
+    for doc in docs:
+        meta = doc.get("meta", {})
+        for item, driver_key in (
+            ("runner", "test-driver"),
+            ("subject", "model-driver"),
+        ):
+            if isinstance(meta.get(item), dict) and meta[item].get("kimcode"):
+                items[meta[item]["kimcode"]] = meta[item].get(driver_key)
+    return items
+
+
+def index_items(docs):
+    """
+    Record the runners and subjects referenced by `docs` in the 'items'
+    collection, which maps each item to its driver so that the descendants of
+    an item can be found without scanning the 'data' collection.  Since an
+    extended KIM ID always refers to the same driver, only items which are not
+    yet indexed are inserted.
+    """
+    items = _items_of(docs)
+    if not items:
+        return
+
+    # montydb matches $in by comparing every document with every value, which
+    # is slower than reading all of the (few) indexed items
+    known = {doc["_id"] for doc in db.items.find({}, {"_id": 1})}
+    new = [
+        {"_id": kimcode, "driver": driver}
+        for kimcode, driver in items.items()
+        if kimcode not in known
+    ]
+    if new:
+        db.items.insert_many(new)
+
+
+def rebuild_item_index():
+    """Recreate the 'items' collection from scratch"""
+    db.items.drop()
+    index_items(db.data.find({}, ITEM_FIELDS))
+
+
+def item_descendants(kimcodes):
+    """
+    Return the set of indexed items which descend from any of `kimcodes`
+    through a chain of drivers, not including `kimcodes` themselves
+    """
+    descendants = set()
+    parents = set(kimcodes)
+    while parents:
+        children = {
+            doc["_id"]
+            for doc in db.items.find({"driver": {"$in": list(parents)}}, {"_id": 1})
+        }
+        parents = children - descendants - set(kimcodes)
+        descendants |= parents
+    return descendants
+
+
+# =============================================================================
+# Upgrading databases created by older versions of the pipeline
+# =============================================================================
+SCHEMA_FILE = os.path.join(PIPELINE_LOCAL_DB_PATH, "schema-version")
+
+# Version 1: documents of the 'data' collection have 'property-date' and
+# 'property-short-name' fields (see add_property_fields)
+# Version 2: the 'items' collection indexes the runners and subjects of all
+# documents of the 'data' collection (see index_items)
+SCHEMA_VERSION = 2
+
+
+def schema_version():
+    """
+    Return the version of the layout of the documents of the local database,
+    which is 0 for databases created before versions were recorded
+    """
+    try:
+        with open(SCHEMA_FILE) as f:
+            return int(f.read().strip() or 0)
+    except (OSError, ValueError):
+        return 0
+
+
+def upgrade_database():
+    """
+    Add the fields that documents written by older versions of the pipeline
+    lack to the documents of the 'data' collection of the local database, and
+    index the items of databases created before the item index existed.  The
+    version reached is recorded in SCHEMA_FILE, so that once the database is
+    up to date, this only costs reading that file.
+    """
+    if schema_version() >= SCHEMA_VERSION:
+        return
+
+    with database_lock(), buffered_writes():
+        # Another process may have upgraded the database in the meantime
+        version = schema_version()
+        if version >= SCHEMA_VERSION:
+            return
+
+        if version < 1:
+            # Documents are updated a property at a time, since there are far fewer
+            # of them than documents
+            property_ids = {
+                doc["property-id"]
+                for doc in db.data.find(
+                    {"property-short-name": {"$exists": False}}, {"property-id": 1}
+                )
+                if isinstance(doc.get("property-id"), str)
+            }
+            for property_id in sorted(property_ids):
+                fields = add_property_fields({"property-id": property_id})
+                del fields["property-id"]
+                if fields:
+                    db.data.update_many(
+                        {
+                            "property-id": property_id,
+                            "property-short-name": {"$exists": False},
+                        },
+                        {"$set": fields},
+                    )
+            if property_ids:
+                bump_generation()
+
+        if version < 2:
+            # Every writer maintains the index from then on
+            rebuild_item_index()
+
+        # Left in the statistics by an earlier way of recording the version
+        db.stats.delete_one({"_id": "schema"})
+
+        tmppath = "{}.{}".format(SCHEMA_FILE, os.getpid())
+        try:
+            with open(tmppath, "w") as f:
+                f.write("{}\n".format(SCHEMA_VERSION))
+            os.replace(tmppath, SCHEMA_FILE)
+        except OSError:
+            # The upgrade is simply checked for again next time
+            pass
+
+
+upgrade_database()
+
+
+# =============================================================================
+# Streaming import/export
+# =============================================================================
+TRANSFER_CHUNK_SIZE = 1000
+GZIP_MAGIC = b"\x1f\x8b"
+
+
+def transfer_query(latest=False, property_ids=None):
+    """
+    Build the query used to select which documents are transferred by
+    import_documents() and export_documents().  Property IDs may be given
+    either as full property IDs or as property short names.
+    """
+    query = {}
+    if latest:
+        query["latest"] = True
+
+    if property_ids:
+        conditions = []
+        for prop in property_ids:
+            if prop.startswith("tag:"):
+                conditions.append({"property-id": prop})
+            else:
+                conditions.append({"property-short-name": prop})
+
+        if len(conditions) == 1:
+            query.update(conditions[0])
+        else:
+            query["$or"] = conditions
+
+    return query
+
+
+class TransferProgress:
+    """
+    Report the number of documents and bytes processed so far, along with the
+    throughput, on a single continuously updated line
+    """
+
+    def __init__(self, action, interval=1.0):
+        self.action = action
+        self.interval = interval
+        self.ndocs = 0
+        self.nbytes = 0
+        self.nskipped = 0
+        self.start = time.time()
+        self.last_report = 0.0
+
+    def update(self, ndocs, nbytes):
+        self.ndocs += ndocs
+        self.nbytes += nbytes
+        if time.time() - self.last_report >= self.interval:
+            self.report(end="\r")
+
+    def report(self, end="\n"):
+        self.last_report = time.time()
+        elapsed = max(self.last_report - self.start, 1e-6)
+        msg = "{} {} documents ({:.1f} MB) in {:.1f} s [{:.0f} docs/s, {:.2f} MB/s]".format(
+            self.action,
+            self.ndocs,
+            self.nbytes / 1e6,
+            elapsed,
+            self.ndocs / elapsed,
+            self.nbytes / 1e6 / elapsed,
+        )
+        if self.nskipped and end == "\n":
+            msg += ", skipped {} duplicates".format(self.nskipped)
+        sys.stdout.write((indent + msg).ljust(79) + end)
+        sys.stdout.flush()
+
+
+def _open_transfer_file(path, mode, compress=False):
+    """
+    Open a database file for streaming.  When reading, gzip compression is
+    detected automatically from the file contents.
+    """
+    if "r" in mode:
+        with open(path, "rb") as f:
+            compress = f.read(2) == GZIP_MAGIC
+
+    if compress:
+        return gzip.open(path, mode)
+    return open(path, mode)
+
+
+def _read_json_documents(f):
+    for line in f:
+        line = line.strip()
+        if line:
+            yield json_util.loads(line), len(line)
+
+
+def _read_bson_documents(f):
+    for doc in bson.decode_file_iter(f):
+        yield doc, None
+
+
+def _insert_chunk(collection, chunk, known_ids):
+    """
+    Insert a chunk of documents, reporting (but otherwise skipping) any whose
+    _id already exists in the collection or appears earlier in the chunk.
+    `known_ids` is the set of the _ids in the collection, to which those of the
+    inserted documents are added.  Returns the documents that were inserted.
+    """
+    inserted = []
+    for doc in chunk:
+        if "_id" in doc:
+            if doc["_id"] in known_ids:
+                print("Duplicate id: %s" % doc["_id"])
+                continue
+            known_ids.add(doc["_id"])
+        inserted.append(doc)
+
+    if inserted:
+        collection.insert_many(inserted)
+    return inserted
+
+
+def import_documents(
+    path,
+    fmt="json",
+    query=None,
+    chunk_size=TRANSFER_CHUNK_SIZE,
+    collection="data",
+    database=None,
+):
+    """
+    Stream documents from a (possibly gzip-compressed) mongodb extended json
+    lines file or a bson file into the local database, inserting them in chunks
+    of `chunk_size` documents.  The storage files are only written once, at the
+    end of the import (see buffered_writes).  If `query` is given, only
+    documents matching it are imported.  Another database, e.g. the mirror of the remote database, may be
+    given as `database`, in which case the cached statistics and item index of
+    the local database are left alone.
+    """
+    local = database is None
+    if local:
+        database = db
+
+    docfilter = QueryFilter(query) if query else None
+    reader = _read_json_documents if fmt == "json" else _read_bson_documents
+    mode = "rt" if fmt == "json" else "rb"
+    progress = TransferProgress("Imported")
+
+    def flush(chunk, chunk_bytes):
+        inserted = _insert_chunk(database[collection], chunk, known_ids)
+        if local and collection == "data":
+            bump_generation()
+            update_stats(inserted)
+            index_items(inserted)
+        progress.nskipped += len(chunk) - len(inserted)
+        progress.update(len(chunk), chunk_bytes)
+
+    lock = database_lock() if local else nullcontext()
+    with lock, buffered_writes(database), _open_transfer_file(path, mode) as f:
+        # Looking the _ids of each chunk up in the collection would scan all of
+        # it every time
+        known_ids = {doc["_id"] for doc in database[collection].find({}, {"_id": 1})}
+        chunk = []
+        chunk_bytes = 0
+        for doc, nbytes in reader(f):
+            if collection == "data":
+                # Files exported from older databases may lack these fields
+                add_property_fields(doc)
+            if docfilter is not None and not docfilter(doc):
+                continue
+            chunk.append(doc)
+            chunk_bytes += nbytes if nbytes is not None else len(bson.encode(doc))
+            if len(chunk) >= chunk_size:
+                flush(chunk, chunk_bytes)
+                chunk = []
+                chunk_bytes = 0
+
+        if chunk:
+            flush(chunk, chunk_bytes)
+
+    progress.report()
+    return progress
+
+
+def export_documents(
+    path,
+    fmt="json",
+    query=None,
+    compress=False,
+    chunk_size=TRANSFER_CHUNK_SIZE,
+    collection="data",
+    inline_sidecars=False,
+):
+    """
+    Stream the documents of the local database matching `query` to a mongodb
+    extended json lines file or a bson file, optionally gzip-compressing them
+    on the fly.  Documents are serialized and written in chunks of
+    `chunk_size` documents rather than being accumulated in memory.  If
+    `inline_sidecars` is set, the arrays of results stored in sidecar files are
+    written into the documents, so that the file does not depend on them (as
+    is required when it is carried to another machine); otherwise the
+    references to the sidecar files are kept.
+    """
+    mode = "wt" if fmt == "json" else "wb"
+    progress = TransferProgress("Exported")
+
+    dirname = os.path.dirname(os.path.abspath(path))
+    if not os.path.isdir(dirname):
+        os.makedirs(dirname)
+
+    with _open_transfer_file(path, mode, compress) as f:
+        chunk = []
+        for doc in db[collection].find(query or {}):
+            if inline_sidecars:
+                doc = sidecar.load_arrays(doc)
+            if fmt == "json":
+                chunk.append(json_util.dumps(doc) + "\n")
+            else:
+                chunk.append(bson.encode(doc))
+            if len(chunk) >= chunk_size:
+                f.writelines(chunk)
+                progress.update(len(chunk), sum(len(c) for c in chunk))
+                chunk = []
+
+        if chunk:
+            f.writelines(chunk)
+            progress.update(len(chunk), sum(len(c) for c in chunk))
+
+    progress.report()
+    return progress
+
+
 def now():
     return str(datetime.datetime.now())
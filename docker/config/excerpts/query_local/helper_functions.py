@@ -13,16 +13,22 @@ from bson.json_util import loads
 
 from .. import kimquery
 from ..kimcodes import parse_kim_code
-from ..kimunits import convert_units, convert_list, UnitConversion
+from ..kimunits import convert_units, convert_list, conversion_factors, UnitConversion
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 RE_KIMID = r"^(?:([_a-zA-Z][_a-zA-Z0-9]*?)__)?([A-Z]{2})_([0-9]{12})(?:_([0-9]{3}))?$"
 RE_EXTENDED_ID = r"^[A-Za-z0-9_]+__[A-Z]{2}_[0-9]{12}_[0-9]{3}$"
 RE_SHORT_ID = r"^[A-Z]{2}_[0-9]{12}_[0-9]{3}$"
 RE_EXTENDED_ID_NO_VERSION = r"^[A-Za-z0-9_]+__[A-Z]{2}_[0-9]{12}"
 RE_SHORTCODE = r"^[A-Z]{2}_[0-9]{12}$"
-RE_PROPERTY_ID_GROUPED = (
-    r"^tag:([^A-Z+]+@[^A-Z+]+),([0-9]{4}-[0-9]{2}-[0-9]{2}):property\/([a-z-]+)$"
-)
+
+# Lists of results longer than this are filtered on temperature and pressure using
+# numpy, if it is available
+NUMPY_FILTER_THRESHOLD = 1000
 
 
 #######################################################################################
@@ -68,17 +74,17 @@ def strip_null(dic):
     return out
 
 
-def check_input_args_are_lists(inputs):
+def check_input_args_are_lists(inputs, function=None):
     for inp, val in inputs.items():
         if not isinstance(val, list):
             raise ValueError(
                 "Input argument '{}' to function {}() must be a list".format(
-                    inp, inspect.stack()[1].function
+                    inp, function or inspect.stack()[1].function
                 )
             )
 
 
-def check_types_in_input_arg(argname, argval, datatypes):
+def check_types_in_input_arg(argname, argval, datatypes, function=None):
     """Go through a single input argument (which is always a list) and make sure all
     elements are of the specified data type. We refrain from using all() because we
     want a very verbose error message"""
@@ -89,7 +95,7 @@ def check_types_in_input_arg(argname, argval, datatypes):
                 "of the following types:  {}.  Offending item value: {}, Type of "
                 "offending item: {}, Zero-based index of offending item: {}".format(
                     argname,
-                    inspect.stack()[1].function,
+                    function or inspect.stack()[1].function,
                     [d.__name__ for d in datatypes],
                     element,
                     type(element).__name__,
@@ -111,7 +117,7 @@ def check_for_invalid_null(units):
             )
 
 
-def modify_query_for_item(query, item_type, item_id):
+def modify_query_for_item(query, item_type, item_id, function=None):
     """
     Given a query dictionary and a runner or subject ID, determine if the ID is:
       - A valid extended KIM ID
@@ -134,7 +140,9 @@ def modify_query_for_item(query, item_type, item_id):
         }
         raise ValueError(
             "Invalid {} '{}' passed to function {}()".format(
-                item_type_to_key[item_type], item_id, inspect.stack()[1].function
+                item_type_to_key[item_type],
+                item_id,
+                function or inspect.stack()[1].function,
             )
         )
 
@@ -149,6 +157,46 @@ def modify_query_for_item(query, item_type, item_id):
     return ver is not None
 
 
+def item_ids_by_query_value(item_type, item_ids, function=None):
+    """
+    Given several IDs of items of the same type, all of which either do or do not
+    have a version specified in them, return a dict mapping the values on which
+    modify_query_for_item would match results for each of them (short IDs or
+    shortcodes) to the IDs given
+    """
+    matches = {}
+    for item_id in item_ids:
+        item_query = {"query": {}}
+        modify_query_for_item(item_query, item_type, item_id, function)
+        for value in item_query["query"].values():
+            matches.setdefault(value, []).append(item_id)
+    return matches
+
+
+def modify_query_for_items(query, item_type, item_ids, function=None):
+    """
+    Like modify_query_for_item, but matches results for any one of several IDs of
+    items of the same type, all of which must either have or not have a version
+    specified in them
+    """
+    versioned = [
+        modify_query_for_item(query, item_type, item_id, function)
+        for item_id in item_ids
+    ]
+    if len(set(versioned)) > 1:
+        raise ValueError(
+            "Either all or none of the IDs passed to function {}() must have a "
+            "version specified".format(function or inspect.stack()[1].function)
+        )
+
+    # Each of the calls above set the same key (and turned on history if the IDs
+    # have versions), so simply match any of the IDs on it instead
+    key = (".").join(("meta", item_type, "short-id" if versioned[0] else "shortcode"))
+    query["query"][key] = {
+        "$in": list(item_ids_by_query_value(item_type, item_ids, function))
+    }
+
+
 def modify_query_for_species(query, species):
     """If the species list passed in contains a single element, we need to grab the set of Test
     Results for which each and every member of species.source-value is equal to the element
@@ -198,7 +246,7 @@ def convert_from_si(key, from_val, from_units, to_units):
     return converted_val
 
 
-def extract_key_from_result(final_TestResult, key, to_units):
+def extract_key_from_result(final_TestResult, key, to_units, function=None):
     if to_units is None:
         try:
             return final_TestResult[key]
@@ -217,7 +265,9 @@ def extract_key_from_result(final_TestResult, key, to_units):
                 raise ValueError(
                     "Units were specified as None for key '{}' in function {}(), but "
                     "units must be associated with it according to the property "
-                    "definition specified".format(key, inspect.stack()[1].function)
+                    "definition specified".format(
+                        key, function or inspect.stack()[1].function
+                    )
                 )
             else:
                 # If it does not have si-value attached to it, but does have source-unit
@@ -227,7 +277,7 @@ def extract_key_from_result(final_TestResult, key, to_units):
                 else:
                     raise RuntimeError(
                         "UNKNOWN ERROR code 001 occurred from function {}()"
-                        "".format(inspect.stack()[1].function)
+                        "".format(function or inspect.stack()[1].function)
                     )
     else:
         try:
@@ -236,7 +286,7 @@ def extract_key_from_result(final_TestResult, key, to_units):
             raise ValueError(
                 "Units were specified for key '{}' in function {}(), but it has no "
                 "associated units in the property definition specified".format(
-                    key, inspect.stack()[1].function
+                    key, function or inspect.stack()[1].function
                 )
             )
         this_units = final_TestResult[key + ".si-unit"]
@@ -265,11 +315,7 @@ def initialize_test_result_query():
 
 
 def sort_on_property_date(results_from_query):
-    return sorted(
-        results_from_query,
-        key=lambda k: re.search(RE_PROPERTY_ID_GROUPED, k["property-id"]).groups(1),
-        reverse=True,
-    )
+    return sorted(results_from_query, key=lambda k: k["property-date"], reverse=True)
 
 
 def sort_on_Test_ver(results_from_query):
@@ -292,7 +338,7 @@ def sort_on_Model_ver(results_from_query):
 
 def filter_on_item_versions_and_timestamp(results_from_query):
     """
-    Given an array of dictionaries of results/errors, check to see which of them
+    Given an iterable of dictionaries of results/errors, check to see which of them
     correspond to the highest TD, TE and MO or SM versions, as well as the highest
     timestamp for that combination of versions, and retain them.  Discard the rest of
     the results or errors.  Note this will work even if a specific TE-MO or TE-SM
@@ -301,39 +347,133 @@ def filter_on_item_versions_and_timestamp(results_from_query):
     AFTER we've already filtered on item versions; if you tried to use meta.type=tr as a
     query parameter, it may exclude an error that's produced by the highest versions of
     the relevant items if history is on)
+
+    This is done in a single pass, keeping only the results/errors with the highest
+    uuid among those which have the highest versions of all of the items seen so far.
     """
-    # First, filter by Test Driver
-    highest_TestDriver_ver = max(
-        set([instance["meta.runner.driver.version"] for instance in results_from_query])
-    )
-    highest_Test_ver = max(
-        set([instance["meta.runner.version"] for instance in results_from_query])
-    )
-    highest_subject_ver = max(
-        set([instance["meta.subject.version"] for instance in results_from_query])
-    )
-    filtered_results = [
-        instance
-        for instance in results_from_query
+    highest_driver = highest_runner = highest_subject = None
+    highest_uuid = None
+    candidates = []
+
+    for instance in results_from_query:
+        driver = instance["meta.runner.driver.version"]
+        runner = instance["meta.runner.version"]
+        subject = instance["meta.subject.version"]
+
         if (
-            instance["meta.runner.driver.version"] == highest_TestDriver_ver
-            and instance["meta.runner.version"] == highest_Test_ver
-            and instance["meta.subject.version"] == highest_subject_ver
+            driver != highest_driver
+            or runner != highest_runner
+            or subject != highest_subject
+        ):
+            if highest_driver is None:
+                highest_driver, highest_runner, highest_subject = (
+                    driver,
+                    runner,
+                    subject,
+                )
+            else:
+                if (
+                    driver > highest_driver
+                    or runner > highest_runner
+                    or subject > highest_subject
+                ):
+                    # None of the candidates so far have the new highest versions
+                    highest_driver = max(highest_driver, driver)
+                    highest_runner = max(highest_runner, runner)
+                    highest_subject = max(highest_subject, subject)
+                    highest_uuid = None
+                    candidates = []
+                if (
+                    driver != highest_driver
+                    or runner != highest_runner
+                    or subject != highest_subject
+                ):
+                    continue
+
+        uuid = instance["meta.uuid"]
+        if highest_uuid is None or uuid > highest_uuid:
+            highest_uuid = uuid
+            candidates = [instance]
+        elif uuid == highest_uuid:
+            candidates.append(instance)
+
+    # Throw out errors.  Note that it is possible that no single result/error has the
+    # highest versions of all of the items.
+    return [instance for instance in candidates if instance["meta.type"] == "tr"]
+
+
+def condition_conversion(from_unit, to_unit):
+    """
+    Return the offset and scale of the (affine) map converting temperatures or
+    pressures given in `from_unit` to `to_unit`.  These are taken from the cache of
+    conversion factors of kimunits, rather than invoking GNU units every time a query
+    filters on temperature or pressure.
+    """
+    if from_unit == to_unit:
+        return 0.0, 1.0
+    factors = conversion_factors(from_unit, to_unit)
+    if factors is None:
+        raise UnitConversion(
+            "Conversion from {} to {} is not affine".format(from_unit, to_unit)
         )
-    ]
+    return factors[:2]
 
-    # Now filter by uuid and throw out errors
-    filtered_results = sorted(
-        filtered_results, key=lambda k: k["meta.uuid"], reverse=True
-    )
-    highest_uuid = filtered_results[0]["meta.uuid"]
-    filtered_results = [
-        instance
-        for instance in results_from_query
-        if (instance["meta.uuid"] == highest_uuid and instance["meta.type"] == "tr")
-    ]
 
-    return filtered_results
+def convert_condition(name, value, tol, from_unit, to_unit):
+    """
+    Convert the value and tolerance of the temperature or pressure (as indicated by
+    `name`) that query results must match to `to_unit`
+    """
+    try:
+        offset, scale = condition_conversion(from_unit, to_unit)
+    except UnitConversion as e:
+        raise RuntimeError("Invalid {}_units '{}' given".format(name, from_unit)) from e
+    return offset + scale * value, offset + scale * tol
+
+
+def filter_on_conditions(
+    results_from_query,
+    stress_name,
+    pressure_si,
+    pressure_tol_si,
+    temperature_si=None,
+    temperature_tol_si=None,
+):
+    """
+    Return the results whose pressure (computed from the stress `stress_name`) and, if
+    `temperature_si` is given, temperature match those given to within the tolerances
+    given.  Large lists of results are filtered using numpy, if it is available.
+    """
+    if (
+        np is not None
+        and isinstance(results_from_query, list)
+        and len(results_from_query) > NUMPY_FILTER_THRESHOLD
+    ):
+        stress = np.array(
+            [result[stress_name + ".si-value"][:3] for result in results_from_query],
+            dtype=float,
+        )
+        matches = np.abs(stress.sum(axis=1) / 3.0 - pressure_si) < pressure_tol_si
+        if temperature_si is not None:
+            temperature = np.fromiter(
+                (result["temperature.si-value"] for result in results_from_query),
+                dtype=float,
+                count=len(results_from_query),
+            )
+            matches &= np.abs(temperature - temperature_si) < temperature_tol_si
+        return [results_from_query[ind] for ind in np.flatnonzero(matches)]
+
+    final_TestResults = []
+    for result in results_from_query:
+        this_pressure_si = sum(result[stress_name + ".si-value"][:3]) / 3.0
+        if abs(this_pressure_si - pressure_si) >= pressure_tol_si:
+            continue
+        if temperature_si is not None:
+            this_temp_si = result["temperature.si-value"]
+            if abs(this_temp_si - temperature_si) >= temperature_tol_si:
+                continue
+        final_TestResults.append(result)
+    return final_TestResults
 
 
 def filter_on_pressure(
@@ -347,24 +487,13 @@ def filter_on_pressure(
     # have to do the checking on pressure manually since a map reduce would collapse all
     # results into one, which we don't want (there could be multiple results, each of
     # which corresponds to a different test).
-    try:
-        pressure_si, pressure_tol_si = convert_list(
-            x=[pressure, pressure_tol],
-            from_unit=pressure_units,
-            to_unit="Pa",
-            dofit=False,
-        )[0]
-    except UnitConversion as e:
-        raise RuntimeError(
-            "Invalid pressure_units '{}' " "given".format(pressure_units)
-        ) from e
-
-    final_TestResults = []
+    pressure_si, pressure_tol_si = convert_condition(
+        "pressure", pressure, pressure_tol, pressure_units, "Pa"
+    )
 
-    for result in results_from_query:
-        this_pressure_si = sum(result[stress_name + ".si-value"][:3]) / 3.0
-        if abs(this_pressure_si - pressure_si) < pressure_tol_si:
-            final_TestResults.append(result)
+    final_TestResults = filter_on_conditions(
+        results_from_query, stress_name, pressure_si, pressure_tol_si
+    )
 
     if len(final_TestResults) > 1:
         raise RuntimeError(
@@ -389,39 +518,21 @@ def filter_on_temperature_and_pressure(
     # results into one, which we don't want (there could be multiple results, each of
     # which corresponds to a different test).  To keep things simple, we also do the
     # checking on temperature_tol here manually
-    try:
-        temperature_si, temperature_tol_si = convert_list(
-            x=[temperature, temperature_tol],
-            from_unit=temperature_units,
-            to_unit="K",
-            dofit=False,
-        )[0]
-    except UnitConversion as e:
-        raise RuntimeError(
-            "Invalid temperature_units '{}' " "given".format(temperature_units)
-        ) from e
-    try:
-        pressure_si, pressure_tol_si = convert_list(
-            x=[pressure, pressure_tol],
-            from_unit=pressure_units,
-            to_unit="Pa",
-            dofit=False,
-        )[0]
-    except UnitConversion as e:
-        raise RuntimeError(
-            "Invalid pressure_units '{}' " "given".format(pressure_units)
-        ) from e
-
-    final_TestResults = []
+    temperature_si, temperature_tol_si = convert_condition(
+        "temperature", temperature, temperature_tol, temperature_units, "K"
+    )
+    pressure_si, pressure_tol_si = convert_condition(
+        "pressure", pressure, pressure_tol, pressure_units, "Pa"
+    )
 
-    for result in results_from_query:
-        this_temp_si = result["temperature.si-value"]
-        this_pressure_si = sum(result[stress_name + ".si-value"][:3]) / 3.0
-        if (
-            abs(this_temp_si - temperature_si) < temperature_tol_si
-            and abs(this_pressure_si - pressure_si) < pressure_tol_si
-        ):
-            final_TestResults.append(result)
+    final_TestResults = filter_on_conditions(
+        results_from_query,
+        stress_name,
+        pressure_si,
+        pressure_tol_si,
+        temperature_si,
+        temperature_tol_si,
+    )
 
     if len(final_TestResults) > 1:
         raise RuntimeError(
@@ -432,7 +543,7 @@ def filter_on_temperature_and_pressure(
     return final_TestResults
 
 
-def process_method(method_synonyms, method):
+def process_method(method_synonyms, method, function=None):
     """
     Given a list of allowed method names and a dict of synonyms, determine
     if the method provided is valid and, if so, return it with the human-readable
@@ -449,7 +560,7 @@ def process_method(method_synonyms, method):
         except AttributeError:
             raise ValueError(
                 "Invalid value '{}' for argument 'method' passed to function {}()."
-                "".format(method, inspect.stack()[1].function)
+                "".format(method, function or inspect.stack()[1].function)
             )
 
         # Strip human-readable prefix
@@ -459,14 +570,14 @@ def process_method(method_synonyms, method):
             return [("_").join((leader, num))]
 
 
-def check_args_allowed_values(allowed_values, inputs):
+def check_args_allowed_values(allowed_values, inputs, function=None):
     # Only check those keys that are listed in 'allowed_values'
     for key, vals in allowed_values.items():
         if inputs[key] not in vals:
             raise ValueError(
                 "Invalid value '{}' for argument '{}' passed to function {}(). Allowed "
                 "values are {}".format(
-                    inputs[key], key, inspect.stack()[1].function, vals
+                    inputs[key], key, function or inspect.stack()[1].function, vals
                 )
             )
 
@@ -57,18 +57,58 @@ reserved.
 This software may be distributed as-is, without modification.
 """
 
-import re
+import functools
+import inspect
 import random
+import re
 from json.decoder import JSONDecodeError
 
 from bson.code import Code
-from bson.json_util import dumps, loads
+from bson.json_util import loads
 
 from ..kimunits import convert_units, convert_list
+from .. import sidecar
 from . import helper_functions as helpers
 
 
 def api_v0(db, data, origin=None):
+    """
+    Perform a query whose parameters are given as JSON-encoded strings, as they
+    are received by the query API over the web.  Each parameter is decoded and
+    the query is carried out by `api_v0_native`.
+    """
+    try:
+        data = {key: _decode_query_param(key, val) for key, val in list(data.items())}
+    except Exception as e:
+        return {"error": str(e)}
+
+    return api_v0_native(db, data, origin=origin)
+
+
+# Parameters which may be given as plain (non-JSON) strings
+RAW_STRING_PARAMS = ("database", "map", "reduce", "flat", "history", "count")
+
+
+def _decode_query_param(key, val):
+    if not isinstance(val, str):
+        return val
+    try:
+        return loads(val)
+    except ValueError:
+        if key in RAW_STRING_PARAMS:
+            return val
+        raise
+
+
+def api_v0_native(db, data, origin=None):
+    """
+    Perform a query whose parameters are given as python objects, e.g.
+    {"query": {"meta.type": "tr"}, "fields": {"meta.uuid": 1}, "limit": 1}.
+    This avoids encoding the parameters to and decoding them from JSON when
+    querying from within the same process.  Cursors are always exhausted, so the
+    result is a list, dict, or number (or a dict with an 'error' key if the
+    query failed).
+    """
     stuff = None
 
     rmap = data.get("map", None)
@@ -86,61 +126,489 @@ def api_v0(db, data, origin=None):
     count = data.get("count", None)
 
     try:
-        try:
-            database = loads(database)
-        except ValueError:
-            pass
         dbguy = db[database]
-        query = query or "{}"
+        query = query or {}
 
         # here, we make sure to only return latest usually
         if not history and database in ["obj", "data"]:
             basequery = {"latest": True}
-            basequery.update(loads(query))
-            query = dumps(basequery)
+            basequery.update(query)
+            query = basequery
 
         # update the fields to not include _id by default
         basefields = {"_id": 0}
         if fields:
-            basefields.update(loads(fields))
-        fields = dumps(basefields)
+            basefields.update(fields)
+        fields = basefields
 
         if rmap and rreduce:
             tcollname = "tmp_%010d" % random.randint(0, 1e10)
-            try:
-                rmap, rreduce = loads(rmap), loads(rreduce)
-            except JSONDecodeError:
-                pass
             cursor = dbguy.map_reduce(
-                Code(rmap), Code(rreduce), tcollname, query=loads(query)
+                Code(rmap), Code(rreduce), tcollname, query=query
             ).find()
         else:
-            if fields:
-                cursor = dbguy.find(loads(query), loads(fields))
-            else:
-                cursor = dbguy.find(loads(query))
+            cursor = dbguy.find(query, fields)
         if sort:
-            cursor = cursor.sort(loads(sort))
+            cursor = cursor.sort(sort)
         if skip:
-            cursor = cursor.skip(loads(skip))
+            cursor = cursor.skip(skip)
         if limit:
-            cursor = cursor.limit(loads(limit))
+            cursor = cursor.limit(limit)
         if distinct:
-            cursor = cursor.distinct(loads(distinct))
-        if cursor:
-            stuff = cursor
-        if project or flat:
-            stuff = helpers.flatten(stuff)
-            if project:
-                stuff = helpers.doproject(stuff, loads(project))
+            cursor = cursor.distinct(distinct)
         if count:
             stuff = cursor.count(with_limit_and_skip=True)
+        elif cursor:
+            # Flatten and project each document as it is read from the cursor
+            # (which stops once any limit is reached) so that only the final
+            # results are ever held in memory
+            stuff = iter(cursor)
+            if database == "data" and not distinct:
+                # Load the arrays of Test Results stored in sidecar files, but
+                # only those under the keys that are returned.  The values
+                # returned by distinct are not documents.
+                stuff = (sidecar.load_arrays(doc, keys=project) for doc in stuff)
+            if project or flat:
+                stuff = (helpers.flatten(doc) for doc in stuff)
+            if project:
+                stuff = (helpers.doproject(doc, project) for doc in stuff)
+                stuff = [doc for doc in stuff if doc is not None]
+                if len(stuff) == 1:
+                    stuff = stuff[0]
+            else:
+                stuff = list(stuff)
 
     except Exception as e:
         return {"error": str(e)}
     return stuff
 
 
+#######################################################################################
+# Simplified queries
+#######################################################################################
+#
+# Each simplified query below retrieves one or more keys of the latest Test Result
+# reporting a given property, computed by a given Test Driver for a given model and
+# set of species, possibly subject to conditions on the temperature and/or pressure at
+# which it was computed.  Rather than spelling this out in every function, each query
+# is described by a SimplifiedQuery spec in the SIMPLIFIED_QUERIES registry, and the
+# public functions, which exist to document the query and fix its signature, simply
+# execute their spec.  Adding a new query therefore amounts to adding a spec and a
+# documented function that calls it.
+
+CUBIC_CRYSTALS = [["bcc"], ["diamond"], ["fcc"], ["sc"]]
+HEXAGONAL_CRYSTALS = [["graphite"], ["hcp"], ["sh"]]
+MILLER_INDICES = [[1, 0, 0], [1, 1, 0], [1, 1, 1], [1, 2, 1]]
+
+# Types which every element of these input arguments must have, if they are accepted
+ARG_TYPES = {
+    "species": str,
+    "miller": int,
+    "temperature": (float, int),
+    "temperature_tol": (float, int),
+    "pressure": (float, int),
+    "pressure_tol": (float, int),
+}
+
+
+class SimplifiedQuery:
+    def __init__(
+        self,
+        name,
+        prop,
+        keys,
+        method,
+        method_synonyms,
+        crystals=None,
+        miller=False,
+        conditions=None,
+        stress_name="cauchy-stress",
+    ):
+        """
+        Parameters
+        ----------
+        name : str
+            Name of the function executing the query, used in error messages
+        prop : str
+            Short name of the property definition of the Test Results queried for
+        keys : list of str
+            Keys of the property instance returned, in order
+        method : str
+            Shortcode of the only Test Driver allowed as the 'method' argument
+        method_synonyms : dict
+            Maps human-readable synonyms accepted for the 'method' argument to
+            Test Driver shortcodes
+        crystals : list of list of str, optional
+            Allowed values of the 'crystal' argument, which is matched against
+            the 'short-name' key.  If None, no 'crystal' argument is accepted.
+        miller : bool, optional
+            Whether a 'miller' argument is accepted, which is matched against the
+            'miller-indices' key
+        conditions : str, optional
+            "temperature_and_pressure" or "pressure" if the Test Results must
+            match the corresponding arguments within their tolerances, otherwise
+            None
+        stress_name : str, optional
+            Key of the stress from which the pressure of a Test Result is
+            computed
+        """
+        self.name = name
+        self.prop = prop
+        self.keys = keys
+        self.method_synonyms = method_synonyms
+        self.conditions = conditions
+        self.stress_name = stress_name
+        self.crystal = crystals is not None
+        self.miller = miller
+
+        self.allowed_values = {"method": [[method]]}
+        if miller:
+            self.allowed_values["miller"] = MILLER_INDICES
+        if crystals is not None:
+            self.allowed_values["crystal"] = crystals
+
+    @functools.lru_cache(maxsize=1024)
+    def compile(self, method, model, species, crystal=None, miller=None):
+        """
+        Return the query for the given (already validated) arguments, where
+        `model` may also be a tuple of models all of which either do or do not
+        specify a version.  Since the same queries tend to be issued repeatedly,
+        e.g. when rendering the templates of many Tests, compiled queries are
+        cached; they must therefore not be modified by the caller.
+        """
+        query = helpers.initialize_test_result_query()
+        query["query"]["property-short-name"] = self.prop
+        if crystal is not None:
+            query["query"]["short-name.source-value"] = crystal
+        if miller is not None:
+            query["query"]["miller-indices.source-value"] = {"$eq": list(miller)}
+
+        # The "fields" specify what is returned by the query.  This includes the keys
+        # returned as well as those needed to filter on temperature and pressure.
+        for key in self.keys:
+            query["fields"][key] = 1
+        if self.conditions == "temperature_and_pressure":
+            query["fields"]["temperature"] = 1
+        if self.conditions is not None:
+            query["fields"][self.stress_name] = 1
+
+        # Restrict the results to the lineages (or specific versions, which turn on
+        # history) of the Test Driver and model indicated.  There may still be
+        # multiple versions of a given Test that use the same driver, which is dealt
+        # with by filter_on_item_versions_and_timestamp.
+        helpers.modify_query_for_item(query, "runner.driver", method, self.name)
+        if isinstance(model, tuple):
+            # Batched query, see run_batch()
+            helpers.modify_query_for_items(query, "subject", model, self.name)
+            query["fields"]["meta.subject.shortcode"] = 1
+            query["fields"]["meta.subject.short-id"] = 1
+        else:
+            helpers.modify_query_for_item(query, "subject", model, self.name)
+
+        helpers.modify_query_for_species(query, list(species))
+        return query
+
+    def validate(self, args):
+        """
+        Check the arguments `args` passed to the public function (as given by its
+        locals()) and return them with any synonym given for the method replaced
+        by the corresponding Test Driver shortcode
+        """
+        inputs = {arg: val for arg, val in args.items() if arg != "db"}
+
+        # Check that all input args are lists, and that each list contains only a
+        # single data type.  We won't bother checking that model, etc only contain 1
+        # element
+        helpers.check_input_args_are_lists(inputs, self.name)
+        for arg, datatypes in ARG_TYPES.items():
+            if arg in inputs:
+                helpers.check_types_in_input_arg(arg, inputs[arg], datatypes, self.name)
+
+        # Check if synonym was given for method and, if so, map it to a TD shortcode
+        inputs["method"] = helpers.process_method(
+            self.method_synonyms, inputs["method"], self.name
+        )
+
+        # Enforce any restrictions on allowed argument values
+        helpers.check_args_allowed_values(self.allowed_values, inputs, self.name)
+
+        return inputs
+
+    def compile_for(self, inputs, model):
+        """Return the compiled query for validated `inputs` and `model`"""
+        return self.compile(
+            inputs["method"][0],
+            model,
+            tuple(inputs["species"]),
+            crystal=inputs["crystal"][0] if self.crystal else None,
+            miller=tuple(inputs["miller"]) if self.miller else None,
+        )
+
+    def select(self, results_from_query, inputs):
+        """
+        Return the values of the keys of the Test Result among
+        `results_from_query`, all of which were computed for the same model, that
+        matches validated `inputs`, or an empty list if there is none
+        """
+        if len(results_from_query) == 0:
+            return []
+
+        # Only pull out the results for the latest test driver version, test version,
+        # model version, and timestamp.  Discard errors.
+        results_from_query = helpers.filter_on_item_versions_and_timestamp(
+            results_from_query
+        )
+        if len(results_from_query) == 0:
+            return []
+
+        if self.conditions == "temperature_and_pressure":
+            results_from_query = helpers.filter_on_temperature_and_pressure(
+                results_from_query,
+                inputs["temperature"][0],
+                inputs["temperature_units"][0],
+                inputs["temperature_tol"][0],
+                inputs["pressure"][0],
+                inputs["pressure_units"][0],
+                inputs["pressure_tol"][0],
+                stress_name=self.stress_name,
+            )
+        elif self.conditions == "pressure":
+            results_from_query = helpers.filter_on_pressure(
+                results_from_query,
+                inputs["pressure"][0],
+                inputs["pressure_units"][0],
+                inputs["pressure_tol"][0],
+                stress_name=self.stress_name,
+            )
+        if len(results_from_query) == 0:
+            return []
+
+        units = inputs["units"][0]
+        return [
+            helpers.extract_key_from_result(
+                results_from_query[0], key, units, self.name
+            )
+            for key in self.keys
+        ]
+
+    def run(self, db, args):
+        """
+        Execute the query with the arguments `args` passed to the public function
+        (as given by its locals()), returning the values of the keys of the
+        matching Test Result or an empty list if there is none
+        """
+        inputs = self.validate(args)
+        query = self.compile_for(inputs, inputs["model"][0])
+        results_from_query = api_v0_native(db, query, origin=self.name)
+        return self.select(results_from_query, inputs)
+
+    def run_batch(self, db, args):
+        """
+        Like run(), but for every model in the 'model' argument at once.  The
+        Test Results for all of them are retrieved with a single query (or two,
+        if some of the models specify a version and others do not) and then
+        grouped by model, each group being filtered as it would be by run().
+        Returns a dict mapping each model to what run() would return for it.
+        """
+        inputs = self.validate(args)
+        models = inputs["model"]
+
+        # Versioned models are matched on their short ID with history turned on,
+        # unversioned ones on their shortcode among the latest results only
+        by_versioned = {}
+        for model in models:
+            versioned = helpers.modify_query_for_item(
+                {"query": {}}, "subject", model, self.name
+            )
+            by_versioned.setdefault(versioned, []).append(model)
+
+        answer = {model: [] for model in models}
+
+        for versioned, group in by_versioned.items():
+            query = self.compile_for(inputs, tuple(group))
+            results_from_query = api_v0_native(db, query, origin=self.name)
+            if isinstance(results_from_query, dict):
+                raise RuntimeError(results_from_query.get("error", "Query failed"))
+
+            key = "meta.subject.short-id" if versioned else "meta.subject.shortcode"
+            results_by_id = {}
+            for result in results_from_query:
+                results_by_id.setdefault(result[key], []).append(result)
+
+            matches = helpers.item_ids_by_query_value("subject", group, self.name)
+            for value, results in results_by_id.items():
+                values = self.select(results, inputs)
+                for model in matches.get(value, []):
+                    answer[model] = values
+
+        return answer
+
+
+SIMPLIFIED_QUERIES = {
+    spec.name: spec
+    for spec in [
+        SimplifiedQuery(
+            "get_lattice_constant_cubic",
+            prop="structure-cubic-crystal-npt",
+            keys=["a"],
+            method="TD_475411767977",
+            method_synonyms={"relaxation": "TD_475411767977"},
+            crystals=CUBIC_CRYSTALS,
+            conditions="temperature_and_pressure",
+        ),
+        SimplifiedQuery(
+            "get_lattice_constant_hexagonal",
+            prop="structure-hexagonal-crystal-npt",
+            keys=["a", "c"],
+            method="TD_942334626465",
+            method_synonyms={"relaxation": "TD_942334626465"},
+            crystals=HEXAGONAL_CRYSTALS,
+            conditions="temperature_and_pressure",
+        ),
+        SimplifiedQuery(
+            "get_lattice_constant_2Dhexagonal",
+            prop="structure-2d-hexagonal-crystal-npt",
+            keys=["a"],
+            method="TD_034540307932",
+            method_synonyms={"relaxation": "TD_034540307932"},
+            crystals=[["graphene-like"]],
+            conditions="temperature_and_pressure",
+            stress_name="cauchy-in-plane-stress",
+        ),
+        SimplifiedQuery(
+            "get_cohesive_energy_cubic",
+            prop="cohesive-potential-energy-cubic-crystal",
+            keys=["cohesive-potential-energy"],
+            method="TD_475411767977",
+            method_synonyms={"relaxation": "TD_475411767977"},
+            crystals=CUBIC_CRYSTALS,
+        ),
+        SimplifiedQuery(
+            "get_cohesive_energy_hexagonal",
+            prop="cohesive-potential-energy-hexagonal-crystal",
+            keys=["cohesive-potential-energy"],
+            method="TD_942334626465",
+            method_synonyms={"relaxation": "TD_942334626465"},
+            crystals=HEXAGONAL_CRYSTALS,
+        ),
+        SimplifiedQuery(
+            "get_cohesive_energy_2Dhexagonal",
+            prop="cohesive-potential-energy-2d-hexagonal-crystal",
+            keys=["cohesive-potential-energy"],
+            method="TD_034540307932",
+            method_synonyms={"relaxation": "TD_034540307932"},
+            crystals=[["graphene-like"]],
+        ),
+        SimplifiedQuery(
+            "get_elastic_constants_isothermal_cubic",
+            prop="elastic-constants-isothermal-cubic-crystal-npt",
+            keys=["c11", "c12", "c44"],
+            method="TD_011862047401",
+            method_synonyms={"finite-difference": "TD_011862047401"},
+            crystals=CUBIC_CRYSTALS,
+            conditions="temperature_and_pressure",
+        ),
+        SimplifiedQuery(
+            "get_bulk_modulus_isothermal_cubic",
+            prop="bulk-modulus-isothermal-cubic-crystal-npt",
+            keys=["isothermal-bulk-modulus"],
+            method="TD_011862047401",
+            method_synonyms={"finite-difference": "TD_011862047401"},
+            crystals=CUBIC_CRYSTALS,
+            conditions="temperature_and_pressure",
+        ),
+        SimplifiedQuery(
+            "get_bulk_modulus_isothermal_hexagonal",
+            prop="bulk-modulus-isothermal-hexagonal-crystal-npt",
+            keys=["isothermal-bulk-modulus"],
+            method="TD_612503193866",
+            method_synonyms={"finite-difference": "TD_612503193866"},
+            crystals=HEXAGONAL_CRYSTALS,
+            conditions="temperature_and_pressure",
+        ),
+        SimplifiedQuery(
+            "get_linear_thermal_expansion_coefficient_cubic",
+            prop="linear-thermal-expansion-coefficient-cubic-crystal-npt",
+            keys=["linear-thermal-expansion-coefficient"],
+            method="TD_522633393614",
+            method_synonyms={"md-volume-expansion": "TD_522633393614"},
+            crystals=CUBIC_CRYSTALS,
+            conditions="temperature_and_pressure",
+        ),
+        SimplifiedQuery(
+            "get_intrinsic_stacking_fault_relaxed_energy_fcc",
+            prop="intrinsic-stacking-fault-relaxed-energy-fcc-crystal-npt",
+            keys=["intrinsic-stacking-fault-energy"],
+            method="TD_228501831190",
+            method_synonyms={"relaxation": "TD_228501831190"},
+            conditions="pressure",
+        ),
+        SimplifiedQuery(
+            "get_extrinsic_stacking_fault_relaxed_energy_fcc",
+            prop="extrinsic-stacking-fault-relaxed-energy-fcc-crystal-npt",
+            keys=["extrinsic-stacking-fault-energy"],
+            method="TD_228501831190",
+            method_synonyms={"relaxation": "TD_228501831190"},
+            conditions="pressure",
+        ),
+        SimplifiedQuery(
+            "get_unstable_stacking_fault_relaxed_energy_fcc",
+            prop="unstable-stacking-fault-relaxed-energy-fcc-crystal-npt",
+            keys=["unstable-stacking-energy"],
+            method="TD_228501831190",
+            method_synonyms={"relaxation": "TD_228501831190"},
+            conditions="pressure",
+        ),
+        SimplifiedQuery(
+            "get_unstable_twinning_fault_relaxed_energy_fcc",
+            prop="unstable-twinning-fault-relaxed-energy-fcc-crystal-npt",
+            keys=["unstable-twinning-energy"],
+            method="TD_228501831190",
+            method_synonyms={"relaxation": "TD_228501831190"},
+            conditions="pressure",
+        ),
+        SimplifiedQuery(
+            "get_surface_energy_ideal_cubic",
+            prop="surface-energy-ideal-cubic-crystal",
+            keys=["ideal-surface-energy"],
+            method="TD_955413365818",
+            method_synonyms={},
+            crystals=CUBIC_CRYSTALS,
+            miller=True,
+        ),
+        SimplifiedQuery(
+            "get_surface_energy_relaxed_cubic",
+            prop="surface-energy-cubic-crystal-npt",
+            keys=["surface-energy"],
+            method="TD_955413365818",
+            method_synonyms={"fire": "TD_955413365818"},
+            crystals=CUBIC_CRYSTALS,
+            miller=True,
+            conditions="temperature_and_pressure",
+        ),
+    ]
+}
+
+
+def batch_simplified_query(db, name, **args):
+    """
+    Perform the simplified query `name`, e.g. "get_lattice_constant_cubic", for
+    each of the models in the 'model' argument at once.  The other arguments and
+    their defaults are those of the corresponding function.  Returns a dict
+    mapping each model to the list that the function would return for it.
+    """
+    try:
+        spec = SIMPLIFIED_QUERIES[name]
+    except KeyError:
+        raise ValueError("Unknown simplified query {}".format(name))
+
+    # Bind the arguments as calling the function would, so that missing or unknown
+    # arguments are reported and defaults are filled in
+    arguments = inspect.signature(globals()[name]).bind(db, **args)
+    arguments.apply_defaults()
+    return spec.run_batch(db, arguments.arguments)
+
+
 def get_lattice_constant_cubic(
     db,
     model,
@@ -259,118 +727,7 @@ def get_lattice_constant_cubic(
         in the requested units.
 
     """
-    method_synonyms = {"relaxation": "TD_475411767977"}
-
-    allowed_values = {
-        "method": [["TD_475411767977"]],
-        "crystal": [["bcc"], ["diamond"], ["fcc"], ["sc"]],
-    }
-
-    inputs = {
-        "model": model,
-        "crystal": crystal,
-        "species": species,
-        "units": units,
-        "temperature": temperature,
-        "temperature_units": temperature_units,
-        "temperature_tol": temperature_tol,
-        "pressure": pressure,
-        "pressure_units": pressure_units,
-        "pressure_tol": pressure_tol,
-        "method": method,
-    }
-
-    # Check that all input args are lists, and that each list contains only a single data
-    # type.  We won't bother checking that test, model, etc only contain 1 element
-    helpers.check_input_args_are_lists(inputs)
-
-    # Check for uniformity of data types in lists that can have multiple elements
-    helpers.check_types_in_input_arg("species", species, str)
-    helpers.check_types_in_input_arg("temperature", temperature, (float, int))
-    helpers.check_types_in_input_arg("temperature_tol", temperature_tol, (float, int))
-    helpers.check_types_in_input_arg("pressure", pressure, (float, int))
-    helpers.check_types_in_input_arg("pressure_tol", pressure_tol, (float, int))
-
-    # Check if synonym was given for method and, if so, map it to a TD shortcode
-    method = helpers.process_method(method_synonyms, method)
-    inputs["method"] = method
-
-    # Enforce any restrictions on allowed argument values
-    helpers.check_args_allowed_values(allowed_values, inputs)
-
-    # Pull scalar values out of lists
-    model = model[0]
-    crystal = crystal[0]
-    units = units[0]
-    temperature = temperature[0]
-    temperature_units = temperature_units[0]
-    temperature_tol = temperature_tol[0]
-    pressure = pressure[0]
-    pressure_units = pressure_units[0]
-    pressure_tol = pressure_tol[0]
-    method = method[0]
-
-    # Start with basic test result dict as query
-    query = helpers.initialize_test_result_query()
-
-    # Define the property short name we're looking for
-    prop = "structure-cubic-crystal-npt"
-    query["query"]["property-id"] = {}
-    query["query"]["property-id"]["$regex"] = (
-        "^tag:[^A-Z+]+@[^A-Z+]+,[0-9]{4}-[0-9]{2}-[0-9]{2}:property/" + prop + "$"
-    )
-
-    # Also require that the short-name array contain the specified crystal
-    query["query"]["short-name.source-value"] = crystal
-
-    # The "fields" specify what is returned by the query.  This will include the keys specified
-    # by the user, as well as some fields which are used by this function to perform sorting
-    query["fields"]["a"] = 1
-    query["fields"]["temperature"] = 1
-    query["fields"]["cauchy-stress"] = 1
-
-    # Add filters to query based on the method selected.  This will ensure that all of
-    # the results we get back will be for the indicated Test Driver (or its lineage, if
-    # no version was specified).  However, note that there may still be multiple
-    # versions of a given Test that use the same driver, so we still need to sort on
-    # that in any case -- this is done further below.
-    helpers.modify_query_for_item(query, "runner.driver", method)
-    helpers.modify_query_for_item(query, "subject", model)
-
-    helpers.modify_query_for_species(query, species)
-
-    # Perform the actual query
-    for key in query:
-        query[key] = dumps(query[key])
-    results_from_query = api_v0(db, query, origin="get_lattice_constant_cubic")
-
-    if len(results_from_query) == 0:
-        return []
-    else:
-        # Only pull out the results for the latest test driver version, test version, model
-        # version, and timestamp.  Discard errors.
-        results_from_query = helpers.filter_on_item_versions_and_timestamp(
-            results_from_query
-        )
-
-        if len(results_from_query) == 0:
-            return []
-
-        final_TestResults = helpers.filter_on_temperature_and_pressure(
-            results_from_query,
-            temperature,
-            temperature_units,
-            temperature_tol,
-            pressure,
-            pressure_units,
-            pressure_tol,
-        )
-
-        if len(final_TestResults) == 0:
-            return []
-        else:
-            a = helpers.extract_key_from_result(final_TestResults[0], "a", units)
-            return [a]
+    return SIMPLIFIED_QUERIES["get_lattice_constant_cubic"].run(db, locals())
 
 
 def get_lattice_constant_hexagonal(
@@ -490,120 +847,7 @@ def get_lattice_constant_hexagonal(
         crystal in the requested units.
 
     """
-    method_synonyms = {"relaxation": "TD_942334626465"}
-
-    allowed_values = {
-        "method": [["TD_942334626465"]],
-        "crystal": [["graphite"], ["hcp"], ["sh"]],
-    }
-
-    inputs = {
-        "model": model,
-        "crystal": crystal,
-        "species": species,
-        "units": units,
-        "temperature": temperature,
-        "temperature_units": temperature_units,
-        "temperature_tol": temperature_tol,
-        "pressure": pressure,
-        "pressure_units": pressure_units,
-        "pressure_tol": pressure_tol,
-        "method": method,
-    }
-
-    # Check that all input args are lists, and that each list contains only a single data
-    # type.  We won't bother checking that test, model, etc only contain 1 element
-    helpers.check_input_args_are_lists(inputs)
-
-    # Check for uniformity of data types in lists that can have multiple elements
-    helpers.check_types_in_input_arg("species", species, str)
-    helpers.check_types_in_input_arg("temperature", temperature, (float, int))
-    helpers.check_types_in_input_arg("temperature_tol", temperature_tol, (float, int))
-    helpers.check_types_in_input_arg("pressure", pressure, (float, int))
-    helpers.check_types_in_input_arg("pressure_tol", pressure_tol, (float, int))
-
-    # Check if synonym was given for method and, if so, map it to a TD shortcode
-    method = helpers.process_method(method_synonyms, method)
-    inputs["method"] = method
-
-    # Enforce any restrictions on allowed argument values
-    helpers.check_args_allowed_values(allowed_values, inputs)
-
-    # Pull scalar values out of lists
-    model = model[0]
-    crystal = crystal[0]
-    units = units[0]
-    temperature = temperature[0]
-    temperature_units = temperature_units[0]
-    temperature_tol = temperature_tol[0]
-    pressure = pressure[0]
-    pressure_units = pressure_units[0]
-    pressure_tol = pressure_tol[0]
-    method = method[0]
-
-    # Start with basic test result dict as query
-    query = helpers.initialize_test_result_query()
-
-    # Define the property short name we're looking for
-    prop = "structure-hexagonal-crystal-npt"
-    query["query"]["property-id"] = {}
-    query["query"]["property-id"]["$regex"] = (
-        "^tag:[^A-Z+]+@[^A-Z+]+,[0-9]{4}-[0-9]{2}-[0-9]{2}:property/" + prop + "$"
-    )
-
-    # Also require that the short-name array contain the specified crystal
-    query["query"]["short-name.source-value"] = crystal
-
-    # The "fields" specify what is returned by the query.  This will include the keys specified
-    # by the user, as well as some fields which are used by this function to perform sorting
-    query["fields"]["a"] = 1
-    query["fields"]["c"] = 1
-    query["fields"]["temperature"] = 1
-    query["fields"]["cauchy-stress"] = 1
-
-    # Add filters to query based on the method selected.  This will ensure that all of
-    # the results we get back will be for the indicated Test Driver (or its lineage, if
-    # no version was specified).  However, note that there may still be multiple
-    # versions of a given Test that use the same driver, so we still need to sort on
-    # that in any case -- this is done further below.
-    helpers.modify_query_for_item(query, "runner.driver", method)
-    helpers.modify_query_for_item(query, "subject", model)
-
-    helpers.modify_query_for_species(query, species)
-
-    # Perform the actual query
-    for key in query:
-        query[key] = dumps(query[key])
-    results_from_query = api_v0(db, query, origin="get_lattice_constant_hexagonal")
-
-    if len(results_from_query) == 0:
-        return []
-    else:
-        # Only pull out the results for the latest test driver version, test version, model
-        # version, and timestamp.  Discard errors.
-        results_from_query = helpers.filter_on_item_versions_and_timestamp(
-            results_from_query
-        )
-
-        if len(results_from_query) == 0:
-            return []
-
-        final_TestResults = helpers.filter_on_temperature_and_pressure(
-            results_from_query,
-            temperature,
-            temperature_units,
-            temperature_tol,
-            pressure,
-            pressure_units,
-            pressure_tol,
-        )
-
-        if len(final_TestResults) == 0:
-            return []
-        else:
-            a = helpers.extract_key_from_result(final_TestResults[0], "a", units)
-            c = helpers.extract_key_from_result(final_TestResults[0], "c", units)
-            return [a, c]
+    return SIMPLIFIED_QUERIES["get_lattice_constant_hexagonal"].run(db, locals())
 
 
 def get_lattice_constant_2Dhexagonal(
@@ -723,116 +967,7 @@ def get_lattice_constant_2Dhexagonal(
         crystal in the requested units.
 
     """
-    method_synonyms = {"relaxation": "TD_034540307932"}
-
-    allowed_values = {"method": [["TD_034540307932"]], "crystal": [["graphene-like"]]}
-
-    inputs = {
-        "model": model,
-        "crystal": crystal,
-        "species": species,
-        "units": units,
-        "temperature": temperature,
-        "temperature_units": temperature_units,
-        "temperature_tol": temperature_tol,
-        "pressure": pressure,
-        "pressure_units": pressure_units,
-        "pressure_tol": pressure_tol,
-        "method": method,
-    }
-
-    # Check that all input args are lists, and that each list contains only a single data
-    # type.  We won't bother checking that test, model, etc only contain 1 element
-    helpers.check_input_args_are_lists(inputs)
-
-    # Check for uniformity of data types in lists that can have multiple elements
-    helpers.check_types_in_input_arg("species", species, str)
-    helpers.check_types_in_input_arg("temperature", temperature, (float, int))
-    helpers.check_types_in_input_arg("temperature_tol", temperature_tol, (float, int))
-    helpers.check_types_in_input_arg("pressure", pressure, (float, int))
-    helpers.check_types_in_input_arg("pressure_tol", pressure_tol, (float, int))
-
-    # Check if synonym was given for method and, if so, map it to a TD shortcode
-    method = helpers.process_method(method_synonyms, method)
-    inputs["method"] = method
-
-    # Enforce any restrictions on allowed argument values
-    helpers.check_args_allowed_values(allowed_values, inputs)
-
-    # Pull scalar values out of lists
-    model = model[0]
-    crystal = crystal[0]
-    units = units[0]
-    temperature = temperature[0]
-    temperature_units = temperature_units[0]
-    temperature_tol = temperature_tol[0]
-    pressure = pressure[0]
-    pressure_units = pressure_units[0]
-    pressure_tol = pressure_tol[0]
-    method = method[0]
-
-    # Start with basic test result dict as query
-    query = helpers.initialize_test_result_query()
-
-    # Define the property short name we're looking for
-    prop = "structure-2d-hexagonal-crystal-npt"
-    query["query"]["property-id"] = {}
-    query["query"]["property-id"]["$regex"] = (
-        "^tag:[^A-Z+]+@[^A-Z+]+,[0-9]{4}-[0-9]{2}-[0-9]{2}:property/" + prop + "$"
-    )
-
-    # Also require that the short-name array contain the specified crystal
-    query["query"]["short-name.source-value"] = crystal
-
-    # The "fields" specify what is returned by the query.  This will include the keys specified
-    # by the user, as well as some fields which are used by this function to perform sorting
-    query["fields"]["a"] = 1
-    query["fields"]["temperature"] = 1
-    query["fields"]["cauchy-in-plane-stress"] = 1
-
-    # Add filters to query based on the method selected.  This will ensure that all of
-    # the results we get back will be for the indicated Test Driver (or its lineage, if
-    # no version was specified).  However, note that there may still be multiple
-    # versions of a given Test that use the same driver, so we still need to sort on
-    # that in any case -- this is done further below.
-    helpers.modify_query_for_item(query, "runner.driver", method)
-    helpers.modify_query_for_item(query, "subject", model)
-
-    helpers.modify_query_for_species(query, species)
-
-    # Perform the actual query
-    for key in query:
-        query[key] = dumps(query[key])
-    results_from_query = api_v0(db, query, origin="get_lattice_constant_2Dhexagonal")
-
-    if len(results_from_query) == 0:
-        return []
-    else:
-        # Only pull out the results for the latest test driver version, test version, model
-        # version, and timestamp.  Discard errors.
-        results_from_query = helpers.filter_on_item_versions_and_timestamp(
-            results_from_query
-        )
-
-        if len(results_from_query) == 0:
-            return []
-
-        final_TestResults = helpers.filter_on_temperature_and_pressure(
-            results_from_query,
-            temperature,
-            temperature_units,
-            temperature_tol,
-            pressure,
-            pressure_units,
-            pressure_tol,
-            stress_name="cauchy-in-plane-stress",
-        )
-
-        if len(final_TestResults) == 0:
-            return []
-        else:
-            a = helpers.extract_key_from_result(final_TestResults[0], "a", units)
-            return [a]
+    return SIMPLIFIED_QUERIES["get_lattice_constant_2Dhexagonal"].run(db, locals())
 
 
 def get_cohesive_energy_cubic(
@@ -906,89 +1041,7 @@ def get_cohesive_energy_cubic(
         i.e. a stable crystal will have a *positive* cohesive energy.
 
     """
-    method_synonyms = {"relaxation": "TD_475411767977"}
-
-    allowed_values = {
-        "method": [["TD_475411767977"]],
-        "crystal": [["bcc"], ["diamond"], ["fcc"], ["sc"]],
-    }
-
-    inputs = {
-        "model": model,
-        "crystal": crystal,
-        "species": species,
-        "units": units,
-        "method": method,
-    }
-
-    # Check that all input args are lists, and that each list contains only a single data
-    # type.  We won't bother checking that test, model, etc only contain 1 element
-    helpers.check_input_args_are_lists(inputs)
-
-    # Check for uniformity of data types in lists that can have multiple elements
-    helpers.check_types_in_input_arg("species", species, str)
-
-    # Check if synonym was given for method and, if so, map it to a TD shortcode
-    method = helpers.process_method(method_synonyms, method)
-    inputs["method"] = method
-
-    # Enforce any restrictions on allowed argument values
-    helpers.check_args_allowed_values(allowed_values, inputs)
-
-    # Pull scalar values out of lists
-    model = model[0]
-    crystal = crystal[0]
-    units = units[0]
-    method = method[0]
-
-    # Start with basic test result dict as query
-    query = helpers.initialize_test_result_query()
-
-    # Define the property short name we're looking for
-    prop = "cohesive-potential-energy-cubic-crystal"
-    query["query"]["property-id"] = {}
-    query["query"]["property-id"]["$regex"] = (
-        "^tag:[^A-Z+]+@[^A-Z+]+,[0-9]{4}-[0-9]{2}-[0-9]{2}:property/" + prop + "$"
-    )
-
-    # Also require that the short-name array contain the specified crystal
-    query["query"]["short-name.source-value"] = crystal
-
-    # The "fields" specify what is returned by the query.  This will include the keys specified
-    # by the user, as well as some fields which are used by this function to perform sorting
-    query["fields"]["cohesive-potential-energy"] = 1
-
-    # Add filters to query based on the method selected.  This will ensure that all of
-    # the results we get back will be for the indicated Test Driver (or its lineage, if
-    # no version was specified).  However, note that there may still be multiple
-    # versions of a given Test that use the same driver, so we still need to sort on
-    # that in any case -- this is done further below.
-    helpers.modify_query_for_item(query, "runner.driver", method)
-    helpers.modify_query_for_item(query, "subject", model)
-
-    helpers.modify_query_for_species(query, species)
-
-    # Perform the actual query
-    for key in query:
-        query[key] = dumps(query[key])
-    results_from_query = api_v0(db, query, origin="get_cohesive_energy_cubic")
-
-    if len(results_from_query) == 0:
-        return []
-    else:
-        # Only pull out the results for the latest test driver version, test version, model
-        # version, and timestamp.  Discard errors.
-        results_from_query = helpers.filter_on_item_versions_and_timestamp(
-            results_from_query
-        )
-
-        if len(results_from_query) == 0:
-            return []
-
-        cohesive_energy = helpers.extract_key_from_result(
-            results_from_query[0], "cohesive-potential-energy", units
-        )
-        return [cohesive_energy]
+    return SIMPLIFIED_QUERIES["get_cohesive_energy_cubic"].run(db, locals())
 
 
 def get_cohesive_energy_hexagonal(
@@ -1062,119 +1115,34 @@ def get_cohesive_energy_hexagonal(
         i.e. a stable crystal will have a *positive* cohesive energy.
 
     """
-    # NOTE: This currently won't ever return any results because the current version of
-    # the LatticeConstantHexagonal driver only reports
-    # 'cohesive-free-energy-hexagonal-crystal' and 'structure-hexagonal-crystal-npt'
-    method_synonyms = {"relaxation": "TD_942334626465"}
-
-    allowed_values = {
-        "method": [["TD_942334626465"]],
-        "crystal": [["graphite"], ["hcp"], ["sh"]],
-    }
-
-    inputs = {
-        "model": model,
-        "crystal": crystal,
-        "species": species,
-        "units": units,
-        "method": method,
-    }
+    return SIMPLIFIED_QUERIES["get_cohesive_energy_hexagonal"].run(db, locals())
 
-    # Check that all input args are lists, and that each list contains only a single data
-    # type.  We won't bother checking that test, model, etc only contain 1 element
-    helpers.check_input_args_are_lists(inputs)
 
-    # Check for uniformity of data types in lists that can have multiple elements
-    helpers.check_types_in_input_arg("species", species, str)
+def get_cohesive_energy_2Dhexagonal(
+    db, model, crystal, species, units, method=["relaxation"]
+):
+    r"""Retrieve cohesive energy of a 2D hexagonal crystal comprised of one or
+    more species at zero temperature and pressure
 
-    # Check if synonym was given for method and, if so, map it to a TD shortcode
-    method = helpers.process_method(method_synonyms, method)
-    inputs["method"] = method
+    KIM Property Definition: [cohesive-potential-energy-2d-hexagonal-crystal](https://openkim.org/properties/show/2015-05-26/staff@noreply.openkim.org/cohesive-potential-energy-2d-hexagonal-crystal)
 
-    # Enforce any restrictions on allowed argument values
-    helpers.check_args_allowed_values(allowed_values, inputs)
+    Usage Examples
+    --------------
+    LAMMPS:
 
-    # Pull scalar values out of lists
-    model = model[0]
-    crystal = crystal[0]
-    units = units[0]
-    method = method[0]
+      ```
+      kim_init Tersoff_LAMMPS_Tersoff_1988_C__MO_579868029681_002 metal
+      kim_query Ec get_cohesive_energy_2Dhexagonal crystal=["graphene-like"] species=["C"] units=["eV"]
+      ```
 
-    # Start with basic test result dict as query
-    query = helpers.initialize_test_result_query()
+    python:
 
-    # Define the property short name we're looking for
-    prop = "cohesive-potential-energy-hexagonal-crystal"
-    query["query"]["property-id"] = {}
-    query["query"]["property-id"]["$regex"] = (
-        "^tag:[^A-Z+]+@[^A-Z+]+,[0-9]{4}-[0-9]{2}-[0-9]{2}:property/" + prop + "$"
-    )
+      ```
+      from kim_python_utils.query import get_cohesive_energy_2Dhexagonal
+      get_cohesive_energy_2Dhexagonal(["MO_579868029681_002"], ["graphene-like"], ["C"], ["eV"])
+      ```
 
-    # Also require that the short-name array contain the specified crystal
-    query["query"]["short-name.source-value"] = crystal
-
-    # The "fields" specify what is returned by the query.  This will include the keys specified
-    # by the user, as well as some fields which are used by this function to perform sorting
-    query["fields"]["cohesive-potential-energy"] = 1
-
-    # Add filters to query based on the method selected.  This will ensure that all of
-    # the results we get back will be for the indicated Test Driver (or its lineage, if
-    # no version was specified).  However, note that there may still be multiple
-    # versions of a given Test that use the same driver, so we still need to sort on
-    # that in any case -- this is done further below.
-    helpers.modify_query_for_item(query, "runner.driver", method)
-    helpers.modify_query_for_item(query, "subject", model)
-
-    helpers.modify_query_for_species(query, species)
-
-    # Perform the actual query
-    for key in query:
-        query[key] = dumps(query[key])
-    results_from_query = api_v0(db, query, origin="get_cohesive_energy_hexagonal")
-
-    if len(results_from_query) == 0:
-        return []
-    else:
-        # Only pull out the results for the latest test driver version, test version, model
-        # version, and timestamp.  Discard errors.
-        results_from_query = helpers.filter_on_item_versions_and_timestamp(
-            results_from_query
-        )
-
-        if len(results_from_query) == 0:
-            return []
-
-        cohesive_energy = helpers.extract_key_from_result(
-            results_from_query[0], "cohesive-potential-energy", units
-        )
-        return [cohesive_energy]
-
-
-def get_cohesive_energy_2Dhexagonal(
-    db, model, crystal, species, units, method=["relaxation"]
-):
-    r"""Retrieve cohesive energy of a 2D hexagonal crystal comprised of one or
-    more species at zero temperature and pressure
-
-    KIM Property Definition: [cohesive-potential-energy-2d-hexagonal-crystal](https://openkim.org/properties/show/2015-05-26/staff@noreply.openkim.org/cohesive-potential-energy-2d-hexagonal-crystal)
-
-    Usage Examples
-    --------------
-    LAMMPS:
-
-      ```
-      kim_init Tersoff_LAMMPS_Tersoff_1988_C__MO_579868029681_002 metal
-      kim_query Ec get_cohesive_energy_2Dhexagonal crystal=["graphene-like"] species=["C"] units=["eV"]
-      ```
-
-    python:
-
-      ```
-      from kim_python_utils.query import get_cohesive_energy_2Dhexagonal
-      get_cohesive_energy_2Dhexagonal(["MO_579868029681_002"], ["graphene-like"], ["C"], ["eV"])
-      ```
-
-    curl:
+    curl:
 
       ```
       curl --data-urlencode 'model=["MO_579868029681_002"]' \
@@ -1221,86 +1189,7 @@ def get_cohesive_energy_2Dhexagonal(
         i.e. a stable crystal will have a *positive* cohesive energy.
 
     """
-    method_synonyms = {"relaxation": "TD_034540307932"}
-
-    allowed_values = {"method": [["TD_034540307932"]], "crystal": [["graphene-like"]]}
-
-    inputs = {
-        "model": model,
-        "crystal": crystal,
-        "species": species,
-        "units": units,
-        "method": method,
-    }
-
-    # Check that all input args are lists, and that each list contains only a single data
-    # type.  We won't bother checking that test, model, etc only contain 1 element
-    helpers.check_input_args_are_lists(inputs)
-
-    # Check for uniformity of data types in lists that can have multiple elements
-    helpers.check_types_in_input_arg("species", species, str)
-
-    # Check if synonym was given for method and, if so, map it to a TD shortcode
-    method = helpers.process_method(method_synonyms, method)
-    inputs["method"] = method
-
-    # Enforce any restrictions on allowed argument values
-    helpers.check_args_allowed_values(allowed_values, inputs)
-
-    # Pull scalar values out of lists
-    model = model[0]
-    crystal = crystal[0]
-    units = units[0]
-    method = method[0]
-
-    # Start with basic test result dict as query
-    query = helpers.initialize_test_result_query()
-
-    # Define the property short name we're looking for
-    prop = "cohesive-potential-energy-2d-hexagonal-crystal"
-    query["query"]["property-id"] = {}
-    query["query"]["property-id"]["$regex"] = (
-        "^tag:[^A-Z+]+@[^A-Z+]+,[0-9]{4}-[0-9]{2}-[0-9]{2}:property/" + prop + "$"
-    )
-
-    # Also require that the short-name array contain the specified crystal
-    query["query"]["short-name.source-value"] = crystal
-
-    # The "fields" specify what is returned by the query.  This will include the keys specified
-    # by the user, as well as some fields which are used by this function to perform sorting
-    query["fields"]["cohesive-potential-energy"] = 1
-
-    # Add filters to query based on the method selected.  This will ensure that all of
-    # the results we get back will be for the indicated Test Driver (or its lineage, if
-    # no version was specified).  However, note that there may still be multiple
-    # versions of a given Test that use the same driver, so we still need to sort on
-    # that in any case -- this is done further below.
-    helpers.modify_query_for_item(query, "runner.driver", method)
-    helpers.modify_query_for_item(query, "subject", model)
-
-    helpers.modify_query_for_species(query, species)
-
-    # Perform the actual query
-    for key in query:
-        query[key] = dumps(query[key])
-    results_from_query = api_v0(db, query, origin="get_cohesive_energy_2dhexagonal")
-
-    if len(results_from_query) == 0:
-        return []
-    else:
-        # Only pull out the results for the latest test driver version, test version, model
-        # version, and timestamp.  Discard errors.
-        results_from_query = helpers.filter_on_item_versions_and_timestamp(
-            results_from_query
-        )
-
-        if len(results_from_query) == 0:
-            return []
-
-        cohesive_energy = helpers.extract_key_from_result(
-            results_from_query[0], "cohesive-potential-energy", units
-        )
-        return [cohesive_energy]
+    return SIMPLIFIED_QUERIES["get_cohesive_energy_2Dhexagonal"].run(db, locals())
 
 
 def get_elastic_constants_isothermal_cubic(
@@ -1418,125 +1307,10 @@ def get_elastic_constants_isothermal_cubic(
         The isothermal cubic elastic constants in the requested units.
 
     """
-    method_synonyms = {"finite-difference": "TD_011862047401"}
-
-    allowed_values = {
-        "method": [["TD_011862047401"]],
-        "crystal": [["bcc"], ["diamond"], ["fcc"], ["sc"]],
-    }
-
-    inputs = {
-        "model": model,
-        "crystal": crystal,
-        "species": species,
-        "units": units,
-        "temperature": temperature,
-        "temperature_units": temperature_units,
-        "temperature_tol": temperature_tol,
-        "pressure": pressure,
-        "pressure_units": pressure_units,
-        "pressure_tol": pressure_tol,
-        "method": method,
-    }
-
-    # Check that all input args are lists, and that each list contains only a single data
-    # type.  We won't bother checking that test, model, etc only contain 1 element
-    helpers.check_input_args_are_lists(inputs)
-
-    # Check for uniformity of data types in lists that can have multiple elements
-    helpers.check_types_in_input_arg("species", species, str)
-    helpers.check_types_in_input_arg("temperature", temperature, (float, int))
-    helpers.check_types_in_input_arg("temperature_tol", temperature_tol, (float, int))
-    helpers.check_types_in_input_arg("pressure", pressure, (float, int))
-    helpers.check_types_in_input_arg("pressure_tol", pressure_tol, (float, int))
-
-    # Check if synonym was given for method and, if so, map it to a TD shortcode
-    method = helpers.process_method(method_synonyms, method)
-    inputs["method"] = method
-
-    # Enforce any restrictions on allowed argument values
-    helpers.check_args_allowed_values(allowed_values, inputs)
-
-    # Pull scalar values out of lists
-    model = model[0]
-    crystal = crystal[0]
-    units = units[0]
-    temperature = temperature[0]
-    temperature_units = temperature_units[0]
-    temperature_tol = temperature_tol[0]
-    pressure = pressure[0]
-    pressure_units = pressure_units[0]
-    pressure_tol = pressure_tol[0]
-    method = method[0]
-
-    # Start with basic test result dict as query
-    query = helpers.initialize_test_result_query()
-
-    # Define the property short name we're looking for
-    prop = "elastic-constants-isothermal-cubic-crystal-npt"
-    query["query"]["property-id"] = {}
-    query["query"]["property-id"]["$regex"] = (
-        "^tag:[^A-Z+]+@[^A-Z+]+,[0-9]{4}-[0-9]{2}-[0-9]{2}:property/" + prop + "$"
+    return SIMPLIFIED_QUERIES["get_elastic_constants_isothermal_cubic"].run(
+        db, locals()
     )
 
-    # Also require that the short-name array contain the specified crystal
-    query["query"]["short-name.source-value"] = crystal
-
-    # The "fields" specify what is returned by the query.  This will include the keys specified
-    # by the user, as well as some fields which are used by this function to perform sorting
-    query["fields"]["c11"] = (1,)
-    query["fields"]["c12"] = (1,)
-    query["fields"]["c44"] = (1,)
-    query["fields"]["temperature"] = 1
-    query["fields"]["cauchy-stress"] = 1
-
-    # Add filters to query based on the method selected.  This will ensure that all of
-    # the results we get back will be for the indicated Test Driver (or its lineage, if
-    # no version was specified).  However, note that there may still be multiple
-    # versions of a given Test that use the same driver, so we still need to sort on
-    # that in any case -- this is done further below.
-    helpers.modify_query_for_item(query, "runner.driver", method)
-    helpers.modify_query_for_item(query, "subject", model)
-
-    helpers.modify_query_for_species(query, species)
-
-    # Perform the actual query
-    for key in query:
-        query[key] = dumps(query[key])
-    results_from_query = api_v0(
-        db, query, origin="get_elastic_constants_isothermal_cubic"
-    )
-
-    if len(results_from_query) == 0:
-        return []
-    else:
-        # Only pull out the results for the latest test driver version, test version, model
-        # version, and timestamp.  Discard errors.
-        results_from_query = helpers.filter_on_item_versions_and_timestamp(
-            results_from_query
-        )
-
-        if len(results_from_query) == 0:
-            return []
-
-        final_TestResults = helpers.filter_on_temperature_and_pressure(
-            results_from_query,
-            temperature,
-            temperature_units,
-            temperature_tol,
-            pressure,
-            pressure_units,
-            pressure_tol,
-        )
-
-        if len(final_TestResults) == 0:
-            return []
-        else:
-            c11 = helpers.extract_key_from_result(final_TestResults[0], "c11", units)
-            c12 = helpers.extract_key_from_result(final_TestResults[0], "c12", units)
-            c44 = helpers.extract_key_from_result(final_TestResults[0], "c44", units)
-            return [c11, c12, c44]
-
 
 def get_bulk_modulus_isothermal_cubic(
     db,
@@ -1653,120 +1427,7 @@ def get_bulk_modulus_isothermal_cubic(
         The isothermal bulk modulus in the requested units.
 
     """
-    method_synonyms = {"finite-difference": "TD_011862047401"}
-
-    allowed_values = {
-        "method": [["TD_011862047401"]],
-        "crystal": [["bcc"], ["diamond"], ["fcc"], ["sc"]],
-    }
-
-    inputs = {
-        "model": model,
-        "crystal": crystal,
-        "species": species,
-        "units": units,
-        "temperature": temperature,
-        "temperature_units": temperature_units,
-        "temperature_tol": temperature_tol,
-        "pressure": pressure,
-        "pressure_units": pressure_units,
-        "pressure_tol": pressure_tol,
-        "method": method,
-    }
-
-    # Check that all input args are lists, and that each list contains only a single data
-    # type.  We won't bother checking that test, model, etc only contain 1 element
-    helpers.check_input_args_are_lists(inputs)
-
-    # Check for uniformity of data types in lists that can have multiple elements
-    helpers.check_types_in_input_arg("species", species, str)
-    helpers.check_types_in_input_arg("temperature", temperature, (float, int))
-    helpers.check_types_in_input_arg("temperature_tol", temperature_tol, (float, int))
-    helpers.check_types_in_input_arg("pressure", pressure, (float, int))
-    helpers.check_types_in_input_arg("pressure_tol", pressure_tol, (float, int))
-
-    # Check if synonym was given for method and, if so, map it to a TD shortcode
-    method = helpers.process_method(method_synonyms, method)
-    inputs["method"] = method
-
-    # Enforce any restrictions on allowed argument values
-    helpers.check_args_allowed_values(allowed_values, inputs)
-
-    # Pull scalar values out of lists
-    model = model[0]
-    crystal = crystal[0]
-    units = units[0]
-    temperature = temperature[0]
-    temperature_units = temperature_units[0]
-    temperature_tol = temperature_tol[0]
-    pressure = pressure[0]
-    pressure_units = pressure_units[0]
-    pressure_tol = pressure_tol[0]
-    method = method[0]
-
-    # Start with basic test result dict as query
-    query = helpers.initialize_test_result_query()
-
-    # Define the property short name we're looking for
-    prop = "bulk-modulus-isothermal-cubic-crystal-npt"
-    query["query"]["property-id"] = {}
-    query["query"]["property-id"]["$regex"] = (
-        "^tag:[^A-Z+]+@[^A-Z+]+,[0-9]{4}-[0-9]{2}-[0-9]{2}:property/" + prop + "$"
-    )
-
-    # Also require that the short-name array contain the specified crystal
-    query["query"]["short-name.source-value"] = crystal
-
-    # The "fields" specify what is returned by the query.  This will include the keys specified
-    # by the user, as well as some fields which are used by this function to perform sorting
-    query["fields"]["isothermal-bulk-modulus"] = (1,)
-    query["fields"]["temperature"] = 1
-    query["fields"]["cauchy-stress"] = 1
-
-    # Add filters to query based on the method selected.  This will ensure that all of
-    # the results we get back will be for the indicated Test Driver (or its lineage, if
-    # no version was specified).  However, note that there may still be multiple
-    # versions of a given Test that use the same driver, so we still need to sort on
-    # that in any case -- this is done further below.
-    helpers.modify_query_for_item(query, "runner.driver", method)
-    helpers.modify_query_for_item(query, "subject", model)
-
-    helpers.modify_query_for_species(query, species)
-
-    # Perform the actual query
-    for key in query:
-        query[key] = dumps(query[key])
-    results_from_query = api_v0(db, query, origin="get_bulk_modulus_isothermal_cubic")
-
-    if len(results_from_query) == 0:
-        return []
-    else:
-        # Only pull out the results for the latest test driver version, test version, model
-        # version, and timestamp.  Discard errors.
-        results_from_query = helpers.filter_on_item_versions_and_timestamp(
-            results_from_query
-        )
-
-        if len(results_from_query) == 0:
-            return []
-
-        final_TestResults = helpers.filter_on_temperature_and_pressure(
-            results_from_query,
-            temperature,
-            temperature_units,
-            temperature_tol,
-            pressure,
-            pressure_units,
-            pressure_tol,
-        )
-
-        if len(final_TestResults) == 0:
-            return []
-        else:
-            B = helpers.extract_key_from_result(
-                final_TestResults[0], "isothermal-bulk-modulus", units
-            )
-            return [B]
+    return SIMPLIFIED_QUERIES["get_bulk_modulus_isothermal_cubic"].run(db, locals())
 
 
 def get_bulk_modulus_isothermal_hexagonal(
@@ -1884,122 +1545,7 @@ def get_bulk_modulus_isothermal_hexagonal(
         The isothermal bulk modulus in the requested units.
 
     """
-    method_synonyms = {"finite-difference": "TD_612503193866"}
-
-    allowed_values = {
-        "method": [["TD_612503193866"]],
-        "crystal": [["graphite"], ["hcp"], ["sh"]],
-    }
-
-    inputs = {
-        "model": model,
-        "crystal": crystal,
-        "species": species,
-        "units": units,
-        "temperature": temperature,
-        "temperature_units": temperature_units,
-        "temperature_tol": temperature_tol,
-        "pressure": pressure,
-        "pressure_units": pressure_units,
-        "pressure_tol": pressure_tol,
-        "method": method,
-    }
-
-    # Check that all input args are lists, and that each list contains only a single data
-    # type.  We won't bother checking that test, model, etc only contain 1 element
-    helpers.check_input_args_are_lists(inputs)
-
-    # Check for uniformity of data types in lists that can have multiple elements
-    helpers.check_types_in_input_arg("species", species, str)
-    helpers.check_types_in_input_arg("temperature", temperature, (float, int))
-    helpers.check_types_in_input_arg("temperature_tol", temperature_tol, (float, int))
-    helpers.check_types_in_input_arg("pressure", pressure, (float, int))
-    helpers.check_types_in_input_arg("pressure_tol", pressure_tol, (float, int))
-
-    # Check if synonym was given for method and, if so, map it to a TD shortcode
-    method = helpers.process_method(method_synonyms, method)
-    inputs["method"] = method
-
-    # Enforce any restrictions on allowed argument values
-    helpers.check_args_allowed_values(allowed_values, inputs)
-
-    # Pull scalar values out of lists
-    model = model[0]
-    crystal = crystal[0]
-    units = units[0]
-    temperature = temperature[0]
-    temperature_units = temperature_units[0]
-    temperature_tol = temperature_tol[0]
-    pressure = pressure[0]
-    pressure_units = pressure_units[0]
-    pressure_tol = pressure_tol[0]
-    method = method[0]
-
-    # Start with basic test result dict as query
-    query = helpers.initialize_test_result_query()
-
-    # Define the property short name we're looking for
-    prop = "bulk-modulus-isothermal-hexagonal-crystal-npt"
-    query["query"]["property-id"] = {}
-    query["query"]["property-id"]["$regex"] = (
-        "^tag:[^A-Z+]+@[^A-Z+]+,[0-9]{4}-[0-9]{2}-[0-9]{2}:property/" + prop + "$"
-    )
-
-    # Also require that the short-name array contain the specified crystal
-    query["query"]["short-name.source-value"] = crystal
-
-    # The "fields" specify what is returned by the query.  This will include the keys specified
-    # by the user, as well as some fields which are used by this function to perform sorting
-    query["fields"]["isothermal-bulk-modulus"] = (1,)
-    query["fields"]["temperature"] = 1
-    query["fields"]["cauchy-stress"] = 1
-
-    # Add filters to query based on the method selected.  This will ensure that all of
-    # the results we get back will be for the indicated Test Driver (or its lineage, if
-    # no version was specified).  However, note that there may still be multiple
-    # versions of a given Test that use the same driver, so we still need to sort on
-    # that in any case -- this is done further below.
-    helpers.modify_query_for_item(query, "runner.driver", method)
-    helpers.modify_query_for_item(query, "subject", model)
-
-    helpers.modify_query_for_species(query, species)
-
-    # Perform the actual query
-    for key in query:
-        query[key] = dumps(query[key])
-    results_from_query = api_v0(
-        db, query, origin="get_bulk_modulus_isothermal_hexagonal"
-    )
-
-    if len(results_from_query) == 0:
-        return []
-    else:
-        # Only pull out the results for the latest test driver version, test version, model
-        # version, and timestamp.  Discard errors.
-        results_from_query = helpers.filter_on_item_versions_and_timestamp(
-            results_from_query
-        )
-
-        if len(results_from_query) == 0:
-            return []
-
-        final_TestResults = helpers.filter_on_temperature_and_pressure(
-            results_from_query,
-            temperature,
-            temperature_units,
-            temperature_tol,
-            pressure,
-            pressure_units,
-            pressure_tol,
-        )
-
-        if len(final_TestResults) == 0:
-            return []
-        else:
-            B = helpers.extract_key_from_result(
-                final_TestResults[0], "isothermal-bulk-modulus", units
-            )
-            return [B]
+    return SIMPLIFIED_QUERIES["get_bulk_modulus_isothermal_hexagonal"].run(db, locals())
 
 
 def get_linear_thermal_expansion_coefficient_cubic(
@@ -2119,123 +1665,10 @@ def get_linear_thermal_expansion_coefficient_cubic(
         The linear thermal expansion coefficient in the requested units.
 
     """
-    method_synonyms = {"md-volume-expansion": "TD_522633393614"}
-
-    allowed_values = {
-        "method": [["TD_522633393614"]],
-        "crystal": [["bcc"], ["diamond"], ["fcc"], ["sc"]],
-    }
-
-    inputs = {
-        "model": model,
-        "crystal": crystal,
-        "species": species,
-        "units": units,
-        "temperature": temperature,
-        "temperature_units": temperature_units,
-        "temperature_tol": temperature_tol,
-        "pressure": pressure,
-        "pressure_units": pressure_units,
-        "pressure_tol": pressure_tol,
-        "method": method,
-    }
-
-    # Check that all input args are lists, and that each list contains only a single data
-    # type.  We won't bother checking that test, model, etc only contain 1 element
-    helpers.check_input_args_are_lists(inputs)
-
-    # Check for uniformity of data types in lists that can have multiple elements
-    helpers.check_types_in_input_arg("species", species, str)
-    helpers.check_types_in_input_arg("temperature", temperature, (float, int))
-    helpers.check_types_in_input_arg("temperature_tol", temperature_tol, (float, int))
-    helpers.check_types_in_input_arg("pressure", pressure, (float, int))
-    helpers.check_types_in_input_arg("pressure_tol", pressure_tol, (float, int))
-
-    # Check if synonym was given for method and, if so, map it to a TD shortcode
-    method = helpers.process_method(method_synonyms, method)
-    inputs["method"] = method
-
-    # Enforce any restrictions on allowed argument values
-    helpers.check_args_allowed_values(allowed_values, inputs)
-
-    # Pull scalar values out of lists
-    model = model[0]
-    crystal = crystal[0]
-    units = units[0]
-    temperature = temperature[0]
-    temperature_units = temperature_units[0]
-    temperature_tol = temperature_tol[0]
-    pressure = pressure[0]
-    pressure_units = pressure_units[0]
-    pressure_tol = pressure_tol[0]
-    method = method[0]
-
-    # Start with basic test result dict as query
-    query = helpers.initialize_test_result_query()
-
-    # Define the property short name we're looking for
-    prop = "linear-thermal-expansion-coefficient-cubic-crystal-npt"
-    query["query"]["property-id"] = {}
-    query["query"]["property-id"]["$regex"] = (
-        "^tag:[^A-Z+]+@[^A-Z+]+,[0-9]{4}-[0-9]{2}-[0-9]{2}:property/" + prop + "$"
-    )
-
-    # Also require that the short-name array contain the specified crystal
-    query["query"]["short-name.source-value"] = crystal
-
-    # The "fields" specify what is returned by the query.  This will include the keys specified
-    # by the user, as well as some fields which are used by this function to perform sorting
-    query["fields"]["linear-thermal-expansion-coefficient"] = 1
-    query["fields"]["temperature"] = 1
-    query["fields"]["cauchy-stress"] = 1
-
-    # Add filters to query based on the method selected.  This will ensure that all of
-    # the results we get back will be for the indicated Test Driver (or its lineage, if
-    # no version was specified).  However, note that there may still be multiple
-    # versions of a given Test that use the same driver, so we still need to sort on
-    # that in any case -- this is done further below.
-    helpers.modify_query_for_item(query, "runner.driver", method)
-    helpers.modify_query_for_item(query, "subject", model)
-
-    helpers.modify_query_for_species(query, species)
-
-    # Perform the actual query
-    for key in query:
-        query[key] = dumps(query[key])
-    results_from_query = api_v0(
-        db, query, origin="get_linear_thermal_expansion_coefficient_cubic"
+    return SIMPLIFIED_QUERIES["get_linear_thermal_expansion_coefficient_cubic"].run(
+        db, locals()
     )
 
-    if len(results_from_query) == 0:
-        return []
-    else:
-        # Only pull out the results for the latest test driver version, test version, model
-        # version, and timestamp.  Discard errors.
-        results_from_query = helpers.filter_on_item_versions_and_timestamp(
-            results_from_query
-        )
-
-        if len(results_from_query) == 0:
-            return []
-
-        final_TestResults = helpers.filter_on_temperature_and_pressure(
-            results_from_query,
-            temperature,
-            temperature_units,
-            temperature_tol,
-            pressure,
-            pressure_units,
-            pressure_tol,
-        )
-
-        if len(final_TestResults) == 0:
-            return []
-        else:
-            alpha = helpers.extract_key_from_result(
-                final_TestResults[0], "linear-thermal-expansion-coefficient", units
-            )
-            return [alpha]
-
 
 def get_intrinsic_stacking_fault_relaxed_energy_fcc(
     db,
@@ -2306,125 +1739,35 @@ def get_intrinsic_stacking_fault_relaxed_energy_fcc(
     pressure_tol : array containing one float, optional
         Indicates a tolerance within which the query results must match the
         pressure specified in the given pressure units.  For example, if
-        pressure_tol=0.1, pressure=0.101325, pressure_units="MPa", then results
-        retrieved by the query must be computed at a pressure of 0.101325 +/-
-        0.1 MPa.  If multiple matching results are found, an error is returned.
-        (Default: 0.1)
-
-    method : array containing one double-quoted string, optional
-        The algorithm used to relax the atomic positions in order to compute
-        the relaxed intrinsic stacking fault energy for a given lattice
-        constant.  Currently allowed values are:
-
-      |-----------------------------------+----------------------------------------------------------|
-      | Allowed values                    | Description                                              |
-      |-----------------------------------|----------------------------------------------------------|
-      | "TD_228501831190" \| "relaxation" | Polak-Ribiere conjugate gradient minimization. (default) |
-      |-----------------------------------+----------------------------------------------------------|
-      {:class="table table-bordered"}
-      {:style="width:70%; margin-left:20px;"}
-      {:.table-striped}
-
-    Returns
-    -------
-    [intrinsic_stacking_fault_energy] : array containing one float
-        The relaxed intrinsic stacking fault energy of the monoatomic FCC
-        crystal in the requested units.
-
-    """
-    method_synonyms = {"relaxation": "TD_228501831190"}
-
-    allowed_values = {"method": [["TD_228501831190"]]}
-
-    inputs = {
-        "model": model,
-        "species": species,
-        "units": units,
-        "pressure": pressure,
-        "pressure_units": pressure_units,
-        "pressure_tol": pressure_tol,
-        "method": method,
-    }
-
-    # Check that all input args are lists, and that each list contains only a single data
-    # type.  We won't bother checking that test, model, etc only contain 1 element
-    helpers.check_input_args_are_lists(inputs)
-
-    # Check for uniformity of data types in lists that can have multiple elements
-    helpers.check_types_in_input_arg("species", species, str)
-    helpers.check_types_in_input_arg("pressure", pressure, (float, int))
-    helpers.check_types_in_input_arg("pressure_tol", pressure_tol, (float, int))
-
-    # Check if synonym was given for method and, if so, map it to a TD shortcode
-    method = helpers.process_method(method_synonyms, method)
-    inputs["method"] = method
-
-    # Enforce any restrictions on allowed argument values
-    helpers.check_args_allowed_values(allowed_values, inputs)
-
-    # Pull scalar values out of lists
-    model = model[0]
-    units = units[0]
-    pressure = pressure[0]
-    pressure_units = pressure_units[0]
-    pressure_tol = pressure_tol[0]
-    method = method[0]
-
-    # Start with basic test result dict as query
-    query = helpers.initialize_test_result_query()
-
-    # Define the property short name we're looking for
-    prop = "intrinsic-stacking-fault-relaxed-energy-fcc-crystal-npt"
-    query["query"]["property-id"] = {}
-    query["query"]["property-id"]["$regex"] = (
-        "^tag:[^A-Z+]+@[^A-Z+]+,[0-9]{4}-[0-9]{2}-[0-9]{2}:property/" + prop + "$"
-    )
-
-    # The "fields" specify what is returned by the query.  This will include the keys specified
-    # by the user, as well as some fields which are used by this function to perform sorting
-    query["fields"]["intrinsic-stacking-fault-energy"] = 1
-    query["fields"]["cauchy-stress"] = 1
-
-    # Add filters to query based on the method selected.  This will ensure that all of
-    # the results we get back will be for the indicated Test Driver (or its lineage, if
-    # no version was specified).  However, note that there may still be multiple
-    # versions of a given Test that use the same driver, so we still need to sort on
-    # that in any case -- this is done further below.
-    helpers.modify_query_for_item(query, "runner.driver", method)
-    helpers.modify_query_for_item(query, "subject", model)
-
-    helpers.modify_query_for_species(query, species)
-
-    # Perform the actual query
-    for key in query:
-        query[key] = dumps(query[key])
-    results_from_query = api_v0(
-        db, query, origin="get_intrinsic_stacking_fault_relaxed_energy_fcc"
-    )
+        pressure_tol=0.1, pressure=0.101325, pressure_units="MPa", then results
+        retrieved by the query must be computed at a pressure of 0.101325 +/-
+        0.1 MPa.  If multiple matching results are found, an error is returned.
+        (Default: 0.1)
 
-    if len(results_from_query) == 0:
-        return []
-    else:
-        # Only pull out the results for the latest test driver version, test version, model
-        # version, and timestamp.  Discard errors.
-        results_from_query = helpers.filter_on_item_versions_and_timestamp(
-            results_from_query
-        )
+    method : array containing one double-quoted string, optional
+        The algorithm used to relax the atomic positions in order to compute
+        the relaxed intrinsic stacking fault energy for a given lattice
+        constant.  Currently allowed values are:
 
-        if len(results_from_query) == 0:
-            return []
+      |-----------------------------------+----------------------------------------------------------|
+      | Allowed values                    | Description                                              |
+      |-----------------------------------|----------------------------------------------------------|
+      | "TD_228501831190" \| "relaxation" | Polak-Ribiere conjugate gradient minimization. (default) |
+      |-----------------------------------+----------------------------------------------------------|
+      {:class="table table-bordered"}
+      {:style="width:70%; margin-left:20px;"}
+      {:.table-striped}
 
-        final_TestResults = helpers.filter_on_pressure(
-            results_from_query, pressure, pressure_units, pressure_tol
-        )
+    Returns
+    -------
+    [intrinsic_stacking_fault_energy] : array containing one float
+        The relaxed intrinsic stacking fault energy of the monoatomic FCC
+        crystal in the requested units.
 
-        if len(final_TestResults) == 0:
-            return []
-        else:
-            intrinsic_stacking_fault_energy = helpers.extract_key_from_result(
-                final_TestResults[0], "intrinsic-stacking-fault-energy", units
-            )
-            return [intrinsic_stacking_fault_energy]
+    """
+    return SIMPLIFIED_QUERIES["get_intrinsic_stacking_fault_relaxed_energy_fcc"].run(
+        db, locals()
+    )
 
 
 def get_extrinsic_stacking_fault_relaxed_energy_fcc(
@@ -2522,100 +1865,10 @@ def get_extrinsic_stacking_fault_relaxed_energy_fcc(
         crystal in the requested units.
 
     """
-    method_synonyms = {"relaxation": "TD_228501831190"}
-
-    allowed_values = {"method": [["TD_228501831190"]]}
-
-    inputs = {
-        "model": model,
-        "species": species,
-        "units": units,
-        "pressure": pressure,
-        "pressure_units": pressure_units,
-        "pressure_tol": pressure_tol,
-        "method": method,
-    }
-
-    # Check that all input args are lists, and that each list contains only a single data
-    # type.  We won't bother checking that test, model, etc only contain 1 element
-    helpers.check_input_args_are_lists(inputs)
-
-    # Check for uniformity of data types in lists that can have multiple elements
-    helpers.check_types_in_input_arg("species", species, str)
-    helpers.check_types_in_input_arg("pressure", pressure, (float, int))
-    helpers.check_types_in_input_arg("pressure_tol", pressure_tol, (float, int))
-
-    # Check if synonym was given for method and, if so, map it to a TD shortcode
-    method = helpers.process_method(method_synonyms, method)
-    inputs["method"] = method
-
-    # Enforce any restrictions on allowed argument values
-    helpers.check_args_allowed_values(allowed_values, inputs)
-
-    # Pull scalar values out of lists
-    model = model[0]
-    units = units[0]
-    pressure = pressure[0]
-    pressure_units = pressure_units[0]
-    pressure_tol = pressure_tol[0]
-    method = method[0]
-
-    # Start with basic test result dict as query
-    query = helpers.initialize_test_result_query()
-
-    # Define the property short name we're looking for
-    prop = "extrinsic-stacking-fault-relaxed-energy-fcc-crystal-npt"
-    query["query"]["property-id"] = {}
-    query["query"]["property-id"]["$regex"] = (
-        "^tag:[^A-Z+]+@[^A-Z+]+,[0-9]{4}-[0-9]{2}-[0-9]{2}:property/" + prop + "$"
-    )
-
-    # The "fields" specify what is returned by the query.  This will include the keys specified
-    # by the user, as well as some fields which are used by this function to perform sorting
-    query["fields"]["extrinsic-stacking-fault-energy"] = 1
-    query["fields"]["cauchy-stress"] = 1
-
-    # Add filters to query based on the method selected.  This will ensure that all of
-    # the results we get back will be for the indicated Test Driver (or its lineage, if
-    # no version was specified).  However, note that there may still be multiple
-    # versions of a given Test that use the same driver, so we still need to sort on
-    # that in any case -- this is done further below.
-    helpers.modify_query_for_item(query, "runner.driver", method)
-    helpers.modify_query_for_item(query, "subject", model)
-
-    helpers.modify_query_for_species(query, species)
-
-    # Perform the actual query
-    for key in query:
-        query[key] = dumps(query[key])
-    results_from_query = api_v0(
-        db, query, origin="get_extrinsic_stacking_fault_relaxed_energy_fcc"
+    return SIMPLIFIED_QUERIES["get_extrinsic_stacking_fault_relaxed_energy_fcc"].run(
+        db, locals()
     )
 
-    if len(results_from_query) == 0:
-        return []
-    else:
-        # Only pull out the results for the latest test driver version, test version, model
-        # version, and timestamp.  Discard errors.
-        results_from_query = helpers.filter_on_item_versions_and_timestamp(
-            results_from_query
-        )
-
-        if len(results_from_query) == 0:
-            return []
-
-        final_TestResults = helpers.filter_on_pressure(
-            results_from_query, pressure, pressure_units, pressure_tol
-        )
-
-        if len(final_TestResults) == 0:
-            return []
-        else:
-            extrinsic_stacking_fault_energy = helpers.extract_key_from_result(
-                final_TestResults[0], "extrinsic-stacking-fault-energy", units
-            )
-            return [extrinsic_stacking_fault_energy]
-
 
 def get_unstable_stacking_fault_relaxed_energy_fcc(
     db,
@@ -2713,100 +1966,10 @@ def get_unstable_stacking_fault_relaxed_energy_fcc(
         crystal in the requested units.
 
     """
-    method_synonyms = {"relaxation": "TD_228501831190"}
-
-    allowed_values = {"method": [["TD_228501831190"]]}
-
-    inputs = {
-        "model": model,
-        "species": species,
-        "units": units,
-        "pressure": pressure,
-        "pressure_units": pressure_units,
-        "pressure_tol": pressure_tol,
-        "method": method,
-    }
-
-    # Check that all input args are lists, and that each list contains only a single data
-    # type.  We won't bother checking that test, model, etc only contain 1 element
-    helpers.check_input_args_are_lists(inputs)
-
-    # Check for uniformity of data types in lists that can have multiple elements
-    helpers.check_types_in_input_arg("species", species, str)
-    helpers.check_types_in_input_arg("pressure", pressure, (float, int))
-    helpers.check_types_in_input_arg("pressure_tol", pressure_tol, (float, int))
-
-    # Check if synonym was given for method and, if so, map it to a TD shortcode
-    method = helpers.process_method(method_synonyms, method)
-    inputs["method"] = method
-
-    # Enforce any restrictions on allowed argument values
-    helpers.check_args_allowed_values(allowed_values, inputs)
-
-    # Pull scalar values out of lists
-    model = model[0]
-    units = units[0]
-    pressure = pressure[0]
-    pressure_units = pressure_units[0]
-    pressure_tol = pressure_tol[0]
-    method = method[0]
-
-    # Start with basic test result dict as query
-    query = helpers.initialize_test_result_query()
-
-    # Define the property short name we're looking for
-    prop = "unstable-stacking-fault-relaxed-energy-fcc-crystal-npt"
-    query["query"]["property-id"] = {}
-    query["query"]["property-id"]["$regex"] = (
-        "^tag:[^A-Z+]+@[^A-Z+]+,[0-9]{4}-[0-9]{2}-[0-9]{2}:property/" + prop + "$"
-    )
-
-    # The "fields" specify what is returned by the query.  This will include the keys specified
-    # by the user, as well as some fields which are used by this function to perform sorting
-    query["fields"]["unstable-stacking-energy"] = 1
-    query["fields"]["cauchy-stress"] = 1
-
-    # Add filters to query based on the method selected.  This will ensure that all of
-    # the results we get back will be for the indicated Test Driver (or its lineage, if
-    # no version was specified).  However, note that there may still be multiple
-    # versions of a given Test that use the same driver, so we still need to sort on
-    # that in any case -- this is done further below.
-    helpers.modify_query_for_item(query, "runner.driver", method)
-    helpers.modify_query_for_item(query, "subject", model)
-
-    helpers.modify_query_for_species(query, species)
-
-    # Perform the actual query
-    for key in query:
-        query[key] = dumps(query[key])
-    results_from_query = api_v0(
-        db, query, origin="get_unstable_stacking_fault_relaxed_energy_fcc"
+    return SIMPLIFIED_QUERIES["get_unstable_stacking_fault_relaxed_energy_fcc"].run(
+        db, locals()
     )
 
-    if len(results_from_query) == 0:
-        return []
-    else:
-        # Only pull out the results for the latest test driver version, test version, model
-        # version, and timestamp.  Discard errors.
-        results_from_query = helpers.filter_on_item_versions_and_timestamp(
-            results_from_query
-        )
-
-        if len(results_from_query) == 0:
-            return []
-
-        final_TestResults = helpers.filter_on_pressure(
-            results_from_query, pressure, pressure_units, pressure_tol
-        )
-
-        if len(final_TestResults) == 0:
-            return []
-        else:
-            unstable_stacking_fault_energy = helpers.extract_key_from_result(
-                final_TestResults[0], "unstable-stacking-energy", units
-            )
-            return [unstable_stacking_fault_energy]
-
 
 def get_unstable_twinning_fault_relaxed_energy_fcc(
     db,
@@ -2905,100 +2068,10 @@ def get_unstable_twinning_fault_relaxed_energy_fcc(
         crystal in the requested units.
 
     """
-    method_synonyms = {"relaxation": "TD_228501831190"}
-
-    allowed_values = {"method": [["TD_228501831190"]]}
-
-    inputs = {
-        "model": model,
-        "species": species,
-        "units": units,
-        "pressure": pressure,
-        "pressure_units": pressure_units,
-        "pressure_tol": pressure_tol,
-        "method": method,
-    }
-
-    # Check that all input args are lists, and that each list contains only a single data
-    # type.  We won't bother checking that test, model, etc only contain 1 element
-    helpers.check_input_args_are_lists(inputs)
-
-    # Check for uniformity of data types in lists that can have multiple elements
-    helpers.check_types_in_input_arg("species", species, str)
-    helpers.check_types_in_input_arg("pressure", pressure, (float, int))
-    helpers.check_types_in_input_arg("pressure_tol", pressure_tol, (float, int))
-
-    # Check if synonym was given for method and, if so, map it to a TD shortcode
-    method = helpers.process_method(method_synonyms, method)
-    inputs["method"] = method
-
-    # Enforce any restrictions on allowed argument values
-    helpers.check_args_allowed_values(allowed_values, inputs)
-
-    # Pull scalar values out of lists
-    model = model[0]
-    units = units[0]
-    pressure = pressure[0]
-    pressure_units = pressure_units[0]
-    pressure_tol = pressure_tol[0]
-    method = method[0]
-
-    # Start with basic test result dict as query
-    query = helpers.initialize_test_result_query()
-
-    # Define the property short name we're looking for
-    prop = "unstable-twinning-fault-relaxed-energy-fcc-crystal-npt"
-    query["query"]["property-id"] = {}
-    query["query"]["property-id"]["$regex"] = (
-        "^tag:[^A-Z+]+@[^A-Z+]+,[0-9]{4}-[0-9]{2}-[0-9]{2}:property/" + prop + "$"
-    )
-
-    # The "fields" specify what is returned by the query.  This will include the keys specified
-    # by the user, as well as some fields which are used by this function to perform sorting
-    query["fields"]["unstable-twinning-energy"] = 1
-    query["fields"]["cauchy-stress"] = 1
-
-    # Add filters to query based on the method selected.  This will ensure that all of
-    # the results we get back will be for the indicated Test Driver (or its lineage, if
-    # no version was specified).  However, note that there may still be multiple
-    # versions of a given Test that use the same driver, so we still need to sort on
-    # that in any case -- this is done further below.
-    helpers.modify_query_for_item(query, "runner.driver", method)
-    helpers.modify_query_for_item(query, "subject", model)
-
-    helpers.modify_query_for_species(query, species)
-
-    # Perform the actual query
-    for key in query:
-        query[key] = dumps(query[key])
-    results_from_query = api_v0(
-        db, query, origin="get_unstable_twinning_fault_relaxed_energy_fcc"
+    return SIMPLIFIED_QUERIES["get_unstable_twinning_fault_relaxed_energy_fcc"].run(
+        db, locals()
     )
 
-    if len(results_from_query) == 0:
-        return []
-    else:
-        # Only pull out the results for the latest test driver version, test version, model
-        # version, and timestamp.  Discard errors.
-        results_from_query = helpers.filter_on_item_versions_and_timestamp(
-            results_from_query
-        )
-
-        if len(results_from_query) == 0:
-            return []
-
-        final_TestResults = helpers.filter_on_pressure(
-            results_from_query, pressure, pressure_units, pressure_tol
-        )
-
-        if len(final_TestResults) == 0:
-            return []
-        else:
-            unstable_twinning_fault_energy = helpers.extract_key_from_result(
-                final_TestResults[0], "unstable-twinning-energy", units
-            )
-            return [unstable_twinning_fault_energy]
-
 
 def get_surface_energy_ideal_cubic(
     db, model, crystal, species, miller, units, method=["TD_955413365818"]
@@ -3076,97 +2149,7 @@ def get_surface_energy_ideal_cubic(
         The ideal surface energy in the requested units.
 
     """
-    method_synonyms = {}
-
-    allowed_values = {
-        "method": [["TD_955413365818"]],
-        "miller": [[1, 0, 0], [1, 1, 0], [1, 1, 1], [1, 2, 1]],
-        "crystal": [["bcc"], ["diamond"], ["fcc"], ["sc"]],
-    }
-
-    inputs = {
-        "model": model,
-        "crystal": crystal,
-        "species": species,
-        "units": units,
-        "miller": miller,
-        "method": method,
-    }
-
-    # Check that all input args are lists, and that each list contains only a single data
-    # type.  We won't bother checking that test, model, etc only contain 1 element
-    helpers.check_input_args_are_lists(inputs)
-
-    # Check for uniformity of data types in lists that can have multiple elements
-    helpers.check_types_in_input_arg("species", species, str)
-    helpers.check_types_in_input_arg("miller", miller, int)
-
-    # Check if synonym was given for method and, if so, map it to a TD shortcode
-    method = helpers.process_method(method_synonyms, method)
-    inputs["method"] = method
-
-    # Enforce any restrictions on allowed argument values
-    helpers.check_args_allowed_values(allowed_values, inputs)
-
-    # Pull scalar values out of lists
-    model = model[0]
-    crystal = crystal[0]
-    units = units[0]
-    method = method[0]
-
-    # Start with basic test result dict as query
-    query = helpers.initialize_test_result_query()
-
-    # Define the property short name we're looking for
-    prop = "surface-energy-ideal-cubic-crystal"
-    query["query"]["property-id"] = {}
-    query["query"]["property-id"]["$regex"] = (
-        "^tag:[^A-Z+]+@[^A-Z+]+,[0-9]{4}-[0-9]{2}-[0-9]{2}:property/" + prop + "$"
-    )
-
-    # Also require that the short-name array contain the specified crystal
-    query["query"]["short-name.source-value"] = crystal
-
-    # TODO: Make this a function ('match_on_array'?) since this is easily overlooked and
-    # won't easily be debugged
-    query["query"]["miller-indices.source-value"] = {}
-    query["query"]["miller-indices.source-value"]["$eq"] = miller
-
-    # The "fields" specify what is returned by the query.  This will include the keys specified
-    # by the user, as well as some fields which are used by this function to perform sorting
-    query["fields"]["ideal-surface-energy"] = 1
-
-    # Add filters to query based on the method selected.  This will ensure that all of
-    # the results we get back will be for the indicated Test Driver (or its lineage, if
-    # no version was specified).  However, note that there may still be multiple
-    # versions of a given Test that use the same driver, so we still need to sort on
-    # that in any case -- this is done further below.
-    helpers.modify_query_for_item(query, "runner.driver", method)
-    helpers.modify_query_for_item(query, "subject", model)
-
-    helpers.modify_query_for_species(query, species)
-
-    # Perform the actual query
-    for key in query:
-        query[key] = dumps(query[key])
-    results_from_query = api_v0(db, query, origin="get_surface_energy_ideal_cubic")
-
-    if len(results_from_query) == 0:
-        return []
-    else:
-        # Only pull out the results for the latest test driver version, test version, model
-        # version, and timestamp.  Discard errors.
-        results_from_query = helpers.filter_on_item_versions_and_timestamp(
-            results_from_query
-        )
-
-        if len(results_from_query) == 0:
-            return []
-
-        ideal_surface_energy = helpers.extract_key_from_result(
-            results_from_query[0], "ideal-surface-energy", units
-        )
-        return [ideal_surface_energy]
+    return SIMPLIFIED_QUERIES["get_surface_energy_ideal_cubic"].run(db, locals())
 
 
 def get_surface_energy_relaxed_cubic(
@@ -3293,127 +2276,7 @@ def get_surface_energy_relaxed_cubic(
         The relaxed surface energy in the requested units.
 
     """
-    method_synonyms = {"fire": "TD_955413365818"}
-
-    allowed_values = {
-        "method": [["TD_955413365818"]],
-        "miller": [[1, 0, 0], [1, 1, 0], [1, 1, 1], [1, 2, 1]],
-        "crystal": [["bcc"], ["diamond"], ["fcc"], ["sc"]],
-    }
-
-    inputs = {
-        "model": model,
-        "crystal": crystal,
-        "species": species,
-        "units": units,
-        "miller": miller,
-        "temperature_units": temperature_units,
-        "temperature_tol": temperature_tol,
-        "pressure": pressure,
-        "pressure_units": pressure_units,
-        "pressure_tol": pressure_tol,
-        "method": method,
-    }
-
-    # Check that all input args are lists, and that each list contains only a single data
-    # type.  We won't bother checking that test, model, etc only contain 1 element
-    helpers.check_input_args_are_lists(inputs)
-
-    # Check for uniformity of data types in lists that can have multiple elements
-    helpers.check_types_in_input_arg("species", species, str)
-    helpers.check_types_in_input_arg("miller", miller, int)
-    helpers.check_types_in_input_arg("temperature", temperature, (float, int))
-    helpers.check_types_in_input_arg("temperature_tol", temperature_tol, (float, int))
-    helpers.check_types_in_input_arg("pressure", pressure, (float, int))
-    helpers.check_types_in_input_arg("pressure_tol", pressure_tol, (float, int))
-
-    # Check if synonym was given for method and, if so, map it to a TD shortcode
-    method = helpers.process_method(method_synonyms, method)
-    inputs["method"] = method
-
-    # Enforce any restrictions on allowed argument values
-    helpers.check_args_allowed_values(allowed_values, inputs)
-
-    # Pull scalar values out of lists
-    model = model[0]
-    crystal = crystal[0]
-    units = units[0]
-    temperature = temperature[0]
-    temperature_units = temperature_units[0]
-    temperature_tol = temperature_tol[0]
-    pressure = pressure[0]
-    pressure_units = pressure_units[0]
-    pressure_tol = pressure_tol[0]
-    method = method[0]
-
-    # Start with basic test result dict as query
-    query = helpers.initialize_test_result_query()
-
-    # Define the property short name we're looking for
-    prop = "surface-energy-cubic-crystal-npt"
-    query["query"]["property-id"] = {}
-    query["query"]["property-id"]["$regex"] = (
-        "^tag:[^A-Z+]+@[^A-Z+]+,[0-9]{4}-[0-9]{2}-[0-9]{2}:property/" + prop + "$"
-    )
-
-    # Also require that the short-name array contain the specified crystal
-    query["query"]["short-name.source-value"] = crystal
-
-    # TODO: Make this a function ('match_on_array'?) since this is easily overlooked and
-    # won't easily be debugged
-    query["query"]["miller-indices.source-value"] = {}
-    query["query"]["miller-indices.source-value"]["$eq"] = miller
-
-    # The "fields" specify what is returned by the query.  This will include the keys specified
-    # by the user, as well as some fields which are used by this function to perform sorting
-    query["fields"]["surface-energy"] = 1
-    query["fields"]["temperature"] = 1
-    query["fields"]["cauchy-stress"] = 1
-
-    # Add filters to query based on the method selected.  This will ensure that all of
-    # the results we get back will be for the indicated Test Driver (or its lineage, if
-    # no version was specified).  However, note that there may still be multiple
-    # versions of a given Test that use the same driver, so we still need to sort on
-    # that in any case -- this is done further below.
-    helpers.modify_query_for_item(query, "runner.driver", method)
-    helpers.modify_query_for_item(query, "subject", model)
-
-    helpers.modify_query_for_species(query, species)
-
-    # Perform the actual query
-    for key in query:
-        query[key] = dumps(query[key])
-    results_from_query = api_v0(db, query, origin="get_surface_energy_relaxed_cubic")
-
-    if len(results_from_query) == 0:
-        return []
-    else:
-        # Only pull out the results for the latest test driver version, test version, model
-        # version, and timestamp.  Discard errors.
-        results_from_query = helpers.filter_on_item_versions_and_timestamp(
-            results_from_query
-        )
-
-        if len(results_from_query) == 0:
-            return []
-
-        final_TestResults = helpers.filter_on_temperature_and_pressure(
-            results_from_query,
-            temperature,
-            temperature_units,
-            temperature_tol,
-            pressure,
-            pressure_units,
-            pressure_tol,
-        )
-
-        if len(final_TestResults) == 0:
-            return []
-        else:
-            relaxed_surface_energy = helpers.extract_key_from_result(
-                final_TestResults[0], "surface-energy", units
-            )
-            return [relaxed_surface_energy]
+    return SIMPLIFIED_QUERIES["get_surface_energy_relaxed_cubic"].run(db, locals())
 
 
 def get_test_result(db, test, model, prop, keys, units):
@@ -3471,15 +2334,12 @@ def get_test_result(db, test, model, prop, keys, units):
     RE_PROPERTY_SHORT_NAME = r"^[a-z-]+$"
 
     # Determine whether a full property-id with a contributor and date was given, or only the
-    # property short name.  If the full property-id was given, query on it exactly.  If not, do a
-    # regex on it
+    # property short name.  If the full property-id was given, query on it exactly.  If not,
+    # query on the property short name stored alongside it
     if re.match(RE_PROPERTY_ID, prop) is not None:
         query["query"]["property-id"] = prop
     elif re.match(RE_PROPERTY_SHORT_NAME, prop) is not None:
-        query["query"]["property-id"] = {}
-        query["query"]["property-id"]["$regex"] = (
-            "^tag:[^A-Z+]+@[^A-Z+]+,[0-9]{4}-[0-9]{2}-[0-9]{2}:property/" + prop + "$"
-        )
+        query["query"]["property-short-name"] = prop
     else:
         raise ValueError(
             "Invalid property name was passed to function get_test_result()"
@@ -3490,9 +2350,7 @@ def get_test_result(db, test, model, prop, keys, units):
     helpers.modify_query_for_item(query, "subject", model)
 
     # Perform the actual query
-    for key in query:
-        query[key] = dumps(query[key])
-    results_from_query = api_v0(db, query, origin="get_test_result")
+    results_from_query = api_v0_native(db, query, origin="get_test_result")
 
     if len(results_from_query) == 0:
         return []
@@ -3579,9 +2437,6 @@ def get_reference_data(db, ref_data, species, prop, keys, units):
     RE_PROPERTY_ID = (
         r"^tag:[^A-Z+]+@[^A-Z+]+,[0-9]{4}-[0-9]{2}-[0-9]{2}:property\/[a-z-]+$"
     )
-    RE_PROPERTY_ID_GROUPED = (
-        r"^tag:([^A-Z+]+@[^A-Z+]+),([0-9]{4}-[0-9]{2}-[0-9]{2}):property\/([a-z-]+)$"
-    )
     RE_PROPERTY_SHORT_NAME = r"^[a-z-]+$"
 
     # Check to ensure required keyword values were given and of the correct type
@@ -3645,17 +2500,15 @@ def get_reference_data(db, ref_data, species, prop, keys, units):
         )
 
     # Determine whether a full property-id with a contributor and date was given, or only the
-    # property short name.  If the full property-id was given, query on it exactly.  If not, do a
-    # regex on it and sort the results from the most recent property-id date to the oldest.  Note
+    # property short name.  If the full property-id was given, query on it exactly.  If not,
+    # query on the property short name stored alongside it and sort the results from the most
+    # recent property-id date to the oldest.  Note
     # that sorting on Reference Data version takes priority over the sorting on property-id.
     if re.match(RE_PROPERTY_ID, prop) is not None:
         query["query"]["property-id"] = prop
         prop_has_ver = True
     elif re.match(RE_PROPERTY_SHORT_NAME, prop) is not None:
-        query["query"]["property-id"] = {}
-        query["query"]["property-id"]["$regex"] = (
-            "^tag:[^A-Z+]+@[^A-Z+]+,[0-9]{4}-[0-9]{2}-[0-9]{2}:property/" + prop + "$"
-        )
+        query["query"]["property-short-name"] = prop
     else:
         raise Exception(
             "Invalid property name was passed to function get_reference_data()"
@@ -3687,6 +2540,7 @@ def get_reference_data(db, ref_data, species, prop, keys, units):
         # by the user, as well as some fields which are used by this function to perform sorting
         query["fields"] = dict(zip(keys, [1] * len(keys)))
         query["fields"]["property-id"] = 1
+        query["fields"]["property-date"] = 1
         query["fields"]["meta.short-id"] = 1
 
     if units is None:
@@ -3719,16 +2573,7 @@ def get_reference_data(db, ref_data, species, prop, keys, units):
                     )
 
     # Perform the actual query
-    for key in query:
-        query[key] = dumps(query[key])
-    results_from_query = api_v0(db, query, origin="get_reference_data")
-
-    def sort_on_property_date(results_from_query):
-        return sorted(
-            results_from_query,
-            key=lambda k: re.search(RE_PROPERTY_ID_GROUPED, k["property-id"]).groups(1),
-            reverse=True,
-        )
+    results_from_query = api_v0_native(db, query, origin="get_reference_data")
 
     # Always make this a list, even if it will only contain one element.  This is simply done for
     # consistency and simplicity
@@ -3740,7 +2585,9 @@ def get_reference_data(db, ref_data, species, prop, keys, units):
         if ref_data_provided:
             if not prop_has_ver:
                 # sort on date string of prop
-                final_RefData.append(sort_on_property_date(results_from_query)[0])
+                final_RefData.append(
+                    helpers.sort_on_property_date(results_from_query)[0]
+                )
             else:
                 # No sorting necessary, but make sure to only take one result since there could be
                 # duplicates lurking in the database for old versions
@@ -3770,7 +2617,7 @@ def get_reference_data(db, ref_data, species, prop, keys, units):
                             if propinstance["meta.short-id"] == RD_family
                         ]
                         # Take the most recent property version
-                        final_RefData.append(sort_on_property_date(tmp)[0])
+                        final_RefData.append(helpers.sort_on_property_date(tmp)[0])
                 else:
                     # As directly above, we should only have the latest version from each RD family,
                     # but now we also know that we only have a specific property version in all of
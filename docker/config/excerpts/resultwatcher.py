@@ -0,0 +1,178 @@
+"""
+Watches the Test Result, Verification Result, and Error directories of the
+local repository and inserts any results or errors which appear in them into
+the local database.  This allows results that were not produced by one of the
+pipeline-run-* utilities of this container (e.g. ones which were copied into
+the local repository or produced by another container sharing it) to be
+ingested without rebuilding the database.
+
+Result directories are written non-atomically, so a directory is only inserted
+once it contains a kimspec.edn file and none of its files have been modified
+for a settling period.  Directories that become ready together are inserted as
+a single batch, with the 'latest' tags of each affected lineage pair updated
+only once per batch.  Each batch is inserted while holding the lock of the
+local database (see mongodb.database_lock), after checking which of its results
+and errors the database already holds, so that watching is idempotent even
+while other processes, such as the pipeline-run-* utilities, insert results at
+the same time.
+
+If the inotify_simple package is available, changes are picked up via inotify
+as soon as they occur; otherwise, the directories are polled periodically.
+
+Copyright (c) 2014-2022, Regents of the University of Minnesota. All rights
+reserved.
+
+This software may be distributed as-is, without modification.
+"""
+
+import os
+import time
+
+from . import config as cf
+from . import mongodb
+
+try:
+    from inotify_simple import INotify, flags
+except ImportError:
+    INotify = None
+
+WATCHED_LEADERS = ("tr", "vr", "er")
+
+
+class ResultWatcher:
+    def __init__(self, settle=2.0, batch_size=100, poll_interval=5.0, poll=False):
+        """
+        Parameters
+        ----------
+        settle : float
+            Number of seconds that must have passed since any file in a result
+            directory was last modified before it is inserted
+        batch_size : int
+            Maximum number of results and errors inserted in a single batch
+        poll_interval : float
+            Number of seconds between scans of the result directories when
+            polling, which is also the longest time spent waiting for an
+            inotify event
+        poll : bool
+            Poll the result directories even if inotify is available
+        """
+        self.settle = settle
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.use_inotify = INotify is not None and not poll
+
+        self.dirs = {
+            leader: os.path.join(cf.LOCAL_REPOSITORY_PATH, cf.item_subdir_names[leader])
+            for leader in WATCHED_LEADERS
+        }
+
+        # uuids already in the database or ingested by us
+        self.known = set()
+
+        # Result directories seen but not yet inserted, mapped to their leader
+        self.pending = {}
+
+    def scan(self):
+        """Register any result directories which are not yet in the database"""
+        for leader, path in self.dirs.items():
+            if not os.path.isdir(path):
+                continue
+            for name in os.listdir(path):
+                self.register(leader, name)
+
+    def register(self, leader, name):
+        """Mark a result directory for insertion unless it is already known"""
+        if name.startswith(".") or name in self.known:
+            return
+        if os.path.isdir(os.path.join(self.dirs[leader], name)):
+            self.pending[name] = leader
+
+    def last_modified(self, path):
+        """Return the most recent modification time of any file under `path`"""
+        latest = os.path.getmtime(path)
+        for root, _, files in os.walk(path):
+            for fl in files:
+                try:
+                    latest = max(latest, os.path.getmtime(os.path.join(root, fl)))
+                except OSError:
+                    # File was removed while we were walking the directory
+                    pass
+        return latest
+
+    def ready(self):
+        """
+        Return the pending result directories which are complete, as (leader,
+        uuid, full_result_path) tuples, and forget about any that have vanished
+        """
+        now = time.time()
+        ready = []
+        for uuid, leader in list(self.pending.items()):
+            path = os.path.join(self.dirs[leader], uuid)
+            if not os.path.isdir(path):
+                del self.pending[uuid]
+                continue
+            if not os.path.isfile(os.path.join(path, cf.CONFIG_FILE)):
+                continue
+            if now - self.last_modified(path) >= self.settle:
+                ready.append((leader, uuid, path))
+        return sorted(ready)
+
+    def ingest(self):
+        """Insert all pending result directories which are complete"""
+        ready = self.ready()
+        for start in range(0, len(ready), self.batch_size):
+            batch = ready[start : start + self.batch_size]
+            ninserted = mongodb.insert_result_batch(batch)
+            print(
+                "Inserted {} of {} new results and errors into local "
+                "database".format(ninserted, len(batch))
+            )
+            for _, uuid, _ in batch:
+                # Directories which failed to insert are not retried
+                self.known.add(uuid)
+                del self.pending[uuid]
+
+    def watch(self):
+        """Insert new results and errors as they appear until interrupted"""
+        self.known = mongodb.result_uuids()
+
+        inotify = None
+        if self.use_inotify:
+            inotify = INotify()
+            watch_flags = flags.CREATE | flags.MOVED_TO | flags.ONLYDIR
+            wds = {}
+            for leader, path in self.dirs.items():
+                os.makedirs(path, exist_ok=True)
+                wds[inotify.add_watch(path, watch_flags)] = leader
+            print("Watching {} using inotify".format(", ".join(self.dirs.values())))
+        else:
+            print("Polling {}".format(", ".join(self.dirs.values())))
+
+        # Pick up anything that appeared while we were not watching
+        self.scan()
+        last_scan = time.time()
+
+        try:
+            while True:
+                # Wake up early when there are directories waiting to settle
+                timeout = self.settle if self.pending else self.poll_interval
+
+                if inotify is not None:
+                    for event in inotify.read(timeout=int(timeout * 1000)):
+                        if event.name and event.wd in wds:
+                            self.register(wds[event.wd], event.name)
+                else:
+                    time.sleep(timeout)
+                    if time.time() - last_scan >= self.poll_interval:
+                        self.scan()
+                        last_scan = time.time()
+
+                if self.pending:
+                    self.ingest()
+
+        except KeyboardInterrupt:
+            print("Stopped watching")
+
+        finally:
+            if inotify is not None:
+                inotify.close()
@@ -0,0 +1,195 @@
+"""
+Storage of the large numeric arrays of Test Results in .npy sidecar files.
+
+Some property instances report arrays with hundreds of thousands of elements
+(e.g. atomic positions or phonon band structures) as their 'source-value' or
+'si-value'.  Rather than writing these out as EDN text, which is parsed and
+serialized again at every stage of the pipeline and stored as huge arrays in
+the local database, arrays with more than RESULT_ARRAY_SIDECAR_THRESHOLD
+elements can be saved to .npy files in the directory of the result (next to
+results.edn) and replaced in results.edn by a reference of the form
+
+    {"npy-file" "results-1-basis-atom-coordinates-si-value.npy"}
+
+The local database stores such references with the absolute path of the file
+and the query API only loads the array of a reference (through a memory map)
+when the key that holds it is returned by a query.  Note that queries cannot
+match on the contents of arrays stored this way.
+
+Copyright (c) 2014-2022, Regents of the University of Minnesota. All rights
+reserved.
+
+This software may be distributed as-is, without modification.
+"""
+
+import os
+import re
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from . import config as cf
+
+SIDECAR_KEY = "npy-file"
+
+# Fields of the keys of a property instance whose values may be stored in
+# sidecar files
+SIDECAR_FIELDS = ("source-value", "si-value")
+
+# Kinds of numpy arrays (bool, signed and unsigned integer, float) which are
+# stored in sidecar files
+SIDECAR_DTYPE_KINDS = "biuf"
+
+RE_UNSAFE_FILENAME_CHARACTERS = re.compile(r"[^A-Za-z0-9_.-]")
+
+
+def is_reference(o):
+    """Return whether `o` is a reference to an array stored in a sidecar file"""
+    return isinstance(o, dict) and len(o) == 1 and SIDECAR_KEY in o
+
+
+def _size(value):
+    """
+    Return the number of elements of the (nested) list `value`, assuming it is
+    rectangular
+    """
+    n = 1
+    while isinstance(value, list):
+        n *= len(value)
+        if not value:
+            break
+        value = value[0]
+    return n
+
+
+def _numeric_array(value, threshold):
+    """
+    Return `value` as a numpy array if it is a rectangular list of numbers with
+    more than `threshold` elements, otherwise None
+    """
+    if not isinstance(value, list) or _size(value) <= threshold:
+        return None
+    try:
+        arr = np.asarray(value)
+    except ValueError:
+        # Ragged nested lists
+        return None
+    if arr.dtype.kind not in SIDECAR_DTYPE_KINDS or arr.size <= threshold:
+        return None
+    return arr
+
+
+def store_arrays(doc, directory, threshold, prefix="results"):
+    """
+    Save the numeric arrays of the property instances of `doc` (a property
+    instance or a list of them) with more than `threshold` elements to .npy
+    files in `directory` and return a copy of `doc` in which they are replaced
+    by references to these files, given relative to `directory`.  If numpy is
+    not available, `doc` is returned unchanged.
+    """
+    if np is None or not threshold or threshold < 0:
+        return doc
+
+    instances = doc if isinstance(doc, list) else [doc]
+    stored = []
+    for i, instance in enumerate(instances, 1):
+        if not isinstance(instance, dict):
+            stored.append(instance)
+            continue
+
+        instance = dict(instance)
+        for key, value in list(instance.items()):
+            if not isinstance(value, dict):
+                continue
+            for field in SIDECAR_FIELDS:
+                arr = _numeric_array(value.get(field), threshold)
+                if arr is None:
+                    continue
+
+                filename = RE_UNSAFE_FILENAME_CHARACTERS.sub(
+                    "_", "{}-{}-{}-{}.npy".format(prefix, i, key, field)
+                )
+                np.save(os.path.join(directory, filename), arr, allow_pickle=False)
+                value = dict(value)
+                value[field] = {SIDECAR_KEY: filename}
+                instance[key] = value
+        stored.append(instance)
+
+    return stored if isinstance(doc, list) else stored[0]
+
+
+def absolute_references(o, directory):
+    """
+    Return a copy of `o` in which the paths of all references to sidecar files
+    are made absolute, taking relative ones to be relative to `directory`
+    """
+    if is_reference(o):
+        return {SIDECAR_KEY: os.path.join(os.path.abspath(directory), o[SIDECAR_KEY])}
+    if isinstance(o, dict):
+        return {k: absolute_references(v, directory) for k, v in o.items()}
+    if isinstance(o, list):
+        return [absolute_references(v, directory) for v in o]
+    return o
+
+
+def load_array(reference, directory=None):
+    """
+    Return the array of the sidecar file `reference` as a (nested) list.
+    Relative paths are taken to be relative to `directory`.
+    """
+    if np is None:
+        raise cf.PipelineResultsError(
+            "numpy is required to read the array stored in {}".format(
+                reference[SIDECAR_KEY]
+            )
+        )
+    path = reference[SIDECAR_KEY]
+    if directory is not None:
+        path = os.path.join(directory, path)
+    try:
+        return np.load(path, mmap_mode="r", allow_pickle=False).tolist()
+    except (OSError, ValueError) as e:
+        raise cf.PipelineResultsError(
+            "Could not read the array stored in {}: {}".format(path, e)
+        ) from e
+
+
+def _wanted(path, keys):
+    return keys is None or any(
+        path == key or path.startswith(key + ".") or key.startswith(path + ".")
+        for key in keys
+    )
+
+
+def load_arrays(o, directory=None, keys=None, _path=""):
+    """
+    Return `o` with the references to sidecar files that it contains replaced by
+    the arrays stored in them.  If `keys` (a list of dotted keys, as used for
+    projection) is given, only the references under these keys are loaded.
+    Containers that hold no loaded references are not copied.
+    """
+    if is_reference(o):
+        return load_array(o, directory) if _wanted(_path, keys) else o
+
+    if isinstance(o, dict):
+        out = o
+        for k, v in o.items():
+            path = _path + "." + k if _path else k
+            if not isinstance(v, (dict, list)) or not _wanted(path, keys):
+                continue
+            loaded = load_arrays(v, directory, keys, path)
+            if loaded is not v:
+                if out is o:
+                    out = dict(o)
+                out[k] = loaded
+        return out
+
+    if isinstance(o, list):
+        loaded = [load_arrays(v, directory, keys, _path) for v in o]
+        if any(a is not b for a, b in zip(loaded, o)):
+            return loaded
+        return o
+
+    return o
@@ -25,10 +25,13 @@ This software may be distributed as-is, without modification.
 """
 
 import os
+import hashlib
+import threading
 import jinja2
+import jinja2.meta
 import json
 import edn_format
-from functools import partial
+from functools import lru_cache, partial
 from copy import deepcopy
 
 from . import kimquery
@@ -36,6 +39,7 @@ from . import kimcodes
 from . import kimobjects
 from . import config as cf
 from . import util
+from .httpclient import get_client
 from .kimunits import convert
 
 
@@ -69,11 +73,36 @@ def stripversion(kim):
 jsondump = partial(json.dumps, indent=4)
 edndump = partial(edn_format.dumps)
 
+
 # -----------------------------------------
 # Jinja Stuff
 # -----------------------------------------
+class TemplateBytecodeCache(jinja2.FileSystemBytecodeCache):
+    """
+    Keeps the compiled code of templates in TEMPLATE_CACHE_PATH so that each
+    template is only compiled once rather than once per process.  Entries are
+    keyed by the path of the template and invalidated when its contents change.
+    Since the cache may be shared by many processes, entries are written
+    atomically, and failing to write one is not an error.
+    """
+
+    def dump_bytecode(self, bucket):
+        filename = self._get_cache_filename(bucket)
+        tmpname = "{}.{}.{}".format(filename, os.getpid(), threading.get_ident())
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(tmpname, "wb") as f:
+                bucket.write_bytecode(f)
+            os.replace(tmpname, filename)
+        except OSError:
+            # The cache is only an optimization
+            if os.path.exists(tmpname):
+                os.remove(tmpname)
+
+
 template_environment = jinja2.Environment(
     loader=jinja2.FileSystemLoader("/"),
+    bytecode_cache=TemplateBytecodeCache(cf.TEMPLATE_CACHE_PATH),
     block_start_string="@[",
     block_end_string="]@",
     variable_start_string="@<",
@@ -92,7 +121,59 @@ template_environment.filters.update(
 )
 
 
-def intercept_query(query, subject_name, local, infofile):
+def augment_query(query, subject_is_latest, warn=True):
+    """
+    Modify a query to the 'data' database performed in pipeline.stdin.tpl so that
+    the 'meta.uuid' of every result it returns is known (see intercept_query), and
+    so that it also returns stale results if the subject is stale, which is
+    determined by calling `subject_is_latest`.  Unless `warn` is False, a warning
+    about the results of such queries is printed.  Returns the original 'project'
+    and 'fields' of the query, and whether 'meta.uuid' was added to the latter.
+    """
+    # Check if any 'project' was given and, if so, strip it out and store it for later
+    orig_project = query.pop("project", None)
+
+    # If there was a non-empty 'fields' value given, store it and add 'meta.uuid' on to what's going to be
+    # sent to the query site
+    orig_fields = query.get("fields", None)
+    added_uuid_field = False
+    if orig_fields:
+        if "meta.uuid" not in orig_fields:
+            added_uuid_field = True
+            query["fields"].update({"meta.uuid": 1})
+
+    add_history = not subject_is_latest()
+
+    # If we're querying from pipeline.stdin.tpl for a stale Model, add history and sort accordingly
+    if add_history:
+        if warn:
+            print(
+                "WARNING: Querying for stale models will currently return ALL results for that model.\n"
+                "If your pipeline.stdin.tpl query does not include a 'limit':1 option,\n"
+                "you may get duplicate and/or 'double stale' (stale model and stale test) results.\n"
+            )
+        query["history"] = True
+        orig_sort = query.get("sort", None)
+        if orig_sort:
+            if isinstance(orig_sort, str):
+                # If sort is a string, then it's ascending sort on that key alone. We need to cast it to a
+                # list so that we can add our own sorts onto it
+                query["sort"] = [
+                    ["meta.runner.version", -1],
+                    ["created_on", -1],
+                    [orig_sort, -1],
+                ]
+            elif isinstance(orig_sort, list):
+                # If the original sort was a list, then we know all of its elements are two-element lists
+                query["sort"].insert(0, ["created_on", -1])
+                query["sort"].insert(0, ["meta.runner.version", -1])
+        else:
+            query["sort"] = [["meta.runner.version", -1], ["created_on", -1]]
+
+    return orig_project, orig_fields, added_uuid_field
+
+
+def intercept_query(query, subject_is_latest, local, info):
     """
     Intercept any queries performed in pipeline.stdin.tpl. If these queries are to the 'data' database, we
     change the query as necessary in order to ensure that we get the 'meta.uuid' value back for all results
@@ -103,81 +184,46 @@ def intercept_query(query, subject_name, local, infofile):
     out this procedure.  In the event that 'fields' is blank, we do not need to add 'meta.uuid' (and, in fact,
     do not want to) since every key-value pair in the document will be returned.  However, we do still need to
     defer performing any projection until after we've already received the document from the query site.
+    The UUIDs of the results are recorded in the list of lines `info`, which is written to pipeline.stdin.info.
     """
     # If no value for 'database' was given, set it to "data"
     database = query.get("database", "data")
 
     # If the user specified a query to a collection other than "data", simply send their query as-is
     if database != "data":
-        return kimquery.query(query, local=local)
+        return kimquery.query_cache.call(kimquery.query, query, local=local)
     else:
         # First, store the original query so that we can output it into pipeline.stdin.info as-is
         orig_query = deepcopy(query)
 
-        # Check if any 'project' was given and, if so, strip it out and store it for later
-        orig_project = query.pop("project", None)
-
-        # If there was a non-empty 'fields' value given, store it and add 'meta.uuid' on to what's going to be
-        # sent to the query site
-        orig_fields = query.get("fields", None)
-        if orig_fields:
-            if "meta.uuid" in orig_fields:
-                added_uuid_field = False
-            else:
-                added_uuid_field = True
-                query["fields"].update({"meta.uuid": 1})
-
-        add_history = not util.item_is_latest(subject_name)
-
-        # If we're querying from pipeline.stdin.tpl for a stale Model, add history and sort accordingly
-        if add_history:
-            print(
-                "WARNING: Querying for stale models will currently return ALL results for that model.\n"
-                "If your pipeline.stdin.tpl query does not include a 'limit':1 option,\n"
-                "you may get duplicate and/or 'double stale' (stale model and stale test) results.\n"
-            )
-            query["history"] = True
-            orig_sort = query.get("sort", None)
-            if orig_sort:
-                if isinstance(orig_sort, str):
-                    # If sort is a string, then it's ascending sort on that key alone. We need to cast it to a
-                    # list so that we can add our own sorts onto it
-                    query["sort"] = [
-                        ["meta.runner.version", -1],
-                        ["created_on", -1],
-                        [orig_sort, -1],
-                    ]
-                elif isinstance(orig_sort, list):
-                    # If the original sort was a list, then we know all of its elements are two-element lists
-                    query["sort"].insert(0, ["created_on", -1])
-                    query["sort"].insert(0, ["meta.runner.version", -1])
-            else:
-                query["sort"] = [["meta.runner.version", -1], ["created_on", -1]]
+        orig_project, orig_fields, added_uuid_field = augment_query(
+            query, subject_is_latest
+        )
 
         # Perform our augmented query
-        tmp_answer = kimquery.query(query, local=local, decode=True)
+        tmp_answer = kimquery.query_cache.call(
+            kimquery.query, query, local=local, decode=True
+        )
 
         # Record what the uuid of the corresponding result(s) was (were)
         if tmp_answer:
             if "meta.uuid" in tmp_answer[0]:
                 flat = True
                 # Write an entry into the infofile
-                with open(infofile, "a", encoding="utf-8") as out:
-                    out.write(
-                        "Query {} matched documents for the following UUIDs: {}\n\n".format(
-                            str(orig_query), [x["meta.uuid"] for x in tmp_answer]
-                        )
+                info.append(
+                    "Query {} matched documents for the following UUIDs: {}\n\n".format(
+                        str(orig_query), [x["meta.uuid"] for x in tmp_answer]
                     )
+                )
 
             elif "meta" in tmp_answer[0]:
                 flat = False
                 # Write an entry into the infofile
-                with open(infofile, "a", encoding="utf-8") as out:
-                    out.write(
-                        "Query {} matched documents for the following UUIDs: {}\n\n".format(
-                            str(orig_query), [x["meta"]["uuid"] for x in tmp_answer]
-                        )
+                info.append(
+                    "Query {} matched documents for the following UUIDs: {}\n\n".format(
+                        str(orig_query), [x["meta"]["uuid"] for x in tmp_answer]
                     )
+                )
 
             # If the user had specified 'fields', transform back to them (removing meta.uuid if we had added it)
             if orig_fields:
@@ -200,45 +246,54 @@ def intercept_query(query, subject_name, local, infofile):
             return str(tmp_answer)
 
         else:
-            with open(infofile, "a", encoding="utf-8") as out:
-                out.write(
-                    "Query {} did not match any documents\n\n".format(str(orig_query))
-                )
+            info.append(
+                "Query {} did not match any documents\n\n".format(str(orig_query))
+            )
 
             return tmp_answer
 
 
-def intercept_get_test_result(test, model, prop, keys, units, local, infofile):
+def augment_test_result_keys(keys, units):
+    """
+    Return the keys and units with which get_test_result is called for a call to it
+    in pipeline.stdin.tpl (see intercept_get_test_result), and the index of
+    'meta.uuid' among the keys if it was part of the original ones
+    """
+    # Check if 'meta.uuid' is in the original set of keys. If so, get its index. (If it's in the list more
+    # than once, although extremely unlikely, just get the index of the first instance of it)
+    if "meta.uuid" in keys:
+        return keys, units, keys.index("meta.uuid")
+
+    # Add 'meta.uuid' to the end of keys and a corresponding null entry to the end of units
+    return keys + ["meta.uuid"], units + [None], None
+
+
+def intercept_get_test_result(test, model, prop, keys, units, local, info):
     """
     Intercept any calls to get_test_result performed in pipeline.stdin.tpl.  Check if 'meta.uuid' is contained
     in the list of keys specified as input to the function.  If it is not, we add it ourselves as the last
     element of the 'keys' list (and add a corresponding 'units' entry of null).  After the query has returned
     a list, we extract the uuid before passing along the list that the Test initially expected.  Of course, if
     the call to get_test_result returns an empty list, we simply note that no matching documents were found
-    (just as we do in the case of raw queries in pipeline.stdin.tpl).
+    (just as we do in the case of raw queries in pipeline.stdin.tpl).  Both are recorded in the list of lines
+    `info`, which is written to pipeline.stdin.info.
     """
-    # Check if 'meta.uuid' is in the original set of keys. If so, get its index. (If it's in the list more
-    # than once, although extremely unlikely, just get the index of the first instance of it)
-    if "meta.uuid" in keys:
-        uuid_index = keys.index("meta.uuid")
-        answer = kimquery.get_test_result(
-            test, model, prop, keys, units, local, decode=True
-        )
-        if answer:
-            uuid = answer[uuid_index]
-    else:
-        # Add 'meta.uuid' to the end of keys and a corresponding null entry to the end of units
-        keys.append("meta.uuid")
-        units.append(None)
-        answer = kimquery.get_test_result(
-            test, model, prop, keys, units, local, decode=True
-        )
-
-        # Revert keys and units to their original values by stripping off the last element
-        del keys[-1]
-        del units[-1]
+    query_keys, query_units, uuid_index = augment_test_result_keys(keys, units)
+    answer = kimquery.query_cache.call(
+        kimquery.get_test_result,
+        test,
+        model,
+        prop,
+        query_keys,
+        query_units,
+        local=local,
+        decode=True,
+    )
 
-        if answer:
+    if answer:
+        if uuid_index is not None:
+            uuid = answer[uuid_index]
+        else:
             # Get uuid and strip it off of the list we got back
             uuid = answer[-1]
             del answer[-1]
@@ -247,19 +302,107 @@ def intercept_get_test_result(test, model, prop, keys, units, local, infofile):
         test, model, prop, keys, units
     )
     if answer:
-        with open(infofile, "a", encoding="utf-8") as out:
-            out.write(
-                "Query {} matched documents for the following UUIDs: {}\n\n".format(
-                    tmpstr, str(uuid)
-                )
+        info.append(
+            "Query {} matched documents for the following UUIDs: {}\n\n".format(
+                tmpstr, str(uuid)
             )
+        )
     else:
-        with open(infofile, "a", encoding="utf-8") as out:
-            out.write("Query {} did not match any documents\n\n".format(tmpstr))
+        info.append("Query {} did not match any documents\n\n".format(tmpstr))
 
     return answer
 
 
+class PendingAnswer:
+    """
+    Stands in for the answer to a query while the queries made by a template are
+    being collected (see collect_queries).  It can be indexed and iterated over,
+    so that rendering can carry on past most uses of the answer.
+    """
+
+    def __getitem__(self, key):
+        return self
+
+    def __iter__(self):
+        return iter(())
+
+    def __len__(self):
+        return 0
+
+    def __str__(self):
+        return ""
+
+
+def depends_on_answer(o):
+    """Return whether `o` contains a PendingAnswer"""
+    if isinstance(o, PendingAnswer):
+        return True
+    if isinstance(o, dict):
+        return any(depends_on_answer(v) for v in o.values())
+    if isinstance(o, (list, tuple)):
+        return any(depends_on_answer(v) for v in o)
+    return False
+
+
+def collect_query(calls, subject_is_latest, query):
+    """
+    Record the call to the query function that intercept_query would make for
+    `query` in the list `calls`, without performing it
+    """
+    if depends_on_answer(query):
+        return PendingAnswer()
+
+    query = deepcopy(query)
+    if query.get("database", "data") != "data":
+        calls.append((kimquery.query, (query,), {}))
+    else:
+        # The warning is printed when the template is rendered
+        augment_query(query, subject_is_latest, warn=False)
+        calls.append((kimquery.query, (query,), {"decode": True}))
+    return PendingAnswer()
+
+
+def collect_get_test_result(calls, test, model, prop, keys, units):
+    """
+    Record the call to get_test_result that intercept_get_test_result would make
+    in the list `calls`, without performing it
+    """
+    if depends_on_answer([test, model, prop, keys, units]):
+        return PendingAnswer()
+
+    query_keys, query_units, _ = augment_test_result_keys(keys, units)
+    calls.append(
+        (
+            kimquery.get_test_result,
+            (test, model, prop, query_keys, query_units),
+            {"decode": True},
+        )
+    )
+    return PendingAnswer()
+
+
+def collect_queries(template, context, subject_is_latest):
+    """
+    Render `template` with the query functions replaced by ones that only record
+    the queries that would be performed, and return them as (func, args, kwargs)
+    tuples.  Queries whose arguments depend on the answers to other queries are
+    not recorded correctly, and rendering stops at the first use of an answer
+    that is not supported by PendingAnswer, so the queries returned may not be
+    all of (or exactly) those made by the template.
+    """
+    calls = []
+    context = dict(
+        context,
+        query=partial(collect_query, calls, subject_is_latest),
+        get_test_result=partial(collect_get_test_result, calls),
+    )
+    try:
+        template.render(**context)
+    except Exception:
+        pass
+    return calls
+
+
 # add handy functions to global name space
 template_environment.globals.update(
     {
@@ -271,6 +414,166 @@ template_environment.globals.update(
 )
 
 
+def render(inppath, subject, runner, infofile):
+    """
+    Render the template `inppath` for the pair of `runner` and `subject`, and
+    return the result.  The queries made by the template are recorded in
+    `infofile`.
+    """
+    template = template_environment.get_template(inppath)
+
+    subject_name = subject.kim_code
+
+    # Whether the subject is the latest version of its lineage is only looked
+    # up once, by the first query made
+    subject_is_latest = lru_cache(maxsize=None)(
+        partial(util.item_is_latest, subject_name)
+    )
+    local = cf.PIPELINE_LOCAL_DEV
+
+    # Lines to write to the infofile
+    info = []
+
+    # The query functions are passed to this rendering only rather than set
+    # as globals of the template, which is shared by all renderings of it
+    context = {
+        "query": partial(
+            intercept_query,
+            subject_is_latest=subject_is_latest,
+            local=local,
+            info=info,
+        ),
+        "get_test_result": partial(
+            intercept_get_test_result,
+            local=local,
+            info=info,
+        ),
+        "RUNNERNAME": runner.kim_code,
+        "SUBJECTNAME": subject_name,
+    }
+
+    if runner.kim_code_leader.lower() == "te":
+        context["MODELNAME"] = subject_name
+        context["TESTNAME"] = runner.kim_code
+    elif runner.kim_code_leader.lower() == "vc":
+        context["MODELNAME"] = subject_name
+        context["VCNAME"] = runner.kim_code
+
+    cache = kimquery.query_cache
+    hits, misses = cache.hits, cache.misses
+    http = get_client().metrics
+    requests, request_time = http.requests, http.total_time
+
+    # Queries to the remote query API are performed concurrently ahead of
+    # rendering, which then finds their answers in the query cache.  Values
+    # taken from the shell environment are strings.
+    threads = int(cf.TEMPLATE_PREFETCH_THREADS)
+    if threads > 0 and not local and not kimquery.use_mirror():
+        calls = collect_queries(template, context, subject_is_latest)
+        if calls:
+            cache.prefetch(calls, local=local, max_workers=threads)
+
+    output = template.render(**context)
+
+    # Record how many of the queries performed were answered from the cache
+    if cache.hits + cache.misses > hits + misses:
+        info.append(
+            "Query cache: {} hits, {} misses\n\n".format(
+                cache.hits - hits, cache.misses - misses
+            )
+        )
+
+    # Record how long the queries that went over the network took
+    if http.requests > requests:
+        info.append(
+            "Remote requests: {}, {:.3f} s total\n\n".format(
+                http.requests - requests, http.total_time - request_time
+            )
+        )
+
+    if info:
+        with open(infofile, "a", encoding="utf-8") as out:
+            out.write("".join(info))
+
+    return output
+
+
+QUERY_FUNCTIONS = ("query", "get_test_result")
+
+# Whether templates, keyed by the hash of their source, are static
+_static_templates = {}
+
+
+def is_static(source):
+    """
+    Return whether the template `source` is static, i.e. whether its output only
+    depends on the runner and subject it is rendered for, since it makes no
+    queries and does not include or import other templates (which might)
+    """
+    digest = hashlib.sha256(source.encode("utf-8")).hexdigest()
+    static = _static_templates.get(digest)
+    if static is None:
+        ast = template_environment.parse(source)
+        static = not (
+            jinja2.meta.find_undeclared_variables(ast).intersection(QUERY_FUNCTIONS)
+            or any(True for _ in jinja2.meta.find_referenced_templates(ast))
+        )
+        _static_templates[digest] = static
+    return static
+
+
+def static_render_key(inppath, subject, runner):
+    """
+    Return a key identifying the output of rendering the template `inppath` for
+    the pair of `runner` and `subject` if the template is static (see
+    is_static), or None otherwise.  Since the output of a static template is
+    fully determined by the key, the same key means the same output.
+    """
+    source, _, _ = template_environment.loader.get_source(template_environment, inppath)
+    if not is_static(source):
+        return None
+
+    return hashlib.sha256(
+        json.dumps(
+            [
+                runner.kim_code,
+                subject.kim_code,
+                cf.LOCAL_REPOSITORY_PATH,
+                hashlib.sha256(source.encode("utf-8")).hexdigest(),
+            ]
+        ).encode("utf-8")
+    ).hexdigest()
+
+
+def rendered_path(key):
+    """Return the file in which the output of a static template with key `key` is cached"""
+    return os.path.join(cf.TEMPLATE_CACHE_PATH, "rendered", key)
+
+
+def load_rendered(key):
+    """Return the cached output of a static template with key `key`, if any"""
+    try:
+        with open(rendered_path(key), encoding="utf-8") as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def store_rendered(key, output):
+    """Cache the output of a static template with key `key`"""
+    path = rendered_path(key)
+    tmppath = "{}.{}.{}".format(path, os.getpid(), threading.get_ident())
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(tmppath, "w", encoding="utf-8") as f:
+            f.write(output)
+        os.replace(tmppath, path)
+    except OSError:
+        # The cache is only an optimization
+        if os.path.exists(tmppath):
+            os.remove(tmppath)
+
+
 def process(
     inppath,
     subject,
@@ -278,46 +581,22 @@ def process(
     outfile=os.path.join(cf.OUTPUT_DIR, cf.TEMP_INPUT_FILE),
     infofile=os.path.join(cf.OUTPUT_DIR, cf.TEMP_INPUT_INFO_FILE),
 ):
-    """Takes in a path (relative to runner directory) and writes a processed copy to TEMP_INPUT_FILE."""
+    """
+    Takes in a path (relative to runner directory) and writes a processed copy to TEMP_INPUT_FILE.
+    The output of static templates (see is_static) is only rendered once for each pair and
+    cached in TEMPLATE_CACHE_PATH.
+    """
 
     with runner.in_dir():
         if not os.path.exists(cf.OUTPUT_DIR):
             os.makedirs(cf.OUTPUT_DIR)
 
-        template = template_environment.get_template(inppath)
-
-        subject_name = subject.kim_code
-
-        template.globals.update(
-            {
-                "query": partial(
-                    intercept_query,
-                    subject_name=subject_name,
-                    local=cf.PIPELINE_LOCAL_DEV,
-                    infofile=infofile,
-                )
-            }
-        )
-        template.globals.update(
-            {
-                "get_test_result": partial(
-                    intercept_get_test_result,
-                    local=cf.PIPELINE_LOCAL_DEV,
-                    infofile=infofile,
-                )
-            }
-        )
-
-        extrainfo = {"RUNNERNAME": runner.kim_code, "SUBJECTNAME": subject_name}
-
-        if runner.kim_code_leader.lower() == "te":
-            extrainfo["MODELNAME"] = subject_name
-            extrainfo["TESTNAME"] = runner.kim_code
-        elif runner.kim_code_leader.lower() == "vc":
-            extrainfo["MODELNAME"] = subject_name
-            extrainfo["VCNAME"] = runner.kim_code
-
-        output = template.render(**extrainfo)
+        key = static_render_key(inppath, subject, runner)
+        output = load_rendered(key) if key else None
+        if output is None:
+            output = render(inppath, subject, runner, infofile)
+            if key:
+                store_rendered(key, output)
 
         if not outfile:
             return output
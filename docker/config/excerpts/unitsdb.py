@@ -0,0 +1,706 @@
+"""
+In-process evaluation of unit conversions using the database of the GNU units
+program.
+
+Converting a value by running `units` costs a process for every value, which
+dominates the time spent processing results that contain thousands of numbers.
+Instead, the units database (UNITS_DATABASE_FILE) is parsed once, the unit
+expressions found in results are reduced to a factor times a product of
+primitive units, and the factors are applied in-process.  The reduction follows
+the rules of the units program (operator precedence, plurals, prefixes,
+exponents appended to unit names, nonlinear units such as tempC, locale and
+unit system conditionals in the database) and its results are printed in the
+same way, so that they are the same as those obtained from the program.
+
+Anything the evaluator does not handle (unknown units, piecewise linear units,
+unit lists, reciprocal conversions, errors, ...) raises UnsupportedConversion,
+upon which kimunits falls back to running the units program.
+
+Copyright (c) 2014-2022, Regents of the University of Minnesota. All rights
+reserved.
+
+This software may be distributed as-is, without modification.
+"""
+
+import math
+import os
+import re
+import threading
+from functools import lru_cache
+
+from . import config as cf
+
+# Format of the numbers printed by the units program as invoked by kimunits
+OUTPUT_FORMAT = "%1.15e"
+
+# Relative error up to which a nonlinear unit is considered to be affine
+AFFINE_TOLERANCE = 1e-12
+
+# Locale assumed by the units program if none is set
+DEFAULT_LOCALE = "en_US"
+
+# Functions that may be applied to units, mapped to the corresponding exponent
+ROOT_FUNCTIONS = {"sqrt": 0.5, "cuberoot": 1 / 3}
+
+# Functions of pure numbers
+BUILTIN_FUNCTIONS = {
+    "sin": math.sin,
+    "cos": math.cos,
+    "tan": math.tan,
+    "asin": math.asin,
+    "acos": math.acos,
+    "atan": math.atan,
+    "sinh": math.sinh,
+    "cosh": math.cosh,
+    "tanh": math.tanh,
+    "asinh": math.asinh,
+    "acosh": math.acosh,
+    "atanh": math.atanh,
+    "exp": math.exp,
+    "ln": math.log,
+    "log": math.log10,
+    "log2": math.log2,
+}
+
+_token_expression = re.compile(
+    r"""\s*(?:
+        (?P<number>(?:\d+(?:\.\d*)?|\.\d+)(?:[eE][-+]?\d+)?)
+        |(?P<operator>\*\*|[-+*/|^()])
+        |(?P<name>[^\s\d.+\-*/|^()~;][^\s+\-*/|^()~;]*)
+    )""",
+    re.VERBOSE,
+)
+
+# A digit from 2 to 9 at the end of a unit name is an exponent (as in 'cm3'),
+# unless it is part of a suffix such as '_2' or '_3.14'
+_exponent_suffix_expression = re.compile(r"^(?P<name>.*?[^\d_.,])(?P<exponent>[2-9])$")
+
+_function_expression = re.compile(r"^(?P<name>[^(]+)\((?P<parameter>[^)]*)\)$")
+_function_option_expression = re.compile(
+    r"^(?:(?P<key>units)=\[(?P<units>[^\]]*)\]"
+    r"|(?P<interval_key>domain|range)=(?P<interval>[\[(][^\])]*[\])])"
+    r"|(?P<noerror>noerror))\s*"
+)
+
+
+class UnsupportedConversion(Exception):
+    """If a conversion cannot be evaluated in-process, e.g. because of an unknown unit"""
+
+
+class Quantity:
+    """A factor times a product of powers of primitive units"""
+
+    __slots__ = ("factor", "dims")
+
+    def __init__(self, factor, dims=None):
+        self.factor = factor
+        self.dims = dims or {}
+
+    def __mul__(self, other):
+        dims = dict(self.dims)
+        for name, exponent in other.dims.items():
+            exponent += dims.get(name, 0)
+            if exponent:
+                dims[name] = exponent
+            else:
+                del dims[name]
+        return Quantity(self.factor * other.factor, dims)
+
+    def __truediv__(self, other):
+        return self * Quantity(1 / other.factor, {k: -v for k, v in other.dims.items()})
+
+    def __pow__(self, exponent):
+        dims = {}
+        for name, power in self.dims.items():
+            power *= exponent
+            if abs(power - round(power)) > 1e-12:
+                raise UnsupportedConversion(
+                    "Non-integer power of unit '{}'".format(name)
+                )
+            dims[name] = int(round(power))
+        if self.factor < 0 and exponent != int(exponent):
+            raise UnsupportedConversion("Non-integer power of negative number")
+        if exponent == 0.5:
+            return Quantity(math.sqrt(self.factor), dims)
+        return Quantity(self.factor**exponent, dims)
+
+    def number(self, dimensionless=()):
+        """Return the factor, checking that the quantity has no dimensions"""
+        if any(name not in dimensionless for name in self.dims):
+            raise UnsupportedConversion("Expected a dimensionless quantity")
+        return self.factor
+
+    def conforms(self, other, dimensionless=()):
+        """
+        Whether the quantity has the same dimensions as `other`, ignoring
+        dimensionless primitive units such as radians
+        """
+        ours = {k: v for k, v in self.dims.items() if k not in dimensionless}
+        theirs = {k: v for k, v in other.dims.items() if k not in dimensionless}
+        return ours == theirs
+
+    def unit(self):
+        """
+        Return the product of primitive units as printed by the units program,
+        e.g. 'kg m^2 / A s^3', or None if the quantity is a pure number
+        """
+        numerator = []
+        denominator = []
+        for name in sorted(self.dims):
+            exponent = self.dims[name]
+            term = name if abs(exponent) == 1 else "{}^{}".format(name, abs(exponent))
+            (numerator if exponent > 0 else denominator).append(term)
+
+        unit = " ".join(numerator)
+        if denominator:
+            unit = (unit + " / " if unit else "/ ") + " ".join(denominator)
+        return unit or None
+
+
+def _interval(text):
+    """Parse an interval such as '[-273.15,)' into a membership test"""
+    lower, upper = text[1:-1].split(",")
+    lower = float(lower) if lower.strip() else -math.inf
+    upper = float(upper) if upper.strip() else math.inf
+    lower_closed = text[0] == "["
+    upper_closed = text[-1] == "]"
+
+    def contains(x):
+        return (lower < x or (lower_closed and lower == x)) and (
+            x < upper or (upper_closed and upper == x)
+        )
+
+    return contains
+
+
+class Function:
+    """A nonlinear unit defined by the units database, such as tempC(x)"""
+
+    def __init__(self, database, name, parameter, definition):
+        self.database = database
+        self.name = name
+        self.parameter = parameter
+        self.units = (None, None)
+        self.domain = self.range = None
+
+        while True:
+            match = _function_option_expression.match(definition)
+            if not match:
+                break
+            if match.group("key"):
+                self.units = tuple(
+                    unit.strip() or None for unit in match.group("units").split(";")
+                )
+            elif match.group("interval_key"):
+                setattr(
+                    self,
+                    match.group("interval_key"),
+                    _interval(match.group("interval")),
+                )
+            definition = definition[match.end() :]
+
+        forward, _, inverse = definition.partition(";")
+        self.forward = forward.strip()
+        self.inverse = inverse.strip() or None
+
+    def _unit(self, index):
+        if self.units[index] is None:
+            return None
+        return self.database.evaluate(self.units[index])
+
+    def __call__(self, argument):
+        """Evaluate the function at the quantity `argument`"""
+        in_unit, out_unit = self._unit(0), self._unit(1)
+        dimensionless = self.database.dimensionless
+        if in_unit is not None:
+            if not argument.conforms(in_unit, dimensionless):
+                raise UnsupportedConversion(
+                    "Argument of {} has the wrong dimensions".format(self.name)
+                )
+            if self.domain and not self.domain(argument.factor / in_unit.factor):
+                raise UnsupportedConversion("Argument outside domain of " + self.name)
+
+        result = self.database.evaluate(
+            self.forward, {self.parameter: argument}, recurse=self.name
+        )
+        if out_unit is not None and not result.conforms(out_unit, dimensionless):
+            raise UnsupportedConversion(
+                "Result of {} has the wrong dimensions".format(self.name)
+            )
+        return result
+
+    def invert(self, value):
+        """
+        Return the number x in the input units of the function for which the
+        function evaluates to the quantity `value`
+        """
+        if self.inverse is None:
+            raise UnsupportedConversion("No inverse defined for " + self.name)
+        in_unit, out_unit = self._unit(0), self._unit(1)
+        dimensionless = self.database.dimensionless
+        if out_unit is not None:
+            if not value.conforms(out_unit, dimensionless):
+                raise UnsupportedConversion(
+                    "Argument of ~{} has the wrong dimensions".format(self.name)
+                )
+            if self.range and not self.range(value.factor / out_unit.factor):
+                raise UnsupportedConversion("Argument outside range of " + self.name)
+
+        result = self.database.evaluate(
+            self.inverse, {self.name: value}, recurse=self.name
+        )
+        if in_unit is None:
+            return result.number(dimensionless)
+        if not result.conforms(in_unit, dimensionless):
+            raise UnsupportedConversion(
+                "Result of ~{} has the wrong dimensions".format(self.name)
+            )
+        return result.factor / in_unit.factor
+
+
+class Parser:
+    """
+    Recursive descent parser of unit expressions, with the operator precedence
+    of the units program (from lowest to highest): + and -, 'per', * and /,
+    multiplication by juxtaposition, ^ and **, and | between numbers
+    """
+
+    def __init__(self, database, text, variables=None):
+        self.database = database
+        self.variables = variables or {}
+        self.tokens = []
+        position = 0
+        text = text.rstrip()
+        while position < len(text):
+            match = _token_expression.match(text, position)
+            if not match or match.end() == position:
+                raise UnsupportedConversion("Cannot parse '{}'".format(text))
+            kind = match.lastgroup
+            value = match.group(kind)
+            if kind == "name" and value == "per":
+                kind = "operator"
+            self.tokens.append((kind, value))
+            position = match.end()
+        self.position = 0
+
+    def peek(self):
+        if self.position < len(self.tokens):
+            return self.tokens[self.position]
+        return (None, None)
+
+    def next(self):
+        token = self.peek()
+        self.position += 1
+        return token
+
+    def expect(self, value):
+        if self.next()[1] != value:
+            raise UnsupportedConversion("Expected '{}'".format(value))
+
+    def parse(self):
+        if not self.tokens:
+            return Quantity(1.0)
+        value = self.parse_sum()
+        if self.position != len(self.tokens):
+            raise UnsupportedConversion("Unexpected '{}'".format(self.peek()[1]))
+        return value
+
+    def parse_sum(self):
+        sign = 1
+        while self.peek()[1] in ("+", "-"):
+            if self.next()[1] == "-":
+                sign = -sign
+        value = self.parse_per()
+        if sign < 0:
+            value = Quantity(-value.factor, value.dims)
+
+        while self.peek()[1] in ("+", "-"):
+            operator = self.next()[1]
+            other = self.parse_per()
+            if not value.conforms(other):
+                raise UnsupportedConversion("Sum of nonconformable units")
+            if operator == "+":
+                value = Quantity(value.factor + other.factor, value.dims)
+            else:
+                value = Quantity(value.factor - other.factor, value.dims)
+        return value
+
+    def parse_per(self):
+        value = self.parse_product()
+        while self.peek()[1] == "per":
+            self.next()
+            value = value / self.parse_product()
+        return value
+
+    def parse_product(self):
+        value = self.parse_juxtaposition()
+        while self.peek()[1] in ("*", "/"):
+            if self.next()[1] == "*":
+                value = value * self.parse_juxtaposition()
+            else:
+                value = value / self.parse_juxtaposition()
+        return value
+
+    def parse_juxtaposition(self):
+        value = self.parse_power()
+        while True:
+            kind, token = self.peek()
+            if kind in ("number", "name") or token == "(":
+                value = value * self.parse_power()
+            else:
+                return value
+
+    def parse_power(self):
+        value = self.parse_primary()
+        if self.peek()[1] in ("^", "**"):
+            self.next()
+            sign = 1
+            while self.peek()[1] in ("+", "-"):
+                if self.next()[1] == "-":
+                    sign = -sign
+            exponent = self.parse_power().number(self.database.dimensionless)
+            value = value ** (sign * exponent)
+        return value
+
+    def parse_primary(self):
+        kind, token = self.next()
+        if kind == "number":
+            value = float(token)
+            if self.peek()[1] == "|":
+                self.next()
+                kind, token = self.next()
+                if kind != "number":
+                    raise UnsupportedConversion("'|' must separate two numbers")
+                value /= float(token)
+            return Quantity(value)
+
+        if token == "(":
+            value = self.parse_sum()
+            self.expect(")")
+            return value
+
+        if kind != "name":
+            raise UnsupportedConversion("Unexpected '{}'".format(token))
+
+        if token in self.variables:
+            value = self.variables[token]
+            return Quantity(value.factor, dict(value.dims))
+
+        # Function calls
+        if self.peek()[1] == "(":
+            function = self.database.function(token)
+            if (
+                function is not None
+                or token in ROOT_FUNCTIONS
+                or token in BUILTIN_FUNCTIONS
+            ):
+                self.next()
+                argument = self.parse_sum()
+                self.expect(")")
+                if function is not None:
+                    return function(argument)
+                if token in ROOT_FUNCTIONS:
+                    return argument ** ROOT_FUNCTIONS[token]
+                number = argument.number(self.database.dimensionless)
+                try:
+                    return Quantity(BUILTIN_FUNCTIONS[token](number))
+                except (ValueError, OverflowError):
+                    raise UnsupportedConversion(
+                        "Argument outside domain of {}".format(token)
+                    )
+
+        exponent = 1
+        if token not in self.database.units:
+            match = _exponent_suffix_expression.match(token)
+            if match:
+                token = match.group("name")
+                exponent = int(match.group("exponent"))
+
+        value = self.database.lookup(token)
+        if exponent != 1:
+            value = value**exponent
+        return value
+
+
+class UnitsDatabase:
+    def __init__(self, filename):
+        self.units = {}
+        self.prefixes = {}
+        self.functions = {}
+        self.dimensionless = set()
+
+        self._values = {}
+        self._prefix_values = {}
+        self._function_values = {}
+        # Definitions being evaluated by each thread, to detect circular ones
+        self._local = threading.local()
+
+        # Settings that select which parts of the database are used
+        locale = (
+            os.environ.get("LC_ALL")
+            or os.environ.get("LC_CTYPE")
+            or os.environ.get("LANG")
+            or ""
+        )
+        self.utf8 = re.search(r"utf-?8", locale, re.IGNORECASE) is not None
+        locale = re.split(r"[.@]", locale)[0]
+        self.locale = DEFAULT_LOCALE if locale in ("", "C", "POSIX") else locale
+        self.environment = dict(os.environ)
+
+        self.read(filename)
+        self._max_prefix_length = max(map(len, self.prefixes), default=0)
+
+    def read(self, filename):
+        """Read the definitions of file `filename` of the units database"""
+        with open(filename, encoding="utf-8", errors="replace") as f:
+            text = f.read()
+
+        # Join continued lines and drop comments
+        lines = text.replace("\\\n", " ").splitlines()
+
+        # Whether the definitions in each enclosing conditional block are used
+        active = []
+        for line in lines:
+            line = line.split("#", 1)[0].strip()
+            if not line:
+                continue
+
+            if line.startswith("!"):
+                words = line[1:].split()
+                command, arguments = words[0], words[1:]
+                if command == "locale":
+                    active.append(bool(arguments) and arguments[0] == self.locale)
+                elif command == "utf8":
+                    active.append(self.utf8)
+                elif command in ("var", "varnot"):
+                    value = self.environment.get(arguments[0]) if arguments else None
+                    if value is None:
+                        active.append(command == "varnot")
+                    else:
+                        active.append((value in arguments[1:]) == (command == "var"))
+                elif command in ("endlocale", "endutf8", "endvar"):
+                    if active:
+                        active.pop()
+                elif not all(active):
+                    continue
+                elif command == "set" and len(arguments) >= 2:
+                    self.environment.setdefault(arguments[0], arguments[1])
+                elif command == "include" and arguments:
+                    path = os.path.join(os.path.dirname(filename), arguments[0])
+                    if os.path.isfile(path):
+                        self.read(path)
+                continue
+
+            if not all(active):
+                continue
+
+            parts = line.split(None, 1)
+            if len(parts) < 2:
+                continue
+            name, definition = parts
+
+            if name.endswith("-"):
+                self.prefixes[name[:-1]] = definition
+            elif "(" in name:
+                match = _function_expression.match(name)
+                if match:
+                    self.functions[match.group("name")] = (
+                        match.group("parameter"),
+                        definition,
+                    )
+            elif "[" not in name:
+                # Piecewise linear units, e.g. 'wiregauge[in]', are not supported
+                self.units[name] = definition
+
+    def function(self, name):
+        """Return the nonlinear unit `name`, or None if there is none"""
+        if name not in self._function_values:
+            function = None
+            alias = name
+            while alias in self.functions:
+                parameter, definition = self.functions[alias]
+                if parameter:
+                    function = Function(self, alias, parameter, definition)
+                    break
+                # Alias of another function, e.g. 'tempcelsius() tempC'
+                alias = definition.strip()
+            self._function_values[name] = function
+        return self._function_values[name]
+
+    def evaluate(self, text, variables=None, recurse=None):
+        """Reduce the unit expression `text` to primitive units"""
+        if recurse is not None:
+            evaluating = self._local.__dict__.setdefault("evaluating", set())
+            if recurse in evaluating:
+                raise UnsupportedConversion("Circular definition of " + recurse)
+            evaluating.add(recurse)
+        try:
+            return Parser(self, text, variables).parse()
+        finally:
+            if recurse is not None:
+                evaluating.discard(recurse)
+
+    def _unit_value(self, name):
+        if name not in self._values:
+            definition = self.units[name]
+            if definition.startswith("!"):
+                # Primitive unit
+                if definition == "!dimensionless":
+                    self.dimensionless.add(name)
+                self._values[name] = Quantity(1.0, {name: 1})
+            else:
+                self._values[name] = self.evaluate(definition, recurse=name)
+        return self._values[name]
+
+    def _prefix_value(self, prefix):
+        if prefix not in self._prefix_values:
+            self._prefix_values[prefix] = self.evaluate(
+                self.prefixes[prefix], recurse=prefix + "-"
+            )
+        return self._prefix_values[prefix]
+
+    def lookup(self, name, prefix_allowed=True):
+        """
+        Return the value of unit `name`, which may be a plural or have a prefix,
+        in the same way as the units program
+        """
+        value = self._lookup(name, prefix_allowed)
+        if value is None:
+            raise UnsupportedConversion("Unknown unit '{}'".format(name))
+        return Quantity(value.factor, dict(value.dims))
+
+    def _lookup(self, name, prefix_allowed=True):
+        if name in self.units:
+            return self._unit_value(name)
+
+        if len(name) > 2 and name.endswith("s"):
+            candidates = [name[:-1]]
+            if name.endswith("es"):
+                candidates.append(name[:-2])
+            if name.endswith("ies"):
+                candidates.append(name[:-3] + "y")
+            for candidate in candidates:
+                if candidate in self.units:
+                    return self._unit_value(candidate)
+
+        if prefix_allowed:
+            # Only the longest prefix is tried
+            for length in range(min(len(name), self._max_prefix_length), 0, -1):
+                if name[:length] in self.prefixes:
+                    prefix = self._prefix_value(name[:length])
+                    if length == len(name):
+                        return prefix
+                    value = self._lookup(name[length:], prefix_allowed=False)
+                    if value is None:
+                        return None
+                    return prefix * value
+        return None
+
+
+_database = None
+
+
+def get_database():
+    """
+    Return the units database, parsed on first use, or None if it cannot be
+    found or read
+    """
+    global _database
+    if _database is None:
+        try:
+            _database = UnitsDatabase(cf.UNITS_DATABASE_FILE)
+        except OSError:
+            _database = False
+    return _database or None
+
+
+def _round(value):
+    """Round `value` to the precision of the output of the units program"""
+    return float(OUTPUT_FORMAT % value)
+
+
+@lru_cache(maxsize=4096)
+def _conversion(from_unit, to_unit=None, function=False):
+    """
+    Return the unrounded conversion function described in `converter`, its
+    unit, and its factor if it is linear (None otherwise)
+    """
+    database = get_database()
+    if database is None:
+        raise UnsupportedConversion("The units database is not available")
+
+    nonlinear = database.function(from_unit) if function else None
+    if nonlinear is not None:
+        have = nonlinear(Quantity(1.0))
+    else:
+        have = database.evaluate(from_unit)
+
+    if to_unit is None:
+        unit = have.unit()
+        if nonlinear is None:
+            factor = have.factor
+            return (lambda value: value * factor), unit, factor
+        return (lambda value: nonlinear(Quantity(value)).factor), unit, None
+
+    inverse = database.function(to_unit)
+    if inverse is not None:
+        if nonlinear is None:
+            return (lambda value: inverse.invert(have * Quantity(value))), to_unit, None
+        return (
+            (lambda value: inverse.invert(nonlinear(Quantity(value)))),
+            to_unit,
+            None,
+        )
+
+    want = database.evaluate(to_unit)
+    if not have.conforms(want, database.dimensionless):
+        # Includes reciprocal conversions, which the units program reports
+        # differently
+        raise UnsupportedConversion(
+            "Cannot convert '{}' to '{}'".format(from_unit, to_unit)
+        )
+    divisor = want.factor
+    if nonlinear is None:
+        factor = have.factor
+        return (lambda value: value * factor / divisor), to_unit, factor / divisor
+    return (lambda value: nonlinear(Quantity(value)).factor / divisor), to_unit, None
+
+
+@lru_cache(maxsize=4096)
+def converter(from_unit, to_unit=None, function=False):
+    """
+    Return a function converting values in `from_unit` (the argument of the
+    nonlinear unit `from_unit` if `function` is set) to `to_unit`, or to SI
+    units if it is None, and the unit of the values it returns, which is the
+    reduced SI unit printed by the units program (None for pure numbers) if
+    `to_unit` is None.  The values returned are rounded in the same way as
+    those printed by the units program.
+    """
+    conversion, unit, _ = _conversion(from_unit, to_unit, function)
+    return (lambda value: _round(conversion(value))), unit
+
+
+def affine(from_unit, to_unit=None, function=False):
+    """
+    Return (offset, scale, unit) such that the conversion described in
+    `converter` maps a value x to offset + scale * x (unrounded), or None if it
+    is not an affine map.  Nonlinear units such as tempC are affine if their
+    values at a few points lie on a line.
+    """
+    conversion, unit, scale = _conversion(from_unit, to_unit, function)
+    if scale is not None:
+        return 0.0, scale, unit
+
+    try:
+        offset = conversion(0.0)
+        scale = conversion(1.0) - offset
+        for x in (2.0, 10.0, 1000.0):
+            expected = offset + scale * x
+            if abs(conversion(x) - expected) > AFFINE_TOLERANCE * max(
+                abs(expected), abs(offset), abs(scale)
+            ):
+                return None
+    except UnsupportedConversion:
+        # Outside the domain of the function
+        return None
+    return offset, scale, unit
@@ -6,6 +6,7 @@ This software may be distributed as-is, without modification.
 """
 
 import os
+import re
 import edn_format
 import json
 import subprocess
@@ -31,19 +32,102 @@ def replace_nones(o):
         return o if o is not None else ""
 
 
-def loadedn(f):
-    """Load a file, filename, or string containing valid EDN into a dict.
-    For whatever, reason, the 'edn_format' module always returns (nested)
-    structures of its own internally defined types, ImmutableList and
-    ImmutableDict.  Since we generally need to take the content we load
-    from an EDN file and do something like json.dumps with it, this
-    presents a problem.  Therefore, we recurse through them, converting all
-    ImmutableList instances to regular python lists and all ImmutableDict
-    instances to regular python dicts.
+class _UnsupportedEDN(Exception):
+    """If an EDN string uses syntax that _loads_simple_edn does not handle"""
 
-    NOTE: This function assumes that the content being loaded is always
-    contained (at least at the uppermost level) in a dict or list, i.e. {}
-    or [] brackets.  If not, we cowardly raise an exception.
+
+_edn_token_expression = re.compile(
+    r"""[\s,]*(?:
+        (?P<string>"(?:[^"\\]|\\.)*")
+        |(?P<number>[-+]?(?:0|[1-9][0-9]*)(?P<fraction>\.[0-9]+)?(?P<exponent>[eE][-+]?[0-9]+)?(?![^\s,\[\]{}]))
+        |(?P<open>[\[{])
+        |(?P<close>[\]}])
+        |(?P<constant>true|false|nil)(?![^\s,\[\]{}])
+        |(?P<end>$)
+    )""",
+    re.VERBOSE,
+)
+
+_edn_constants = {"true": True, "false": False, "nil": None}
+
+
+def _reject_constant(name):
+    raise ValueError("{} is not valid EDN".format(name))
+
+
+def _loads_simple_edn(text):
+    """
+    Parse the subset of EDN written by dumpedn (and most Tests), i.e. maps,
+    vectors, strings, integers, floats, booleans and nil, directly into dicts and
+    lists.  Raises _UnsupportedEDN for anything else (keywords, symbols, lists,
+    sets, tags, comments, ...), which is left to edn_format.
+    """
+    # Stack of the contents of the maps and vectors being read
+    stack = []
+    position = 0
+
+    while True:
+        match = _edn_token_expression.match(text, position)
+        if match is None:
+            raise _UnsupportedEDN(text[position : position + 20])
+        position = match.end()
+        kind = match.lastgroup
+
+        if kind == "open":
+            stack.append((match.group(kind), []))
+            continue
+        elif kind == "close":
+            if not stack:
+                raise _UnsupportedEDN("Unbalanced brackets")
+            opening, items = stack.pop()
+            if opening == "[" and match.group(kind) == "]":
+                value = items
+            elif opening == "{" and match.group(kind) == "}" and len(items) % 2 == 0:
+                try:
+                    value = dict(zip(items[::2], items[1::2]))
+                except TypeError:
+                    # Unhashable keys
+                    raise _UnsupportedEDN("Map with unhashable keys")
+            else:
+                raise _UnsupportedEDN("Unbalanced brackets")
+        elif kind == "string":
+            value = match.group(kind)[1:-1]
+            if "\\" in value:
+                try:
+                    value = json.loads(match.group(kind), strict=False)
+                except ValueError:
+                    raise _UnsupportedEDN("String escape")
+        elif kind == "number":
+            if match.group("fraction") or match.group("exponent"):
+                value = float(match.group(kind))
+            else:
+                value = int(match.group(kind))
+        elif kind == "constant":
+            value = _edn_constants[match.group(kind)]
+        else:
+            raise _UnsupportedEDN("Unexpected end")
+
+        if not stack:
+            break
+        stack[-1][1].append(value)
+
+    # Only whitespace may follow, as edn_format ignores anything after the first
+    # element
+    trailing = _edn_token_expression.match(text, position)
+    if trailing is None or trailing.lastgroup != "end":
+        raise _UnsupportedEDN("Trailing content")
+    return value
+
+
+def _loads_edn_format(c):
+    """
+    Parse EDN with edn_format.  For whatever, reason, the 'edn_format' module
+    always returns (nested) structures of its own internally defined types,
+    ImmutableList and ImmutableDict.  Since we generally need to take the
+    content we load from an EDN file and do something like json.dumps with it,
+    this presents a problem.  Therefore, we recurse through them, converting
+    all ImmutableList instances to regular python lists and all ImmutableDict
+    instances to regular python dicts.
     """
 
     def convert_immutablelist_to_list(l):
@@ -71,24 +155,53 @@ def loadedn(f):
                     d[key] = convert_immutabledict_to_dict(val)
         return d
 
+    content = edn_format.loads(c, write_ply_tables=False)
+    if isinstance(content, ImmutableList):
+        content = convert_immutablelist_to_list(content)
+    elif isinstance(content, ImmutableDict):
+        content = convert_immutabledict_to_dict(content)
+    return content
+
+
+def loadsedn(c):
+    """
+    Parse a string containing EDN.  Strings that are valid JSON are parsed as
+    such, then the subset of EDN that the pipeline writes is parsed directly
+    into dicts and lists, and only strings using other EDN syntax are parsed by
+    edn_format, which is much slower.
+    """
+    try:
+        return json.loads(c, parse_constant=_reject_constant)
+    except ValueError:
+        pass
+    try:
+        return _loads_simple_edn(c)
+    except _UnsupportedEDN:
+        pass
+    return _loads_edn_format(c)
+
+
+def loadedn(f):
+    """Load a file, filename, or string containing valid EDN into a dict or
+    list (see loadsedn).
+
+    NOTE: This function assumes that the content being loaded is always
+    contained (at least at the uppermost level) in a dict or list, i.e. {}
+    or [] brackets.  If not, we cowardly raise an exception.
+    """
     if isinstance(f, str):
         try:
             # See if this is a file name
             with open(f, encoding="utf-8") as fo:
                 c = fo.read()
-                content = edn_format.loads(c, write_ply_tables=False)
         except IOError:
             # Assume it's a valid EDN-formatted string
-            content = edn_format.loads(f, write_ply_tables=False)
+            c = f
     else:
         c = f.read()
-        content = edn_format.loads(c, write_ply_tables=False)
 
-    if isinstance(content, ImmutableList):
-        content = convert_immutablelist_to_list(content)
-    elif isinstance(content, ImmutableDict):
-        content = convert_immutabledict_to_dict(content)
-    else:
+    content = loadsedn(c)
+    if not isinstance(content, (list, dict)):
         raise cf.PipelineInvalidEDN(
             "Loaded EDN file or object {}, but it is "
             "not a list or dict.  Only lists or dicts are allowed.".format(f)
@@ -97,18 +210,145 @@ def loadedn(f):
     return content
 
 
-def dumpedn(o, f, allow_nils=True):
-    if not allow_nils:
-        o = replace_nones(o)
-    o = jedns(o)
+# Number of characters of EDN collected before they are written out by dumpedn
+EDN_WRITE_BUFFER_SIZE = 1 << 16
+
+_edn_scalar_types = (str, int, float, bool, type(None))
+
+
+def _edn_key(k):
+    """Convert a dict key to a str the way json.dumps does"""
+    if isinstance(k, str):
+        return k
+    if isinstance(k, (float, bool)) or k is None:
+        return _edn_scalar(k, True)
+    if isinstance(k, int):
+        return int.__repr__(k)
+    raise TypeError(
+        "keys must be str, int, float, bool or None, not {}".format(
+            k.__class__.__name__
+        )
+    )
+
+
+def _edn_scalar(o, allow_nils):
+    """Return the EDN (really, JSON) representation of a scalar"""
+    if isinstance(o, str):
+        return json.encoder.encode_basestring_ascii(o)
+    if o is None:
+        return "null" if allow_nils else '""'
+    if o is True:
+        return "true"
+    if o is False:
+        return "false"
+    if isinstance(o, int):
+        return int.__repr__(o)
+    if isinstance(o, float):
+        if o != o:
+            return "NaN"
+        if o == float("inf"):
+            return "Infinity"
+        if o == -float("inf"):
+            return "-Infinity"
+        return float.__repr__(o)
+    raise TypeError(
+        "Object of type {} is not EDN serializable".format(o.__class__.__name__)
+    )
+
+
+def _iteredn(o, allow_nils, indent, level=0):
+    """
+    Yield the pieces of the output of dumpedn for `o`, which are the same as
+    those of json.dumps(o, separators=(" ", " "), indent=indent), with Nones
+    replaced by empty strings unless `allow_nils` is set
+    """
+    if isinstance(o, dict):
+        if not o:
+            yield "{}"
+            return
+        if indent is None:
+            opening, separator, closing = "{", " ", "}"
+        else:
+            inner = "\n" + " " * (indent * (level + 1))
+            opening, separator = "{" + inner, " " + inner
+            closing = "\n" + " " * (indent * level) + "}"
+        yield opening
+        first = True
+        for k, v in o.items():
+            key = json.encoder.encode_basestring_ascii(_edn_key(k)) + " "
+            if first:
+                first = False
+            else:
+                key = separator + key
+            if isinstance(v, _edn_scalar_types):
+                yield key + _edn_scalar(v, allow_nils)
+            else:
+                yield key
+                yield from _iteredn(v, allow_nils, indent, level + 1)
+        yield closing
+
+    elif isinstance(o, (list, tuple)):
+        if not o:
+            yield "[]"
+            return
+        if indent is None:
+            opening, separator, closing = "[", " ", "]"
+        else:
+            inner = "\n" + " " * (indent * (level + 1))
+            opening, separator = "[" + inner, " " + inner
+            closing = "\n" + " " * (indent * level) + "]"
+        if all(isinstance(i, _edn_scalar_types) for i in o):
+            # Arrays of numbers make up most of large results, so write them in
+            # one piece
+            yield opening + separator.join(
+                [_edn_scalar(i, allow_nils) for i in o]
+            ) + closing
+            return
+        yield opening
+        first = True
+        for i in o:
+            if first:
+                first = False
+            else:
+                yield separator
+            if isinstance(i, _edn_scalar_types):
+                yield _edn_scalar(i, allow_nils)
+            else:
+                yield from _iteredn(i, allow_nils, indent, level + 1)
+        yield closing
+
+    else:
+        yield _edn_scalar(o, allow_nils)
+
 
+def _writeedn(o, f, allow_nils, indent):
+    pieces = []
+    size = 0
+    for piece in _iteredn(o, allow_nils, indent):
+        pieces.append(piece)
+        size += len(piece)
+        if size >= EDN_WRITE_BUFFER_SIZE:
+            f.write("".join(pieces))
+            pieces = []
+            size = 0
+    pieces.append("\n")
+    f.write("".join(pieces))
+
+
+def dumpedn(o, f, allow_nils=True, compact=False):
+    """
+    Write `o` as EDN to the file or filename `f`.  The output is written as it
+    is generated rather than being built up in memory first.  Unless
+    `allow_nils` is set, Nones are written as empty strings.  If `compact` is
+    set, the output is written on a single line without indentation, which is
+    meant for files that are only read by programs.
+    """
+    indent = None if compact else 4
     if isinstance(f, str):
         with open(f, "w", encoding="utf-8") as fi:
-            fi.write(o)
-            fi.write("\n")
+            _writeedn(o, fi, allow_nils, indent)
     else:
-        f.write(o)
-        f.write("\n")
+        _writeedn(o, f, allow_nils, indent)
 
 
 def mkdir_ext(p):